@@ -1,7 +1,42 @@
 __version__ = "0.1.0"
 
-from . import fast, enums, evaluate, utils
+from . import (
+    cache,
+    fast,
+    enums,
+    evaluate,
+    indicators,
+    intervals,
+    live,
+    progress,
+    refine,
+    scenarios,
+    trace,
+    tradelog,
+    utils,
+)
 
+from .items import ExitSpec
 from .tester import BackTester
+from .multi import MultiBackTester
+from .portfolio import PortfolioBackTester
 
-__all__ = ["fast", "enums", "evaluate", "utils", "BackTester"]
+__all__ = [
+    "cache",
+    "fast",
+    "enums",
+    "evaluate",
+    "indicators",
+    "intervals",
+    "live",
+    "progress",
+    "refine",
+    "scenarios",
+    "trace",
+    "tradelog",
+    "utils",
+    "ExitSpec",
+    "BackTester",
+    "MultiBackTester",
+    "PortfolioBackTester",
+]
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from .refine import FIRST_EXIT, FineBars, first_touch
+
+
+class Bars:
+    """バー（OHLCVなど）のカラム指向ストア。
+
+    ``Order``・``Position``はバーそのものではなくバー番号を保持し、時刻・価格・手数料
+    はここから遅延参照する。``bars[i]``で従来通りdictとしても取得できる（直近1件のみ
+    キャッシュ）。
+    """
+
+    def __init__(self, df: pd.DataFrame, fine: FineBars = None):
+        """
+        :param df: "timestamp"カラムを持ち、時刻順にソート済みのDataFrame
+        :param fine: 足内の約定順序の判定に使う細かい足（``refine``参照）
+        """
+        assert "timestamp" in df.columns
+        assert pd.api.types.is_datetime64_any_dtype(df["timestamp"])
+
+        self._df = df
+        self._keys = list(df.columns)
+        self._columns = {k: df[k].tolist() for k in self._keys}
+        self._n = len(df)
+        self._arrays = {}
+        self._row_i, self._row = None, None
+
+        self._fine = fine
+        self._fine_bounds = None
+        if fine is not None:
+            self._fine_bounds = fine.bounds(
+                df["timestamp"].values.astype("datetime64[ns]").view(np.int64)
+            )
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += self._n
+
+        if i != self._row_i:
+            if not 0 <= i < self._n:
+                raise IndexError(f"Bar index out of range: {i}")
+            self._row = {k: self._columns[k][i] for k in self._keys}
+            self._row_i = i
+
+        return self._row
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __getstate__(self):
+        # pickle時はDataFrame（numpy配列）のみを保存する
+        return {"df": self.df, "fine": self._fine}
+
+    def __setstate__(self, state):
+        self.__init__(state["df"], state["fine"])
+
+    def timestamp(self, i: int) -> pd.Timestamp:
+        return self._columns["timestamp"][i]
+
+    def value(self, key: str, i: int):
+        return self._columns[key][i]
+
+    def get(self, key: str, i: int, default=None):
+        column = self._columns.get(key)
+        return default if column is None else column[i]
+
+    def exit_first(
+        self, i: int, side: int, exit_price: float, losscut_price: float
+    ) -> bool:
+        """バー``i``でエグジット指値がロスカットより先に約定したか（細かい足で判定）。
+
+        細かい足が与えられていない場合は常にFalse（ロスカット優先）。
+
+        :param side: ポジションの向き。1 ("BUY") or -1 ("SELL")
+        """
+        if self._fine is None:
+            return False
+
+        return (
+            first_touch(
+                self._fine.high,
+                self._fine.low,
+                self._fine_bounds[i],
+                self._fine_bounds[i + 1],
+                side,
+                exit_price,
+                losscut_price,
+                False,
+            )
+            == FIRST_EXIT
+        )
+
+    def append(self, item: dict) -> int:
+        """バーを1本追加し、そのバー番号を返す（ライブ実行用）。
+
+        ``df``・``array``は次に参照された時に作り直す。細かい足には対応しない。
+
+        :param item: 既存のバーと同じキーを持つdict。"timestamp"は直前のバーより後
+        """
+        assert self._fine is None, "Fine bars are not supported"
+        assert set(item.keys()) == set(self._keys), f"Keys mismatch: {list(item)}"
+        assert self._n == 0 or item["timestamp"] > self.timestamp(-1)
+
+        for k in self._keys:
+            self._columns[k].append(item[k])
+        self._n += 1
+        self._df = None
+        self._arrays = {}
+
+        return self._n - 1
+
+    def column(self, key: str) -> list:
+        return self._columns[key]
+
+    def array(self, key: str) -> np.ndarray:
+        if key not in self._arrays:
+            self._arrays[key] = self.df[key].values
+        return self._arrays[key]
+
+    @property
+    def keys(self) -> list[str]:
+        return self._keys
+
+    @property
+    def fine(self) -> FineBars:
+        return self._fine
+
+    @property
+    def df(self) -> pd.DataFrame:
+        if self._df is None:
+            self._df = pd.DataFrame(self._columns, columns=self._keys)
+        return self._df
+
+
+class BarRows:
+    """``Bars``の一部のバーのみを持つもの。
+
+    終了した注文は以後参照するバーが決まっているため、pickleする際に``Bars``の代わりに
+    それらのバーのみを持たせる（注文ごとにデータ全体をpickleしない）。
+    """
+
+    def __init__(self, bars: Bars, indices):
+        self._rows = {i: dict(bars[i]) for i in indices if i is not None}
+
+    def __getitem__(self, i: int) -> dict:
+        return self._rows[i]
+
+    def __contains__(self, key):
+        return any(key in row for row in self._rows.values())
+
+    def timestamp(self, i: int) -> pd.Timestamp:
+        return self._rows[i]["timestamp"]
+
+    def value(self, key: str, i: int):
+        return self._rows[i][key]
+
+    def get(self, key: str, i: int, default=None):
+        return self._rows[i].get(key, default)
@@ -0,0 +1,228 @@
+"""バックテスト結果のディスクキャッシュ。
+
+入力の配列・パラメーター・パッケージのバージョン・ソースコードのハッシュをキーとし
+て、結果を``<key>.npz``に保存する（バージョンを上げずにシミュレーションの実装を変更し
+た場合も古い結果を使わない）。合計サイズが``max_bytes``を超えたら、最後に参照された時刻
+（ファイルのmtime）が古いものから削除する（LRU）。
+
+>>> cache = ResultCache("~/.cache/botbacktester")
+>>> df_result = limit_simulation(df, 1, cache=cache)  # 2回目以降は計算しない
+>>> cache.stats()
+
+``BackTester``などの任意の計算は``get_or_run``で包む。
+
+>>> key = cache.key("atr_strategy", df, {"alpha": 0.5})
+>>> df_result = cache.get_or_run(key, lambda: run_atr_strategy(df, alpha=0.5))
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import io
+import json
+import os
+from typing import Callable, Union
+
+import numpy as np
+import pandas as pd
+
+from . import __version__
+from .refine import FineBars
+from .utils import debug_log
+
+FORMAT_VERSION = 1
+
+# DataFrameを保存する際のメタデータのキー
+_META_KEY = "__meta__"
+
+
+class ResultCache:
+    """``dict[str, np.ndarray]``または``pd.DataFrame``の結果のキャッシュ。"""
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        """
+        :param directory: 保存先（なければ作る）
+        :param max_bytes: 保存するファイルの合計サイズの上限
+        """
+        self._directory = os.path.expanduser(directory)
+        self._max_bytes = max_bytes
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(self._directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        """``parts``（配列・DataFrame・スカラー・dict・list等）とバージョンのハッシュ。"""
+        h = hashlib.sha256()
+        _update(h, (__version__, FORMAT_VERSION, _source_hash()))
+        _update(h, parts)
+        return h.hexdigest()
+
+    def get(self, key: str) -> Union[dict, pd.DataFrame, None]:
+        """キャッシュされた結果。ない場合はNone。"""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=True) as npz:
+                arrays = {k: npz[k] for k in npz.files}
+        except FileNotFoundError:
+            self._misses += 1
+            debug_log("CACHE MISS", key)
+            return None
+
+        # 参照された時刻をmtimeに記録する（LRUの順序）
+        os.utime(path)
+        self._hits += 1
+        debug_log("CACHE HIT", key)
+
+        if _META_KEY in arrays:
+            return _from_arrays(arrays)
+        return arrays
+
+    def put(self, key: str, result: Union[dict, pd.DataFrame]):
+        """結果を保存する。書き込みは一時ファイル経由でアトミックに行う。"""
+        if isinstance(result, pd.DataFrame):
+            arrays = _to_arrays(result)
+        else:
+            arrays = {k: np.asarray(v) for (k, v) in result.items()}
+
+        buf = io.BytesIO()
+        np.savez(buf, **arrays)
+
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buf.getbuffer())
+        os.replace(tmp_path, path)
+
+        self._evict()
+
+    def get_or_run(self, key: str, fn: Callable[[], Union[dict, pd.DataFrame]]):
+        """キャッシュがあればそれを、なければ``fn()``を実行して保存した結果を返す。"""
+        result = self.get(key)
+        if result is None:
+            result = fn()
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        for path in self._files():
+            os.remove(path)
+
+    def stats(self) -> dict:
+        files = self._files()
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "entries": len(files),
+            "bytes": sum([os.path.getsize(f) for f in files]),
+        }
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def _path(self, key):
+        return os.path.join(self._directory, f"{key}.npz")
+
+    def _files(self):
+        return glob.glob(os.path.join(self._directory, "*.npz"))
+
+    def _evict(self):
+        files = [(os.stat(f), f) for f in self._files()]
+        total = sum([s.st_size for (s, _) in files])
+        for s, f in sorted(files, key=lambda x: x[0].st_mtime_ns):
+            if total <= self._max_bytes:
+                break
+            os.remove(f)
+            total -= s.st_size
+            debug_log("CACHE EVICT", f)
+
+
+_SOURCE_HASH = None
+
+
+def _source_hash() -> str:
+    # パッケージのソースコード（``fast/tester.py``のカーネルや``BackTester``）のハッシュ。
+    # 実行中に変わらないため1回だけ計算する
+    global _SOURCE_HASH
+    if _SOURCE_HASH is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(root, "**", "*.py"), recursive=True)):
+            h.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+        _SOURCE_HASH = h.hexdigest()
+    return _SOURCE_HASH
+
+
+def _update(h, obj):
+    # ``obj``の型と内容をハッシュに加える
+    h.update(type(obj).__name__.encode())
+
+    if isinstance(obj, np.ndarray):
+        h.update(f"{obj.dtype.str}{obj.shape}".encode())
+        if obj.dtype == object:
+            h.update(repr(obj.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(obj).reshape(-1).view(np.uint8))
+    elif isinstance(obj, pd.DataFrame):
+        _update(h, obj.index)
+        for c in obj.columns:
+            _update(h, c)
+            _update(h, obj[c])
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        h.update(str(obj.dtype).encode())
+        _update(h, obj.name)
+        _update(h, obj.to_numpy())
+    elif isinstance(obj, FineBars):
+        _update(h, (obj.timestamps, obj.high, obj.low))
+    elif isinstance(obj, dict):
+        for k in sorted(obj.keys(), key=repr):
+            _update(h, k)
+            _update(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(str(len(obj)).encode())
+        for v in obj:
+            _update(h, v)
+    else:
+        h.update(repr(obj).encode())
+
+
+def _to_arrays(df: pd.DataFrame) -> dict:
+    # DataFrameをカラムごとの配列にする。tz付きの時刻はUTCのdatetime64とtzに分ける。
+    arrays, meta = {}, {"index": df.index.name, "columns": [], "tz": {}}
+
+    for k, (name, s) in enumerate([(df.index.name, df.index), *df.items()]):
+        tz = getattr(s.dtype, "tz", None)
+        if tz is not None:
+            s = pd.DatetimeIndex(s).tz_convert("UTC").tz_localize(None)
+            meta["tz"][str(k)] = str(tz)
+        arrays[f"c{k}"] = s.to_numpy()
+        if k > 0:
+            meta["columns"].append(name)
+
+    arrays[_META_KEY] = np.array(json.dumps(meta))
+    return arrays
+
+
+def _from_arrays(arrays: dict) -> pd.DataFrame:
+    meta = json.loads(str(arrays[_META_KEY]))
+
+    def _restore(k):
+        v = arrays[f"c{k}"]
+        tz = meta["tz"].get(str(k))
+        if tz is not None:
+            return pd.DatetimeIndex(v).tz_localize("UTC").tz_convert(tz)
+        return v
+
+    index = pd.Index(_restore(0), name=meta["index"])
+    return pd.DataFrame(
+        {c: _restore(k + 1) for (k, c) in enumerate(meta["columns"])}, index=index
+    )
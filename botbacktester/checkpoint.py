@@ -0,0 +1,203 @@
+"""``BackTester``のチェックポイントの保存・読み込み。
+
+状態はpickle（最新プロトコル）で保存する。バーのデータ（``Bars``）は保存せず、読み込
+み時に読み込み側の``Bars``を参照させる（注文・ポジションはバー番号のみ保持している
+ため。終了した注文は参照するバーのみを``BarRows``として持つ）。``CloseOrder``に与えた関数もpickleされるので、lambdaではなくモジュールレベ
+ルの関数である必要がある。
+
+同じファイルへのチェックポイントは追記する。1回のチェックポイントは1つのレコード（pickle）
+で、前回のチェックポイントから確定した（以後変化しない）注文・ポジションと、未確定の注
+文・``Status``などのみを含む。確定済みの注文・ポジションは前のレコードへの参照
+（``persistent_id``）とするため、1回のコストは履歴全体ではなく確定した件数・未確定の
+件数に比例する。読み込み時は全てのレコードを順に読み、最後のレコードの状態とする（書き
+込み途中で終了した末尾のレコードは無視する）。
+
+各レコードは長さとCRC32のヘッダー（``_HEADER``）の後にpickleを置く。読み込み時に長さ
+に満たない・CRCが一致しない末尾のレコードのみを書き込み途中とみなし、それ以外の読み
+込みエラー（途中のレコードの破損・未知の参照）は例外とする。
+"""
+
+import io
+import os
+import pickle
+import struct
+import zlib
+
+from .bars import Bars
+
+FORMAT_VERSION = 3
+
+# レコードのヘッダー（pickleの長さ、CRC32）
+_HEADER = struct.Struct("<QI")
+
+_BARS_ID = "bars"
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, bars: Bars, persisted: dict):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._bars = bars
+        self._persisted = persisted
+
+    def persistent_id(self, obj):
+        if obj is self._bars:
+            return _BARS_ID
+        # 前のレコードで保存した確定済みの注文・ポジション
+        return self._persisted.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, bars: Bars, persisted: dict):
+        super().__init__(file)
+        self._bars = bars
+        self._persisted = persisted
+
+    def persistent_load(self, pid):
+        if pid == _BARS_ID:
+            return self._bars
+        if pid in self._persisted:
+            return self._persisted[pid]
+        raise pickle.UnpicklingError(f"Unsupported persistent id: {pid}")
+
+
+class Writer:
+    """``path``にチェックポイントを追記する。``BackTester.checkpoint``が使う。"""
+
+    def __init__(self, path: str, bars: Bars):
+        self.path = path
+        self._bars = bars
+        # 保存済みの確定した注文・ポジション（``id(obj)``→レコード間の参照）
+        self._persisted = {}
+        # 未確定の注文の``order_history``での添字
+        self._pending = []
+        self._order_num = 0
+        self._position_num = 0
+        # 最後のレコードの終端
+        self._offset = 0
+
+    def dump(self, state: dict, order_history: list, position_history: list):
+        """``state``と、前回からの注文・ポジション履歴の差分を追記する。"""
+        candidates = self._pending + list(range(self._order_num, len(order_history)))
+        resolved, pending = [], []
+        for k in candidates:
+            if _is_resolved(order_history[k]):
+                resolved.append(k)
+            else:
+                pending.append(k)
+
+        n = self._position_num
+        positions = position_history[n:]
+        buf = io.BytesIO()
+        _Pickler(buf, self._bars, self._persisted).dump(
+            {
+                "version": FORMAT_VERSION,
+                "bar_num": len(self._bars),
+                "state": state,
+                "order_num": len(order_history),
+                "resolved_orders": [(k, order_history[k]) for k in resolved],
+                "pending_orders": [(k, order_history[k]) for k in pending],
+                "positions": positions,
+            }
+        )
+
+        payload = buf.getbuffer()
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        if self._offset == 0:
+            # 新しいファイルは一時ファイル経由でアトミックに書く
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(record)
+                _sync(f)
+            os.replace(tmp_path, self.path)
+            self._offset = len(record)
+        else:
+            # 前のレコードの後ろにのみ書く。書き込み途中で終了した場合も、前のレコード
+            # までは読める（末尾の書きかけのレコードは次の書き込みで上書きする）
+            with open(self.path, "r+b") as f:
+                f.seek(self._offset)
+                f.write(record)
+                _sync(f)
+                f.truncate()
+                self._offset = f.tell()
+
+        for k in resolved:
+            self._persisted[id(order_history[k])] = ("order", k)
+        for k, p in enumerate(positions, n):
+            self._persisted[id(p)] = ("position", k)
+        self._pending = pending
+        self._order_num = len(order_history)
+        self._position_num = len(position_history)
+
+
+def load(path: str, bars: Bars) -> tuple[dict, Writer]:
+    """``path``の最後の状態と、同じファイルに続けて追記する``Writer``を返す。
+
+    状態の"order_history"・"position_history"は全てのレコードから復元した履歴。
+    """
+    persisted, orders, positions = {}, {}, []
+    data, offset = None, 0
+    with open(path, "rb") as f:
+        while True:
+            payload = _read_record(f)
+            if payload is None:
+                break
+            record = _Unpickler(io.BytesIO(payload), bars, persisted).load()
+
+            assert (
+                record["version"] == FORMAT_VERSION
+            ), f"Unsupported checkpoint version: {record['version']}"
+
+            for k, o in record["resolved_orders"]:
+                persisted[("order", k)] = o
+                orders[k] = o
+            for p in record["positions"]:
+                persisted[("position", len(positions))] = p
+                positions.append(p)
+            data, offset = record, f.tell()
+
+    assert data is not None, f"Checkpoint not found: {path}"
+    assert data["bar_num"] <= len(bars), "Checkpoint has more bars than the data"
+
+    orders.update(data["pending_orders"])
+    state = dict(data["state"])
+    state["order_history"] = [orders[k] for k in range(data["order_num"])]
+    state["position_history"] = positions
+
+    writer = Writer(path, bars)
+    writer._persisted = {id(o): k for (k, o) in persisted.items()}
+    writer._pending = [k for (k, _) in data["pending_orders"]]
+    writer._order_num = data["order_num"]
+    writer._position_num = len(positions)
+    writer._offset = offset
+    return state, writer
+
+
+def _read_record(f):
+    # 次のレコードのpickle。ファイルの終端・書き込み途中の末尾のレコードの場合はNone
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    size, crc = _HEADER.unpack(header)
+    payload = f.read(size)
+    if len(payload) < size:
+        return None
+    if zlib.crc32(payload) != crc:
+        # 末尾のレコードはデータが書き込まれる前に終了した場合もある
+        if f.read(1) == b"":
+            return None
+        raise pickle.UnpicklingError(f"Corrupted checkpoint record at {f.tell()}")
+    return payload
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _is_resolved(o) -> bool:
+    # 終了した注文は以後変化しない。ただし決済注文は参照しているポジションが決済済みの
+    # 場合のみ（取り消し・失効した決済注文のポジションは保有中の場合がある）
+    if not o.is_done:
+        return False
+    position = getattr(o, "position", None)
+    return position is None or position.is_closed
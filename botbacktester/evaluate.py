@@ -20,6 +20,77 @@ def drawdown(df, name="drawdown"):
     return s
 
 
+def equity_curve(result, bars, side=None) -> pd.DataFrame:
+    """バーごとの時価評価の損益曲線。
+
+    ``drawdown``は決済済みの``gain``のみを見るため、保有中の含み損が現れない。ここでは
+    各ポジションの約定・決済のバー番号に差分配列を置き、累積和でバーごとの確定損益・含
+    み損益・保有数を求める（バー数 + トレード数に比例する計算量）。損益は``gain``と同じ
+    単位（価格の変化率）で、含み損益は各バーの終値で評価する（手数料は含まない）。
+
+    :param result: ``BackTester``、``get_result_df()``の結果、または
+        ``fast.limit_simulation``の結果（"frame" or "arrays"）
+    :param bars: ``result``を得たohlcv（indexは"timestamp"、"close"カラムが必要）
+    :param side: ``limit_simulation``の結果の場合に必須。1 ("BUY") or -1 ("SELL")
+    :return: ``bars``と同じindexで、以下のカラムを持つDataFrame
+
+    - realized: 確定損益の累計（決済したバーで計上）
+    - unrealized: 保有中のポジションの含み損益
+    - equity: realized + unrealized
+    - exposure: 保有中のポジション数
+    - net_exposure: 買いポジション数 - 売りポジション数
+    - drawdown: equityの最大値からの下落（0以下）
+    """
+    assert "close" in bars.columns
+    assert isinstance(bars.index, pd.DatetimeIndex)
+
+    if hasattr(result, "get_result_df"):
+        result = result.get_result_df()
+    entry_at, exit_at, entry_price, sign, gain = _trades(result, side)
+
+    timestamps = _to_unix_nano(bars.index)
+    assert np.all(np.diff(timestamps) > 0), "``bars`` must be sorted"
+    n = len(timestamps)
+
+    a = _bar_index(timestamps, entry_at)
+    # 未決済（データの終端で決済されていない）のポジションは最後のバーまで保有する
+    has_exit = exit_at != NAT
+    b = np.where(
+        has_exit, _bar_index(timestamps, np.where(has_exit, exit_at, entry_at)), n
+    )
+
+    # [a, b)の区間に加算する差分配列。含み損益は
+    # sum(sign * (close / entry_price - 1))
+    #   = close * sum(sign / entry_price) - sum(sign)
+    # なので、係数の和を区間ごとに持てばよい
+    def _range_sum(values):
+        d = np.zeros(n + 1)
+        np.add.at(d, a, values)
+        np.add.at(d, b, -values)
+        return np.cumsum(d[:n])
+
+    close = bars["close"].to_numpy(dtype=np.float64)
+    unrealized = close * _range_sum(sign / entry_price) - _range_sum(sign)
+
+    d = np.zeros(n + 1)
+    np.add.at(d, b, np.where(has_exit, gain, 0))
+    realized = np.cumsum(d[:n])
+
+    equity = realized + unrealized
+
+    return pd.DataFrame(
+        {
+            "realized": realized,
+            "unrealized": unrealized,
+            "equity": equity,
+            "exposure": _range_sum(np.ones(len(a))).round().astype(np.int64),
+            "net_exposure": _range_sum(sign).round().astype(np.int64),
+            "drawdown": equity - np.maximum.accumulate(equity),
+        },
+        index=bars.index,
+    )
+
+
 def win_ratio(df, n=100, name="win_ratio"):
     assert "gain" in df.columns
     s = (df.gain > 0).rolling(n).mean()
@@ -130,6 +201,46 @@ def evaluation_set1(
         ax_.grid()
 
 
+# ``fast.limit_simulation``の"arrays"の欠損値
+NAT = np.iinfo(np.int64).min
+
+
+def _trades(result, side):
+    # 約定したトレードの(約定時刻, 決済時刻, 約定価格, 符号, 確定損益)
+    if isinstance(result, pd.DataFrame) and "oo_executed_at" in result.columns:
+        entry_at = _to_unix_nano(result.oo_executed_at)
+        exit_at = _to_unix_nano(result.co_executed_at)
+        entry_price = result.oo_price.to_numpy(dtype=np.float64)
+        sign = np.where(result.side == "BUY", 1.0, -1.0)
+        gain = result.gain.to_numpy(dtype=np.float64)
+        valid = entry_at != NAT
+    else:
+        assert side in [1, -1], "``side`` is required for limit_simulation results"
+        if isinstance(result, pd.DataFrame):
+            entry_at = _to_unix_nano(result.entry_at)
+            exit_at = _to_unix_nano(result.exit_at)
+        else:
+            entry_at, exit_at = result["entry_at"], result["exit_at"]
+        entry_price = np.asarray(result["entry_price"], dtype=np.float64)
+        gain = np.asarray(result["profit"], dtype=np.float64)
+        valid = entry_at != NAT
+        sign = np.full(len(entry_at), float(side))
+
+    return entry_at[valid], exit_at[valid], entry_price[valid], sign[valid], gain[valid]
+
+
+def _to_unix_nano(values) -> np.ndarray:
+    # tz付きの場合もUTCのunix nano秒。欠損はNAT
+    return pd.DatetimeIndex(values).values.astype("datetime64[ns]").view(np.int64)
+
+
+def _bar_index(timestamps, values):
+    i = np.searchsorted(timestamps, values)
+    assert np.all(i < len(timestamps)), "Timestamps not found in ``bars``"
+    assert np.all(timestamps[i] == values), "Timestamps not found in ``bars``"
+    return i
+
+
 def sampling_ptest(series, fn, ttest_popmean, sampling_num=30, sampling_ratio=0.5):
     sample_num = int(len(series) * sampling_ratio)
 
@@ -1,4 +1,14 @@
-from .tester import limit_simulation
+from . import engine, stats
+from .engine import run_strategy
+from .stats import window_stats
+from .tester import limit_simulation, limit_simulation_multi
 
 
-__all__ = ["limit_simulation"]
+__all__ = [
+    "engine",
+    "stats",
+    "run_strategy",
+    "window_stats",
+    "limit_simulation",
+    "limit_simulation_multi",
+]
@@ -0,0 +1,583 @@
+"""numbaでコンパイルした戦略を、バーのループごとnopythonモードで実行するエンジン。
+
+``BackTester``と同じ約定ルール（新規・決済注文のLIMIT/MARKET/STOP、失効、ロスカッ
+ト、終了時の決済）を、注文・ポジションをレコード配列で持つ形で再実装している。戦略は
+``numba.njit``した関数で、各バーで注文の評価の後に呼ばれ、注文の指示（``instructions``）
+を返す。
+
+>>> @numba.njit
+... def strategy(i, timestamps, data, orders, positions, state):
+...     out = instructions(len(positions) + 1)
+...     n = 0
+...     if len(orders) == 0 and len(positions) == 0:
+...         n = set_entry(out, n, BUY, LIMIT, data[i, 0] - 1000, 60)
+...     for p in range(len(positions)):
+...         if positions[p].closing == -1:
+...             n = set_exit(out, n, p, LIMIT, data[i, 0] + 1000)
+...     return out[:n]
+>>> df_result = run_strategy(df, strategy, columns=["close"])
+
+Pythonの戦略は従来通り``BackTester.start()``で実行する。手数料（"maker_fee"・
+"taker_fee"）と``CloseOrder``の指値の更新・成行決済の判定器には対応していない。
+"""
+
+from typing import Callable, Optional, Sequence
+
+import numba
+import numpy as np
+import pandas as pd
+
+from ..enums import ExecutionType, OrderStatus, Side
+from ..utils import DEFAULT_EXPIRE_SECONDS
+
+BUY = 1
+SELL = -1
+
+MARKET = ExecutionType.MARKET.value
+LIMIT = ExecutionType.LIMIT.value
+STOP = ExecutionType.STOP.value
+
+ORDERING = OrderStatus.ORDERING.value
+EXECUTED = OrderStatus.EXECUTED.value
+EXPIRED = OrderStatus.EXPIRED.value
+CANCELED = OrderStatus.CANCELED.value
+EXPIRED_EXECUTED = OrderStatus.EXPIRED_EXECUTED.value
+LOSSCUT = OrderStatus.LOSSCUT.value
+
+OPEN = 1
+CLOSE = -1
+
+# 指示の種類（``instructions``の0列目）
+ENTRY = 1
+EXIT = 2
+CANCEL = 3
+
+# 指示の列: (種類, side・ポジション番号・注文番号, exec_type, price, expire_seconds,
+# losscut_price, market_slippage)
+INSTRUCTION_WIDTH = 7
+
+# 注文（``orders``）。``position``は決済注文の対象のポジション番号。
+ORDER_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("settle", np.int8),
+        ("side", np.int8),
+        ("exec_type", np.int8),
+        ("status", np.int8),
+        ("price", np.float64),
+        ("losscut_price", np.float64),
+        ("market_slippage", np.float64),
+        ("entry_at", np.int64),
+        ("expire_at", np.int64),
+        ("position", np.int64),
+    ]
+)
+
+# ポジション（``positions``）。``closing``は決済注文の注文番号（ない場合は-1）。
+POSITION_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("side", np.int8),
+        ("open_exec_type", np.int8),
+        ("open_price", np.float64),
+        ("open_entry_at", np.int64),
+        ("open_at", np.int64),
+        ("closing", np.int64),
+        ("closed", np.bool_),
+        ("close_exec_type", np.int8),
+        ("close_status", np.int8),
+        ("close_price", np.float64),
+        ("close_entry_at", np.int64),
+        ("close_at", np.int64),
+    ]
+)
+
+# 決済済みのポジション（結果）
+TRADE_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("side", np.int8),
+        ("open_exec_type", np.int8),
+        ("open_price", np.float64),
+        ("open_entry_at", np.int64),
+        ("open_at", np.int64),
+        ("close_exec_type", np.int8),
+        ("close_status", np.int8),
+        ("close_price", np.float64),
+        ("close_entry_at", np.int64),
+        ("close_at", np.int64),
+        ("gain", np.float64),
+    ]
+)
+
+
+@numba.jit(nopython=True)
+def instructions(n):
+    """最大``n``件の指示のバッファ。``set_*``で埋め、使った分（``out[:n]``）を返す。"""
+    return np.zeros((n, INSTRUCTION_WIDTH))
+
+
+@numba.jit(nopython=True)
+def set_entry(
+    out,
+    n,
+    side,
+    exec_type,
+    price=-1.0,
+    expire_seconds=DEFAULT_EXPIRE_SECONDS,
+    market_slippage=0.0,
+):
+    """``n``行目に新規注文の指示を書き、次の行番号を返す（``BackTester.entry``）。"""
+    assert n < len(out), "Too many instructions"
+    out[n, 0] = ENTRY
+    out[n, 1] = side
+    out[n, 2] = exec_type
+    out[n, 3] = price
+    out[n, 4] = expire_seconds
+    out[n, 5] = -1.0
+    out[n, 6] = market_slippage
+    return n + 1
+
+
+@numba.jit(nopython=True)
+def set_exit(
+    out,
+    n,
+    position,
+    exec_type,
+    price=-1.0,
+    expire_seconds=DEFAULT_EXPIRE_SECONDS,
+    losscut_price=-1.0,
+    market_slippage=0.0,
+):
+    """ポジション番号``position``の決済注文の指示（``BackTester.exit``）。"""
+    assert n < len(out), "Too many instructions"
+    out[n, 0] = EXIT
+    out[n, 1] = position
+    out[n, 2] = exec_type
+    out[n, 3] = price
+    out[n, 4] = expire_seconds
+    out[n, 5] = losscut_price
+    out[n, 6] = market_slippage
+    return n + 1
+
+
+@numba.jit(nopython=True)
+def set_cancel(out, n, order):
+    """注文番号``order``の取り消しの指示。"""
+    assert n < len(out), "Too many instructions"
+    out[n, 0] = CANCEL
+    out[n, 1] = order
+    return n + 1
+
+
+@numba.jit(nopython=True)
+def _expire_ns(expire_seconds):
+    # ``timedelta(seconds=...)``と同じくマイクロ秒に丸める
+    if expire_seconds == np.inf:
+        return np.iinfo(np.int64).max
+    return np.int64(round(expire_seconds * 1e6)) * 1000
+
+
+@numba.jit(nopython=True)
+def _market_price(side, price, market_slippage):
+    return price + market_slippage if side == BUY else price - market_slippage
+
+
+@numba.jit(nopython=True)
+def _check_execution(exec_type, side, price, high, low):
+    if exec_type == MARKET:
+        return True
+    elif exec_type == LIMIT:
+        return low <= price if side == BUY else high >= price
+    else:
+        return high >= price if side == BUY else low <= price
+
+
+@numba.jit(nopython=True)
+def _close_position(positions, p, exec_type, status, price, entry_at, close_at):
+    positions[p].closed = True
+    positions[p].closing = -1
+    positions[p].close_exec_type = exec_type
+    positions[p].close_status = status
+    positions[p].close_price = price
+    positions[p].close_entry_at = entry_at
+    positions[p].close_at = close_at
+
+
+@numba.jit(nopython=True)
+def _step_orders(
+    i, timestamps, open_, high, low, orders, n_orders, positions, n_positions, ids
+):
+    # ``Order._on_step``。約定した新規注文のポジションを追加し、ポジション数を返す。
+    ts = timestamps[i]
+
+    for k in range(n_orders):
+        if orders[k].status != ORDERING:
+            continue
+
+        side = orders[k].side
+
+        if orders[k].settle == OPEN:
+            if _check_execution(
+                orders[k].exec_type, side, orders[k].price, high[i], low[i]
+            ):
+                if orders[k].exec_type == MARKET:
+                    orders[k].price = _market_price(
+                        side, open_[i], orders[k].market_slippage
+                    )
+                orders[k].status = EXECUTED
+
+                assert n_positions < len(positions), "Too many positions"
+                p = n_positions
+                positions[p].id = ids[1]
+                positions[p].side = side
+                positions[p].open_exec_type = orders[k].exec_type
+                positions[p].open_price = orders[k].price
+                positions[p].open_entry_at = orders[k].entry_at
+                positions[p].open_at = ts
+                positions[p].closing = -1
+                positions[p].closed = False
+                ids[1] += 1
+                n_positions += 1
+
+            elif ts >= orders[k].expire_at:
+                orders[k].status = EXPIRED
+
+        else:
+            p = orders[k].position
+
+            # ロスカット（約定価格は足の高値・安値）
+            losscut_price = orders[k].losscut_price
+            if losscut_price > 0 and (
+                (side == BUY and high[i] >= losscut_price)
+                or (side == SELL and low[i] <= losscut_price)
+            ):
+                price = high[i] if side == BUY else low[i]
+                orders[k].price = _market_price(side, price, orders[k].market_slippage)
+                orders[k].exec_type = MARKET
+                orders[k].status = LOSSCUT
+                _close_position(
+                    positions,
+                    p,
+                    MARKET,
+                    LOSSCUT,
+                    orders[k].price,
+                    orders[k].entry_at,
+                    ts,
+                )
+                continue
+
+            if ts < orders[k].entry_at:
+                continue
+
+            if _check_execution(
+                orders[k].exec_type, side, orders[k].price, high[i], low[i]
+            ):
+                if orders[k].exec_type == MARKET:
+                    orders[k].price = _market_price(
+                        side, open_[i], orders[k].market_slippage
+                    )
+                orders[k].status = EXECUTED
+                _close_position(
+                    positions,
+                    p,
+                    orders[k].exec_type,
+                    EXECUTED,
+                    orders[k].price,
+                    orders[k].entry_at,
+                    ts,
+                )
+
+            elif ts >= orders[k].expire_at:
+                orders[k].status = EXPIRED
+                positions[p].closing = -1
+
+    return n_positions
+
+
+@numba.jit(nopython=True)
+def _update_status(orders, n_orders, positions, n_positions, trades, n_trades):
+    # ``Status.clear_done_orders``・``clear_closed_positions``。配列を前に詰め、決済済
+    # みのポジションを``trades``に移す。
+    position_map = np.full(max(n_positions, 1), -1)
+    m = 0
+    for p in range(n_positions):
+        if positions[p].closed:
+            if n_trades == len(trades):
+                trades = _grow(trades)
+            _to_trade(positions[p], trades, n_trades)
+            n_trades += 1
+        else:
+            position_map[p] = m
+            positions[m] = positions[p]
+            m += 1
+    n_positions = m
+
+    order_map = np.full(max(n_orders, 1), -1)
+    m = 0
+    for k in range(n_orders):
+        if orders[k].status == ORDERING:
+            order_map[k] = m
+            orders[m] = orders[k]
+            if orders[m].settle == CLOSE:
+                orders[m].position = position_map[orders[m].position]
+            m += 1
+    n_orders = m
+
+    for p in range(n_positions):
+        if positions[p].closing != -1:
+            positions[p].closing = order_map[positions[p].closing]
+
+    return n_orders, n_positions, trades, n_trades
+
+
+@numba.jit(nopython=True)
+def _grow(trades):
+    rtn = np.zeros(len(trades) * 2, dtype=trades.dtype)
+    rtn[: len(trades)] = trades
+    return rtn
+
+
+@numba.jit(nopython=True)
+def _to_trade(position, trades, n):
+    trades[n].id = position.id
+    trades[n].side = position.side
+    trades[n].open_exec_type = position.open_exec_type
+    trades[n].open_price = position.open_price
+    trades[n].open_entry_at = position.open_entry_at
+    trades[n].open_at = position.open_at
+    trades[n].close_exec_type = position.close_exec_type
+    trades[n].close_status = position.close_status
+    trades[n].close_price = position.close_price
+    trades[n].close_entry_at = position.close_entry_at
+    trades[n].close_at = position.close_at
+
+    gain = position.close_price / position.open_price - 1
+    if position.side == SELL:
+        gain = gain * -1
+    trades[n].gain = gain
+
+
+@numba.jit(nopython=True)
+def _apply(i, timestamps, out, orders, n_orders, positions, n_positions, ids):
+    # 戦略が返した指示を順に処理し、注文数を返す
+    ts = timestamps[i]
+
+    for r in range(len(out)):
+        kind = out[r, 0]
+
+        if kind == CANCEL:
+            k = int(out[r, 1])
+            assert 0 <= k < n_orders, "Invalid order"
+            if orders[k].status == ORDERING:
+                orders[k].status = CANCELED
+                if orders[k].settle == CLOSE:
+                    positions[orders[k].position].closing = -1
+            continue
+
+        assert n_orders < len(orders), "Too many orders"
+        k = n_orders
+
+        if kind == ENTRY:
+            side = int(out[r, 1])
+            assert side == BUY or side == SELL, "Invalid side"
+            orders[k].settle = OPEN
+            orders[k].position = -1
+        elif kind == EXIT:
+            p = int(out[r, 1])
+            assert 0 <= p < n_positions, "Invalid position"
+            assert positions[p].closing == -1, "Position is already closing"
+            side = -positions[p].side
+            orders[k].settle = CLOSE
+            orders[k].position = p
+            positions[p].closing = k
+        else:
+            raise ValueError("Unsupported instruction")
+
+        exec_type = int(out[r, 2])
+        assert MARKET <= exec_type <= STOP, "Invalid exec_type"
+
+        orders[k].id = ids[0]
+        orders[k].side = side
+        orders[k].exec_type = exec_type
+        orders[k].status = ORDERING
+        orders[k].price = out[r, 3]
+        orders[k].entry_at = ts
+        orders[k].expire_at = ts + _expire_ns(out[r, 4])
+        orders[k].losscut_price = out[r, 5]
+        orders[k].market_slippage = out[r, 6]
+        ids[0] += 1
+        n_orders += 1
+
+    return n_orders
+
+
+@numba.jit(nopython=True)
+def _clean_up(timestamps, close, orders, n_orders, positions, n_positions):
+    # ``BackTester.__clean_up``。残った注文は最後のバーで失効（決済注文は終値で決済）
+    # し、決済注文のないポジションは最後のバーの終値で決済する。
+    last = len(timestamps) - 1
+    ts = timestamps[last]
+
+    for k in range(n_orders):
+        if orders[k].status != ORDERING:
+            continue
+        if orders[k].settle == OPEN:
+            orders[k].status = EXPIRED
+        else:
+            orders[k].price = _market_price(
+                orders[k].side, close[last], orders[k].market_slippage
+            )
+            orders[k].exec_type = MARKET
+            orders[k].status = EXPIRED_EXECUTED
+            _close_position(
+                positions,
+                orders[k].position,
+                MARKET,
+                EXPIRED_EXECUTED,
+                orders[k].price,
+                orders[k].entry_at,
+                ts,
+            )
+
+    for p in range(n_positions):
+        if not positions[p].closed:
+            _close_position(positions, p, MARKET, EXECUTED, close[last], ts, ts)
+
+
+@numba.jit(nopython=True)
+def _run(
+    strategy,
+    timestamps,
+    open_,
+    high,
+    low,
+    close,
+    data,
+    state,
+    max_orders,
+    max_positions,
+):
+    orders = np.zeros(max_orders, dtype=ORDER_DTYPE)
+    positions = np.zeros(max_positions, dtype=POSITION_DTYPE)
+    trades = np.zeros(64, dtype=TRADE_DTYPE)
+    n_orders, n_positions, n_trades = 0, 0, 0
+    # 次の注文ID・ポジションID
+    ids = np.zeros(2, dtype=np.int64)
+
+    for i in range(len(timestamps)):
+        n_positions = _step_orders(
+            i,
+            timestamps,
+            open_,
+            high,
+            low,
+            orders,
+            n_orders,
+            positions,
+            n_positions,
+            ids,
+        )
+        n_orders, n_positions, trades, n_trades = _update_status(
+            orders, n_orders, positions, n_positions, trades, n_trades
+        )
+
+        out = strategy(
+            i, timestamps, data, orders[:n_orders], positions[:n_positions], state
+        )
+        n_orders = _apply(
+            i, timestamps, out, orders, n_orders, positions, n_positions, ids
+        )
+
+    if len(timestamps) > 0:
+        _clean_up(timestamps, close, orders, n_orders, positions, n_positions)
+        n_orders, n_positions, trades, n_trades = _update_status(
+            orders, n_orders, positions, n_positions, trades, n_trades
+        )
+
+    return trades[:n_trades]
+
+
+def run_strategy(
+    df: pd.DataFrame,
+    strategy: Callable,
+    columns: Sequence[str] = ("open", "high", "low", "close"),
+    *,
+    state: Optional[np.ndarray] = None,
+    max_orders: int = 1024,
+    max_positions: int = 1024,
+    return_type: str = "frame",
+):
+    """``numba.njit``した戦略でバックテストする。
+
+    :param df: ohlcv
+    :param strategy: ``strategy(i, timestamps, data, orders, positions, state)``。
+        ``timestamps``はunix nano秒、``data``は``columns``を列に持つfloat64の2次元配列、
+        ``orders``・``positions``は有効な注文・ポジションのレコード配列
+        （``ORDER_DTYPE``・``POSITION_DTYPE``、番号は指示で使う）、``state``は戦略が自
+        由に使える配列。``set_entry``等で埋めた指示（``instructions``）を返す
+    :param columns: ``data``に渡すカラム
+    :param state: 戦略の状態（バーをまたいで保持される）
+    :param max_orders: 同時に持てる注文の数の上限
+    :param max_positions: 同時に持てるポジションの数の上限
+    :param return_type: "frame" (``BackTester.get_result_df``と同じ名前のカラムを持つ
+        DataFrame) or "arrays" (``TRADE_DTYPE``のレコード配列)
+    """
+    assert df.index.name == "timestamp"
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert return_type in ["frame", "arrays"]
+
+    df = df.sort_index()
+    timestamps = df.index.values.astype("datetime64[ns]").view(np.int64)
+    data = np.ascontiguousarray(df[list(columns)].values, dtype=np.float64)
+    if state is None:
+        state = np.zeros(0)
+
+    trades = _run(
+        strategy,
+        timestamps,
+        *[df[c].values.astype(np.float64) for c in ["open", "high", "low", "close"]],
+        data,
+        state,
+        max_orders,
+        max_positions,
+    )
+
+    if return_type == "arrays":
+        return trades
+    else:
+        return _to_frame(trades, df.index.tz)
+
+
+def _to_frame(trades, tz) -> pd.DataFrame:
+    def _names(enum, values):
+        names = {e.value: e.name for e in enum}
+        return [names[v] for v in values]
+
+    def _side_names(values):
+        return [Side.BUY.name if v == BUY else Side.SELL.name for v in values]
+
+    def _timestamps(values):
+        index = pd.DatetimeIndex(values.view("datetime64[ns]"))
+        return index if tz is None else index.tz_localize("UTC").tz_convert(tz)
+
+    df = pd.DataFrame(
+        {
+            "timestamp": _timestamps(trades["open_entry_at"]),
+            "oo_side": _side_names(trades["side"]),
+            "oo_exec_type": _names(ExecutionType, trades["open_exec_type"]),
+            "oo_price": trades["open_price"],
+            "oo_entried_at": _timestamps(trades["open_entry_at"]),
+            "oo_executed_at": _timestamps(trades["open_at"]),
+            "co_side": _side_names(-trades["side"]),
+            "co_exec_type": _names(ExecutionType, trades["close_exec_type"]),
+            "co_price": trades["close_price"],
+            "co_status": _names(OrderStatus, trades["close_status"]),
+            "co_entried_at": _timestamps(trades["close_entry_at"]),
+            "co_executed_at": _timestamps(trades["close_at"]),
+            "gain": trades["gain"],
+            "side": _side_names(trades["side"]),
+        }
+    )
+    return df.set_index("timestamp")
@@ -0,0 +1,124 @@
+"""シグナルごとの結果の区間集計。
+
+``limit_simulation``の結果（シグナルのバーごとの``profit``）に対して、ローリング・
+ウォークフォワードの区間やレジームのフィルター（マスク）ごとの集計を繰り返す場合、
+毎回DataFrameを絞り込むとO(区間の長さ)かかる。``window_stats``はマスクごとに
+``profit``・勝ち数・トレード数・（全体の平均を引いた）``profit``とその2乗の累積和を
+1回だけ求め、各区間の集計を累積和の差からO(1)で求める。
+
+>>> df_result = limit_simulation(df, 1, timelimit=(600, 1800))
+>>> starts = np.arange(0, len(df) - 1000, 100)
+>>> windows = np.c_[starts, starts + 1000]  # 1000本の区間を100本ずつずらす
+>>> window_stats(df_result, windows, masks={"trend": df.ema_slope > 0})
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def window_stats(result, windows, masks=None) -> pd.DataFrame:
+    """区間・マスクごとのトレード数・平均・勝率・標準偏差・シャープレシオ。
+
+    約定・決済まで終わったシグナル（``profit``がNaNでないもの）のみを対象とする。
+    標準偏差は不偏（``ddof=1``）で、シャープレシオは``mean / std``（年率換算しない）。
+
+    :param result: ``limit_simulation``の結果（"frame" or "arrays"）
+    :param windows: (区間数, 2)の配列。各行は区間``[start, end)``で、バー番号（int）ま
+        たは時刻
+    :param masks: シグナルの絞り込み。None、bool配列、(マスク数, バー数)のbool配列、ま
+        たは名前→bool配列のdict
+    :return: 区間（とマスク）ごとの"start", "end", "count", "mean", "win_rate", "std",
+        "sharpe"。``masks``がNone・1次元の場合のindexは区間の番号、それ以外は
+        (mask, window)
+    """
+    profit = np.asarray(result["profit"], dtype=np.float64)
+    n = len(profit)
+    starts, ends = _window_bounds(result, windows)
+    assert np.all((0 <= starts) & (starts <= ends) & (ends <= n)), "Invalid windows"
+
+    if masks is None or (not isinstance(masks, dict) and np.ndim(masks) == 1):
+        names = None
+        masks = np.ones((1, n), dtype=bool) if masks is None else [masks]
+    elif isinstance(masks, dict):
+        names = list(masks.keys())
+        masks = list(masks.values())
+    else:
+        names = list(range(len(masks)))
+    masks = np.asarray(masks, dtype=bool).reshape(-1, n)
+
+    valid = masks & ~np.isnan(profit)[None, :]
+    values = np.where(valid, profit[None, :], 0.0)
+
+    # 先頭に0を置いた累積和（区間[s, e)の合計はcs[e] - cs[s]）
+    def _cumsum(x):
+        return np.concatenate([np.zeros((len(x), 1)), np.cumsum(x, axis=1)], axis=1)
+
+    count = _diff(_cumsum(valid.astype(np.float64)), starts, ends)
+    total = _diff(_cumsum(values), starts, ends)
+    wins = _diff(_cumsum((values > 0).astype(np.float64)), starts, ends)
+
+    # 2乗和から分散を求めると桁落ちするため、マスクごとの全体の平均を引いた値の和・
+    # 2乗和から求める（区間の平均が全体の平均に近いほど誤差が小さい）
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = values.sum(axis=1) / valid.sum(axis=1)
+    offset = np.nan_to_num(offset)[:, None]
+    centered = np.where(valid, values - offset, 0.0)
+    total_c = _diff(_cumsum(centered), starts, ends)
+    squares_c = _diff(_cumsum(centered**2), starts, ends)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        win_rate = wins / count
+        var = np.maximum(squares_c - total_c * total_c / count, 0) / (count - 1)
+        std = np.where(count > 1, np.sqrt(var), np.nan)
+        sharpe = mean / std
+
+    m, w = count.shape
+    df = pd.DataFrame(
+        {
+            "start": np.tile(starts, m),
+            "end": np.tile(ends, m),
+            "count": count.reshape(-1).round().astype(np.int64),
+            "mean": mean.reshape(-1),
+            "win_rate": win_rate.reshape(-1),
+            "std": std.reshape(-1),
+            "sharpe": sharpe.reshape(-1),
+        }
+    )
+    if names is None:
+        df.index.name = "window"
+    else:
+        df.index = pd.MultiIndex.from_product(
+            [names, range(w)], names=["mask", "window"]
+        )
+    return df
+
+
+def _diff(cumsum, starts, ends):
+    return cumsum[:, ends] - cumsum[:, starts]
+
+
+def _window_bounds(result, windows):
+    windows = np.asarray(windows)
+    assert windows.ndim == 2 and windows.shape[1] == 2
+
+    if np.issubdtype(windows.dtype, np.integer):
+        return windows[:, 0].astype(np.int64), windows[:, 1].astype(np.int64)
+
+    # 時刻の場合はバー番号にする（[start, end)に含まれるバー）
+    if isinstance(result, pd.DataFrame):
+        timestamps = pd.DatetimeIndex(result.index)
+    else:
+        timestamps = pd.DatetimeIndex(
+            result["timestamp"].view("datetime64[ns]")
+        ).tz_localize("UTC")
+
+    bounds = []
+    for k in range(2):
+        t = pd.DatetimeIndex(windows[:, k])
+        if t.tz is None and timestamps.tz is not None:
+            t = t.tz_localize(timestamps.tz)
+        bounds.append(timestamps.searchsorted(t).astype(np.int64))
+    return bounds[0], bounds[1]
@@ -6,6 +6,12 @@ import pandas as pd
 
 from enum import IntEnum, auto
 
+from ..refine import FIRST_EXIT, FineBars, first_touch
+
+
+# 時刻（int64 unix nano秒）の欠損値。``pd.NaT``の内部表現と同じ値。
+NAT = np.iinfo(np.int64).min
+
 
 class Status(IntEnum):
     SUCCESS = auto()
@@ -13,6 +19,543 @@ class Status(IntEnum):
     EXIT_TIMEOUT = auto()
     FILTERED = auto()
     LOSSCUT = auto()
+    SKIPPED = auto()
+
+
+@numba.jit(nopython=True)
+def _exit_first(
+    i, j, side, exit_at, exit_prices, losscut_prices, fine_high, fine_low, fine_bounds
+):
+    # 同じバーでエグジット指値とロスカットの両方に触れた場合のみ、細かい足で判定する。
+    # 細かい足が与えられていない場合は従来通りロスカットを優先する。
+    if exit_at[i] == NAT or len(fine_bounds) == 0:
+        return False
+
+    return (
+        first_touch(
+            fine_high,
+            fine_low,
+            fine_bounds[j],
+            fine_bounds[j + 1],
+            side,
+            exit_prices[i],
+            losscut_prices[i],
+            True,
+        )
+        == FIRST_EXIT
+    )
+
+
+@numba.jit(nopython=True)
+def _simulate(
+    i,
+    end,
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    high_prices,
+    low_prices,
+    close_prices,
+    timestamps,
+    timelimit,
+    side,
+    losscut_slippage,
+    has_losscut,
+    timelimit_type,
+    fine_high,
+    fine_low,
+    fine_bounds,
+    entry_at,
+    entry_price,
+    exit_at,
+    exit_price,
+    status,
+):
+    """シグナル``i``の注文を``end``の手前のバーまで評価し、結果を出力配列に書き込む。
+
+    注文・ポジションが終了したバー番号（未終了の場合は``end``）を返す。
+    """
+    entry_at_bar = -1
+
+    i_ts = timestamps[i]
+    for j in range(i + 1, end):
+        j_ts = timestamps[j]
+        on_entry = entry_at[i] == NAT
+
+        # 時刻を過ぎているかの判定
+        if timelimit_type == "time":
+            elapsed = j_ts - i_ts if on_entry else j_ts - entry_at[i]
+        else:
+            elapsed = j - i if on_entry else j - entry_at_bar
+
+        tl = timelimit[0] if on_entry else timelimit[1]
+
+        if elapsed > tl:
+            # exitできている場合は下でbreakされる
+            assert exit_at[i] == NAT
+
+            # entryはしたがexitできてない場合は現時刻のcloseでexitする
+            if not on_entry:
+                exit_at[i] = j_ts
+                exit_price[i] = close_prices[j]
+                status[i] = Status.EXIT_TIMEOUT
+
+            return j
+
+        # Long
+        if side == 1:
+            # Entry
+            if on_entry:
+                if low_prices[j] < entry_prices[i]:
+                    entry_at[i] = j_ts
+                    entry_at_bar = j
+                    entry_price[i] = entry_prices[i]
+            # Exit
+            else:
+                if high_prices[j] > exit_prices[i]:
+                    exit_at[i] = j_ts
+                    exit_price[i] = exit_prices[i]
+                    status[i] = Status.SUCCESS
+
+                if (
+                    has_losscut
+                    and low_prices[j] < losscut_prices[i]
+                    and not _exit_first(
+                        i,
+                        j,
+                        side,
+                        exit_at,
+                        exit_prices,
+                        losscut_prices,
+                        fine_high,
+                        fine_low,
+                        fine_bounds,
+                    )
+                ):
+                    exit_at[i] = j_ts
+                    exit_price[i] = losscut_prices[i] - losscut_slippage
+                    status[i] = Status.LOSSCUT
+
+                if exit_at[i] != NAT:
+                    return j
+
+        # Short
+        elif side == -1:
+            # Entry
+            if on_entry:
+                if high_prices[j] > entry_prices[i]:
+                    entry_at[i] = j_ts
+                    entry_at_bar = j
+                    entry_price[i] = entry_prices[i]
+            # Exit
+            else:
+                if low_prices[j] < exit_prices[i]:
+                    exit_at[i] = j_ts
+                    exit_price[i] = exit_prices[i]
+                    status[i] = Status.SUCCESS
+
+                if (
+                    has_losscut
+                    and high_prices[j] > losscut_prices[i]
+                    and not _exit_first(
+                        i,
+                        j,
+                        side,
+                        exit_at,
+                        exit_prices,
+                        losscut_prices,
+                        fine_high,
+                        fine_low,
+                        fine_bounds,
+                    )
+                ):
+                    exit_at[i] = j_ts
+                    exit_price[i] = losscut_prices[i] + losscut_slippage
+                    status[i] = Status.LOSSCUT
+
+                if exit_at[i] != NAT:
+                    return j
+
+    return end
+
+
+@numba.jit(nopython=True)
+def _allocate(N):
+    entry_at = np.full(N, NAT)
+    exit_at = np.full(N, NAT)
+    entry_price = np.full(N, np.nan)
+    exit_price = np.full(N, np.nan)
+    status = np.full(N, Status.SUCCESS, dtype=np.int8)
+    return entry_at, entry_price, exit_at, exit_price, status
+
+
+@numba.jit(nopython=True)
+def _new_slots(max_concurrent):
+    return np.full(max(max_concurrent, 1), -1)
+
+
+@numba.jit(nopython=True)
+def _calc_range(
+    start,
+    end,
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    high_prices,
+    low_prices,
+    close_prices,
+    timestamps,
+    timelimit,
+    side,
+    losscut_slippage,
+    entry_filter,
+    timelimit_type,
+    fine_high,
+    fine_low,
+    fine_bounds,
+    max_concurrent,
+    slots,
+    entry_at,
+    entry_price,
+    exit_at,
+    exit_price,
+    status,
+):
+    has_losscut = ~np.isnan(losscut_prices[start:end]).all()
+
+    # ``max_concurrent > 0``の場合、``slots``は同時に持てる注文・ポジションの枠
+    # （``_new_slots``）。各枠が空くバー番号を保持し、全て埋まっている間のシグナルは
+    # SKIPPEDとする。
+
+    for i in range(start, end):
+        if entry_filter[i] == 0:
+            status[i] = Status.FILTERED
+            continue
+
+        if max_concurrent > 0:
+            k = np.argmin(slots)
+            if slots[k] > i:
+                status[i] = Status.SKIPPED
+                continue
+
+        release = _simulate(
+            i,
+            end,
+            entry_prices,
+            exit_prices,
+            losscut_prices,
+            high_prices,
+            low_prices,
+            close_prices,
+            timestamps,
+            timelimit,
+            side,
+            losscut_slippage,
+            has_losscut,
+            timelimit_type,
+            fine_high,
+            fine_low,
+            fine_bounds,
+            entry_at,
+            entry_price,
+            exit_at,
+            exit_price,
+            status,
+        )
+
+        if max_concurrent > 0:
+            slots[k] = release
+
+
+@numba.jit(nopython=True)
+def _calc(
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    high_prices,
+    low_prices,
+    close_prices,
+    timestamps,
+    timelimit,
+    side,
+    losscut_slippage,
+    entry_filter,
+    timelimit_type,
+    fine_high,
+    fine_low,
+    fine_bounds,
+    max_concurrent,
+):
+    N = len(entry_prices)
+    entry_at, entry_price, exit_at, exit_price, status = _allocate(N)
+
+    _calc_range(
+        0,
+        N,
+        entry_prices,
+        exit_prices,
+        losscut_prices,
+        high_prices,
+        low_prices,
+        close_prices,
+        timestamps,
+        timelimit,
+        side,
+        losscut_slippage,
+        entry_filter,
+        timelimit_type,
+        fine_high,
+        fine_low,
+        fine_bounds,
+        max_concurrent,
+        _new_slots(max_concurrent),
+        entry_at,
+        entry_price,
+        exit_at,
+        exit_price,
+        status,
+    )
+
+    return entry_at, entry_price, exit_at, exit_price, status
+
+
+@numba.jit(nopython=True, parallel=True)
+def _calc_parallel(
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    high_prices,
+    low_prices,
+    close_prices,
+    timestamps,
+    timelimit,
+    side,
+    losscut_slippage,
+    entry_filter,
+    timelimit_type,
+    fine_high,
+    fine_low,
+    fine_bounds,
+):
+    # 各シグナルは独立なので、シグナルのループを並列化する。
+    # 各シグナルは必要な分だけ先のバーを読むため、結果は``_calc``と完全に一致する。
+    N = len(entry_prices)
+    entry_at, entry_price, exit_at, exit_price, status = _allocate(N)
+
+    has_losscut = ~np.isnan(losscut_prices).all()
+
+    for i in numba.prange(N):
+        if entry_filter[i] == 0:
+            status[i] = Status.FILTERED
+            continue
+
+        _simulate(
+            i,
+            N,
+            entry_prices,
+            exit_prices,
+            losscut_prices,
+            high_prices,
+            low_prices,
+            close_prices,
+            timestamps,
+            timelimit,
+            side,
+            losscut_slippage,
+            has_losscut,
+            timelimit_type,
+            fine_high,
+            fine_low,
+            fine_bounds,
+            entry_at,
+            entry_price,
+            exit_at,
+            exit_price,
+            status,
+        )
+
+    return entry_at, entry_price, exit_at, exit_price, status
+
+
+@numba.jit(nopython=True, parallel=True)
+def _calc_multi(
+    offsets,
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    high_prices,
+    low_prices,
+    close_prices,
+    timestamps,
+    timelimit,
+    side,
+    losscut_slippage,
+    entry_filter,
+    timelimit_type,
+    fine_high,
+    fine_low,
+    fine_bounds,
+    max_concurrent,
+):
+    # 銘柄``k``のデータは``offsets[k]:offsets[k + 1]``。銘柄単位で並列に評価する。
+    N = len(entry_prices)
+    entry_at, entry_price, exit_at, exit_price, status = _allocate(N)
+
+    for k in numba.prange(len(offsets) - 1):
+        _calc_range(
+            offsets[k],
+            offsets[k + 1],
+            entry_prices,
+            exit_prices,
+            losscut_prices,
+            high_prices,
+            low_prices,
+            close_prices,
+            timestamps,
+            timelimit,
+            side,
+            losscut_slippage,
+            entry_filter,
+            timelimit_type,
+            fine_high,
+            fine_low,
+            fine_bounds,
+            max_concurrent,
+            _new_slots(max_concurrent),
+            entry_at,
+            entry_price,
+            exit_at,
+            exit_price,
+            status,
+        )
+
+    return entry_at, entry_price, exit_at, exit_price, status
+
+
+@numba.jit(nopython=True)
+def _is_resolved(
+    i, last, timestamps, timelimit, timelimit_type, entry_at, exit_at, status
+):
+    # シグナル``i``の結果が、バー``last``より後のバーによらず確定しているか
+    if status[i] != Status.SUCCESS or exit_at[i] != NAT:
+        return True
+    if entry_at[i] != NAT:
+        return False
+
+    # エントリーしていない場合は、``last``の時点でタイムアウトしていれば確定
+    if timelimit_type == "time":
+        elapsed = timestamps[last] - timestamps[i]
+    else:
+        elapsed = last - i
+    return elapsed > timelimit[0]
+
+
+@numba.jit(nopython=True)
+def _calc_incremental(
+    start,
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    high_prices,
+    low_prices,
+    close_prices,
+    timestamps,
+    timelimit,
+    side,
+    losscut_slippage,
+    entry_filter,
+    timelimit_type,
+    fine_high,
+    fine_low,
+    fine_bounds,
+    max_concurrent,
+    entry_at,
+    entry_price,
+    exit_at,
+    exit_price,
+    status,
+):
+    # 出力配列の``:start``には前回（バー``start``本）の結果が入っている。
+    # 前回のデータの終端で未確定だったシグナルを評価し直し、``start``以降のシグナル
+    # を評価する。
+    N = len(entry_prices)
+    has_losscut = ~np.isnan(losscut_prices).all()
+
+    # 未確定のシグナルは前回の終端で枠を占有していたもの（``max_concurrent``以下）
+    slots = _new_slots(max_concurrent)
+    n_slots = 0
+
+    for i in range(start):
+        if _is_resolved(
+            i,
+            start - 1,
+            timestamps,
+            timelimit,
+            timelimit_type,
+            entry_at,
+            exit_at,
+            status,
+        ):
+            continue
+
+        entry_at[i], entry_price[i] = NAT, np.nan
+        exit_at[i], exit_price[i] = NAT, np.nan
+
+        release = _simulate(
+            i,
+            N,
+            entry_prices,
+            exit_prices,
+            losscut_prices,
+            high_prices,
+            low_prices,
+            close_prices,
+            timestamps,
+            timelimit,
+            side,
+            losscut_slippage,
+            has_losscut,
+            timelimit_type,
+            fine_high,
+            fine_low,
+            fine_bounds,
+            entry_at,
+            entry_price,
+            exit_at,
+            exit_price,
+            status,
+        )
+
+        if max_concurrent > 0:
+            slots[n_slots] = release
+            n_slots += 1
+
+    _calc_range(
+        start,
+        N,
+        entry_prices,
+        exit_prices,
+        losscut_prices,
+        high_prices,
+        low_prices,
+        close_prices,
+        timestamps,
+        timelimit,
+        side,
+        losscut_slippage,
+        entry_filter,
+        timelimit_type,
+        fine_high,
+        fine_low,
+        fine_bounds,
+        max_concurrent,
+        slots,
+        entry_at,
+        entry_price,
+        exit_at,
+        exit_price,
+        status,
+    )
 
 
 def limit_simulation(
@@ -26,7 +569,13 @@ def limit_simulation(
     timelimit: Optional[int] = np.inf,
     timelimit_type: Optional[str] = "time",
     losscut_slippage: Optional[int] = 2000,
-) -> pd.DataFrame:
+    max_concurrent: Optional[int] = None,
+    parallel: bool = False,
+    fine: Optional[FineBars] = None,
+    cache=None,
+    previous=None,
+    return_type: Optional[str] = "frame",
+):
     """指値注文のバックテスト。
 
     :param df:　ohlcv
@@ -38,121 +587,198 @@ def limit_simulation(
     :param timelimit: キャンセルまでのリードタイム or バーの本数
     :param timelimit_type:　timelimitのタイプ（"time" or "bar"）
     :param losscut_slippage: ロスカット時のスリップ幅
+    :param max_concurrent: 同時に持てる注文・ポジションの数。Noneの場合は無制限（全
+        てのバーのシグナルを独立に評価する）。上限に達している間のシグナルはSKIPPED
+    :param parallel: シグナルのループをマルチスレッドで並列に評価する（結果は同じ）。
+        ``max_concurrent``とは併用できない
+    :param fine: 細かい足。同じバーでエグジット指値とロスカットの両方に触れた場合に、
+        そのバーの期間の細かい足でどちらが先かを判定する（未指定の場合はロスカット）
+    :param cache: ``botbacktester.cache.ResultCache``。入力・パラメーターが同じ場合は
+        保存済みの結果を使う
+    :param previous: ``df``の先頭部分（バーを追加する前のデータ）に対して同じパラメー
+        ターで実行した結果（"frame" or "arrays"）。前回のデータの終端で未確定だった
+        シグナルと、追加されたバーのシグナルのみを評価する（結果は全体を評価した場合と
+        同じ）。``parallel``とは併用できない
+    :param return_type: "frame" (DataFrame) or "arrays" (カラム名→ndarrayのdict)
     :return:
 
     - entry_prices・exit_prices未指定の場合、dfは"buy_price"と"sell_price"カラムを持っていなければならない
+    - "arrays"の場合、時刻はint64のunix nano秒（欠損は``NAT``）、statusはint8で返す
 
     """
+    assert return_type in ["frame", "arrays"]
 
-    @numba.jit(nopython=True)
-    def _calc(
-        entry_prices,
-        exit_prices,
-        losscut_prices,
-        open_prices,
-        high_prices,
-        low_prices,
-        close_prices,
-        timestamps,
-        timelimit,
+    inputs = _prepare_inputs(
+        df,
+        side,
+        entry_prices=entry_prices,
+        exit_prices=exit_prices,
+        losscut_prices=losscut_prices,
+        entry_filter=entry_filter,
+        timelimit=timelimit,
+        timelimit_type=timelimit_type,
+        fine=fine,
+    )
+
+    args = (
+        inputs["entry_prices"],
+        inputs["exit_prices"],
+        inputs["losscut_prices"],
+        inputs["high_prices"],
+        inputs["low_prices"],
+        inputs["close_prices"],
+        inputs["timestamps"],
+        inputs["timelimit"],
         side,
         losscut_slippage,
-        entry_filter,
+        inputs["entry_filter"],
         timelimit_type,
-    ):
-        N = len(entry_prices)
+        inputs["fine_high"],
+        inputs["fine_low"],
+        inputs["fine_bounds"],
+    )
+
+    if parallel:
+        assert max_concurrent is None, "``parallel`` and ``max_concurrent`` conflict"
+        assert previous is None, "``parallel`` and ``previous`` conflict"
+
+    def _run():
+        if parallel:
+            return _calc_parallel(*args)
+        elif previous is not None:
+            n, values = _previous_values(previous, inputs)
+            _calc_incremental(n, *args, _to_max_concurrent(max_concurrent), *values)
+            return values
+        else:
+            return _calc(*args, _to_max_concurrent(max_concurrent))
 
-        entry_at = np.full(N, np.nan)
-        exit_at = np.full(N, np.nan)
-        entry_price = np.full(N, np.nan)
-        exit_price = np.full(N, np.nan)
-        status = np.full(N, 1)
-        __entry_at_bar = np.full(N, np.nan)
+    if cache is None:
+        values = _run()
+    else:
+        # ``parallel``は結果に影響しないのでキーに含めない
+        key = cache.key("limit_simulation", args, max_concurrent)
+        values = cache.get_or_run(key, lambda: dict(zip(_VALUE_KEYS, _run())))
+        values = tuple([values[k] for k in _VALUE_KEYS])
 
-        if timelimit_type == "time":
-            unix_seconds = 1000000000
-            timelimit = timelimit * unix_seconds
+    arrays = _to_arrays(inputs, values, side)
 
-        has_losscut = ~np.isnan(losscut_prices).all()
+    if return_type == "arrays":
+        return arrays
+    else:
+        return _to_frame(arrays, df.index)
 
-        for i in range(N):
-            if entry_filter[i] == 0:
-                status[i] = Status.FILTERED
-                continue
 
-            i_ts = timestamps[i]
-            for j in range(i + 1, N):
-                j_ts = timestamps[j]
-                on_entry = np.isnan(entry_at[i])
-
-                # 時刻を過ぎているかの判定
-                if timelimit_type == "time":
-                    elapsed = j_ts - i_ts if on_entry else j_ts - entry_at[i]
-                else:
-                    elapsed = j - i if on_entry else j - __entry_at_bar[i]
-
-                tl = timelimit[0] if on_entry else timelimit[1]
-
-                if elapsed > tl:
-                    # exitできている場合は下でbreakされる
-                    assert np.isnan(exit_at[i])
-
-                    # entryはしたがexitできてない場合は現時刻のcloseでexitする
-                    if ~on_entry:
-                        exit_at[i] = j_ts
-                        exit_price[i] = close_prices[j]
-                        status[i] = Status.EXIT_TIMEOUT
-
-                    break
-
-                # Long
-                if side == 1:
-                    # Entry
-                    if on_entry:
-                        if low_prices[j] < entry_prices[i]:
-                            entry_at[i] = j_ts
-                            __entry_at_bar[i] = j
-                            entry_price[i] = entry_prices[i]
-                    # Exit
-                    else:
-                        if high_prices[j] > exit_prices[i]:
-                            exit_at[i] = j_ts
-                            exit_price[i] = exit_prices[i]
-                            status[i] = Status.SUCCESS
-
-                        if has_losscut and low_prices[j] < losscut_prices[i]:
-                            exit_at[i] = j_ts
-                            exit_price[i] = losscut_prices[i] - losscut_slippage
-                            status[i] = Status.LOSSCUT
-
-                        if ~np.isnan(exit_at[i]):
-                            break
-
-                # Short
-                elif side == -1:
-                    # Entry
-                    if on_entry:
-                        if high_prices[j] > entry_prices[i]:
-                            entry_at[i] = j_ts
-                            __entry_at_bar[i] = j
-                            entry_price[i] = entry_prices[i]
-                    # Exit
-                    else:
-                        if low_prices[j] < exit_prices[i]:
-                            exit_at[i] = j_ts
-                            exit_price[i] = exit_prices[i]
-                            status[i] = Status.SUCCESS
-
-                        if has_losscut and high_prices[j] > losscut_prices[i]:
-                            exit_at[i] = j_ts
-                            exit_price[i] = losscut_prices[i] + losscut_slippage
-                            status[i] = Status.LOSSCUT
-
-                        if ~np.isnan(exit_at[i]):
-                            break
-
-        return entry_at, entry_price, exit_at, exit_price, status
+def limit_simulation_multi(
+    data,
+    side: int,
+    *,
+    entry_prices: Optional[str] = None,
+    exit_prices: Optional[str] = None,
+    losscut_prices: Optional[str] = None,
+    entry_filter: Optional[str] = None,
+    timelimit: Optional[int] = np.inf,
+    timelimit_type: Optional[str] = "time",
+    losscut_slippage: Optional[int] = 2000,
+    max_concurrent: Optional[int] = None,
+    return_type: Optional[str] = "frame",
+    symbol_key: str = "symbol",
+):
+    """複数銘柄の指値注文のバックテストをまとめて実行する。
+
+    全銘柄のデータを1本の配列に連結し（銘柄の境界は``offsets``で管理）、銘柄単位で並列
+    に評価する。結果は銘柄ごとに``limit_simulation``を呼んだものと同じになる。
+
+    :param data: 銘柄→ohlcvのdict、または``symbol_key``カラムを持つlong形式のohlcv
+    :param side: 1 ("BUY") or -1 ("SELL")
+    :param entry_prices: エントリー指値のカラム名
+    :param exit_prices:　エグジット指値のカラム名
+    :param losscut_prices:　ストップ指値のカラム名
+    :param entry_filter: エントリーの可否のカラム名
+    :param timelimit: ``limit_simulation``と同じ
+    :param timelimit_type:　``limit_simulation``と同じ
+    :param losscut_slippage: ``limit_simulation``と同じ
+    :param max_concurrent: ``limit_simulation``と同じ（銘柄ごと）
+    :param return_type: "frame" (DataFrame) or "arrays" (カラム名→ndarrayのdict)
+    :param symbol_key: 銘柄のカラム名
+    :return: (symbol, timestamp)をindexに持つDataFrame。"arrays"の場合は
+        ``symbol_key``のカラムを含むdict。
+
+    """
+    assert return_type in ["frame", "arrays"]
+    for p in [entry_prices, exit_prices, losscut_prices, entry_filter]:
+        assert p is None or isinstance(p, str), "Only column names are supported"
+
+    if isinstance(data, dict):
+        symbols = np.array(list(data.keys()), dtype=object)
+        frames = [data[s] for s in symbols]
+        assert all([f.index.is_monotonic_increasing for f in frames])
+        lengths = np.array([len(f) for f in frames])
+        df = pd.concat(frames)
+    else:
+        assert symbol_key in data.columns
+        df = data.reset_index().sort_values([symbol_key, "timestamp"], kind="stable")
+        symbols, lengths = np.unique(df[symbol_key].values, return_counts=True)
+        df = df.set_index("timestamp")
+
+    offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+
+    inputs = _prepare_inputs(
+        df,
+        side,
+        entry_prices=entry_prices,
+        exit_prices=exit_prices,
+        losscut_prices=losscut_prices,
+        entry_filter=entry_filter,
+        timelimit=timelimit,
+        timelimit_type=timelimit_type,
+    )
+
+    values = _calc_multi(
+        offsets,
+        inputs["entry_prices"],
+        inputs["exit_prices"],
+        inputs["losscut_prices"],
+        inputs["high_prices"],
+        inputs["low_prices"],
+        inputs["close_prices"],
+        inputs["timestamps"],
+        inputs["timelimit"],
+        side,
+        losscut_slippage,
+        inputs["entry_filter"],
+        timelimit_type,
+        inputs["fine_high"],
+        inputs["fine_low"],
+        inputs["fine_bounds"],
+        _to_max_concurrent(max_concurrent),
+    )
+
+    arrays = _to_arrays(inputs, values, side)
+    # idは銘柄ごとの通し番号
+    arrays["id"] = arrays["id"] - np.repeat(offsets[:-1], lengths)
+    arrays[symbol_key] = np.repeat(symbols, lengths)
+
+    if return_type == "arrays":
+        return arrays
+    else:
+        index = pd.MultiIndex.from_arrays(
+            [arrays[symbol_key], df.index], names=[symbol_key, "timestamp"]
+        )
+        return _to_frame(arrays, index)
+
 
+def _prepare_inputs(
+    df,
+    side,
+    *,
+    entry_prices,
+    exit_prices,
+    losscut_prices,
+    entry_filter,
+    timelimit,
+    timelimit_type,
+    fine=None,
+):
     # check
     assert df.index.name == "timestamp"
     assert isinstance(df.index, pd.DatetimeIndex)
@@ -197,50 +823,126 @@ def limit_simulation(
     else:
         timelimit = np.array([timelimit, timelimit])
 
-    values = _calc(
-        entry_prices,
-        exit_prices,
-        losscut_prices,
-        df.open.values,
-        df.high.values,
-        df.low.values,
-        df.close.values,
-        df.index.values.astype(int),
-        timelimit,
-        side,
-        losscut_slippage,
-        entry_filter,
-        timelimit_type,
-    )
+    if timelimit_type == "time":
+        unix_seconds = 1000000000
+        timelimit = timelimit * unix_seconds
 
-    df_ = pd.DataFrame(list(values) + [entry_prices, exit_prices, losscut_prices]).T
-    df_.index = df.index
-    df_.columns = [
-        "entry_at",
-        "entry_price",
-        "exit_at",
-        "exit_price",
-        "status",
-        "entry_price_order",
-        "exit_price_order",
-        "losscut_price_order",
-    ]
-    for c in df_.columns:
-        if c.endswith("at"):
-            df_[c] = pd.to_datetime(df_[c], utc=True)
-
-    df_["status"] = df_["status"].astype(int)
-
-    if side == 1:
-        df_["profit"] = df_.exit_price / df_.entry_price - 1
-    else:
-        df_["profit"] = (df_.exit_price / df_.entry_price - 1) * -1
+    timestamps = _to_unix_nano(df.index)
 
-    df_["id"] = np.arange(len(df_))
+    if fine is None:
+        fine_high, fine_low = np.empty(0), np.empty(0)
+        fine_bounds = np.empty(0, dtype=np.int64)
+    else:
+        fine_high, fine_low = fine.high, fine.low
+        fine_bounds = fine.bounds(timestamps)
+
+    return {
+        "entry_prices": entry_prices,
+        "exit_prices": exit_prices,
+        "losscut_prices": losscut_prices,
+        "entry_filter": entry_filter,
+        "timelimit": timelimit,
+        "high_prices": df.high.values,
+        "low_prices": df.low.values,
+        "close_prices": df.close.values,
+        "timestamps": timestamps,
+        "fine_high": fine_high,
+        "fine_low": fine_low,
+        "fine_bounds": fine_bounds,
+    }
+
+
+def _previous_values(previous, inputs):
+    # 前回の結果を、追加されたバーの分を含めた長さの出力配列にする
+    if isinstance(previous, pd.DataFrame):
+        previous = {
+            "timestamp": _to_unix_nano(previous.index),
+            "entry_at": _to_unix_nano(pd.DatetimeIndex(previous.entry_at)),
+            "entry_price": previous.entry_price.values,
+            "exit_at": _to_unix_nano(pd.DatetimeIndex(previous.exit_at)),
+            "exit_price": previous.exit_price.values,
+            "status": previous.status.values,
+            "entry_price_order": previous.entry_price_order.values,
+            "exit_price_order": previous.exit_price_order.values,
+        }
+
+    n = len(previous["timestamp"])
+    assert n <= len(inputs["timestamps"])
+    assert (
+        previous["timestamp"] == inputs["timestamps"][:n]
+    ).all(), "Previous result does not match the head of the data"
+    for k in ["entry_price_order", "exit_price_order"]:
+        assert np.array_equal(
+            previous[k], inputs[k.replace("_order", "s")][:n], equal_nan=True
+        ), f"Previous result has different {k}"
+
+    values = _allocate(len(inputs["timestamps"]))
+    for v, k in zip(values, _VALUE_KEYS):
+        v[:n] = previous[k]
+    return n, values
+
+
+# カーネルの戻り値の名前（``_allocate``の順）
+_VALUE_KEYS = ("entry_at", "entry_price", "exit_at", "exit_price", "status")
+
+
+def _to_max_concurrent(max_concurrent):
+    # カーネル側では0を無制限として扱う
+    if max_concurrent is None:
+        return 0
+    assert max_concurrent >= 1, f"Invalid max_concurrent: {max_concurrent}"
+    return int(max_concurrent)
+
+
+def _to_unix_nano(index: pd.DatetimeIndex) -> np.ndarray:
+    # tz付きの場合もUTCのunix nano秒になる
+    return index.values.astype("datetime64[ns]").view(np.int64)
+
+
+def _to_arrays(inputs, values, side) -> dict:
+    entry_at, entry_price, exit_at, exit_price, status = values
+    timestamps = inputs["timestamps"]
+
+    profit = exit_price / entry_price - 1
+    if side == -1:
+        profit = profit * -1
+
+    has_entry = entry_at != NAT
+    has_exit = exit_at != NAT
+
+    return {
+        "timestamp": timestamps,
+        "entry_at": entry_at,
+        "entry_price": entry_price,
+        "exit_at": exit_at,
+        "exit_price": exit_price,
+        "status": status,
+        "entry_price_order": inputs["entry_prices"],
+        "exit_price_order": inputs["exit_prices"],
+        "losscut_price_order": inputs["losscut_prices"],
+        "profit": profit,
+        "id": np.arange(len(timestamps)),
+        "is_win": np.where(has_entry, profit > 0, np.nan),
+        "entry_duration": _duration_seconds(timestamps, entry_at, has_entry),
+        "exit_duration": _duration_seconds(entry_at, exit_at, has_entry & has_exit),
+        "total_duration": _duration_seconds(timestamps, exit_at, has_exit),
+    }
+
+
+def _duration_seconds(start, end, valid):
+    return np.where(valid, (end - start) / 1e9, np.nan)
+
+
+def _to_frame(arrays: dict, index: pd.Index) -> pd.DataFrame:
+    columns = {}
+    for c, v in arrays.items():
+        if c in index.names:
+            continue
+        elif c.endswith("_at"):
+            columns[c] = pd.DatetimeIndex(v.view("datetime64[ns]")).tz_localize("UTC")
+        else:
+            columns[c] = v
 
-    df_["is_win"] = np.where(df_.entry_at.isna(), np.nan, df_.profit > 0)
-    df_["entry_duration"] = (df_.entry_at - df_.index).dt.total_seconds()
-    df_["exit_duration"] = (df_.exit_at - df_.entry_at).dt.total_seconds()
-    df_["total_duration"] = (df_.exit_at - df_.index).dt.total_seconds()
+    df_ = pd.DataFrame(columns, index=index)
 
     return df_
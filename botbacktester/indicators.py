@@ -0,0 +1,316 @@
+"""インクリメンタルに更新できるインジケーター。
+
+``start()``のループやライブ実行（``live``）の中で、バーごとにO(1)で更新できる状態オブ
+ジェクトと、DataFrame全体に対して一括で計算するバッチ版（``ema``など）を提供する。
+両者は同じ順序で同じ演算をするため、値は完全に一致する。
+
+>>> atr = ATR(14)
+>>> for i, item in tester.start():
+...     v = atr.update(item["high"], item["low"], item["close"])
+>>> df["atr"] = indicators.atr(df.high, df.low, df.close, 14)
+
+値が定まらない期間（ウィンドウが埋まるまでなど）はNaNを返す。入力にNaNは含まないこと。
+"""
+
+from __future__ import annotations
+
+import collections
+import math
+
+import numba
+import numpy as np
+
+
+class EMA:
+    """指数移動平均。``alpha = 2 / (span + 1)``で、初期値は最初の値
+    （``pd.Series.ewm(span=span, adjust=False).mean()``と同じ）。"""
+
+    def __init__(self, span: int):
+        assert span >= 1
+        self._alpha = 2.0 / (span + 1.0)
+        self._value = math.nan
+
+    def update(self, x: float) -> float:
+        if math.isnan(self._value):
+            self._value = x
+        else:
+            self._value = (1.0 - self._alpha) * self._value + self._alpha * x
+        return self._value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class ATR:
+    """Average True Range（Wilderの平滑化、``talib.ATR``と同じ）。
+
+    最初の``period``本のTrue Rangeの単純平均を初期値とし、以降は
+    ``(atr * (period - 1) + tr) / period``で更新する。TRには前のバーの終値が必要なので、
+    最初の値が得られるのは``period + 1``本目。
+    """
+
+    def __init__(self, period: int = 14):
+        assert period >= 1
+        self._period = period
+        self._prev_close = math.nan
+        self._n = 0
+        self._sum = 0.0
+        self._value = math.nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        if math.isnan(self._prev_close):
+            self._prev_close = close
+            return self._value
+
+        tr = max(high - low, abs(high - self._prev_close), abs(low - self._prev_close))
+        self._prev_close = close
+        self._n += 1
+
+        if self._n <= self._period:
+            self._sum += tr
+            if self._n == self._period:
+                self._value = self._sum / self._period
+        else:
+            self._value = (self._value * (self._period - 1) + tr) / self._period
+
+        return self._value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _RollingExtremum:
+    # 単調なdeque（先頭が窓内の最大/最小）による移動最大・最小
+    _sign = None
+
+    def __init__(self, window: int):
+        assert window >= 1
+        self._window = window
+        self._deque = collections.deque()
+        self._i = -1
+
+    def update(self, x: float) -> float:
+        self._i += 1
+        v = self._sign * x
+
+        while self._deque and self._deque[-1][1] <= v:
+            self._deque.pop()
+        self._deque.append((self._i, v))
+        if self._deque[0][0] <= self._i - self._window:
+            self._deque.popleft()
+
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if self._i + 1 < self._window:
+            return math.nan
+        return self._sign * self._deque[0][1]
+
+
+class RollingMax(_RollingExtremum):
+    """直近``window``本の最大値。"""
+
+    _sign = 1.0
+
+
+class RollingMin(_RollingExtremum):
+    """直近``window``本の最小値。"""
+
+    _sign = -1.0
+
+
+class RollingMeanStd:
+    """直近``window``本の平均と標準偏差（不偏、``ddof=1``）。
+
+    Welfordの方法で、窓から出る値と入る値を差し替えて更新する（値の合計を持たないので
+    桁落ちが起きにくい）。
+    """
+
+    def __init__(self, window: int):
+        assert window >= 2
+        self._window = window
+        self._values = collections.deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, x: float) -> tuple[float, float]:
+        """値を追加し、``(mean, std)``を返す。"""
+        if len(self._values) < self._window:
+            n = len(self._values) + 1
+            d = x - self._mean
+            self._mean += d / n
+            self._m2 += d * (x - self._mean)
+        else:
+            y = self._values.popleft()
+            prev_mean = self._mean
+            self._mean += (x - y) / self._window
+            self._m2 += (x - y) * (x - self._mean + y - prev_mean)
+        self._values.append(x)
+
+        return self.mean, self.std
+
+    @property
+    def mean(self) -> float:
+        if len(self._values) < self._window:
+            return math.nan
+        return self._mean
+
+    @property
+    def std(self) -> float:
+        if len(self._values) < self._window:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self._window - 1))
+
+
+class Crossover:
+    """``a``が``b``を上抜けたら1、下抜けたら-1、それ以外は0を返す。
+
+    前のバーで``a <= b``かつ現在のバーで``a > b``を上抜け、前のバーで``a >= b``かつ
+    現在のバーで``a < b``を下抜けとする。NaNを含むバーは0で、比較の対象にもしない。
+    """
+
+    def __init__(self):
+        self._prev = math.nan
+
+    def update(self, a: float, b: float) -> int:
+        d = a - b
+        rtn = 0
+        if not math.isnan(self._prev) and not math.isnan(d):
+            if self._prev <= 0 < d:
+                rtn = 1
+            elif self._prev >= 0 > d:
+                rtn = -1
+        if not math.isnan(d):
+            self._prev = d
+        return rtn
+
+
+def ema(x, span: int) -> np.ndarray:
+    """``EMA``のバッチ版。"""
+    assert span >= 1
+    return _ema(_to_array(x), 2.0 / (span + 1.0))
+
+
+def atr(high, low, close, period: int = 14) -> np.ndarray:
+    """``ATR``のバッチ版。"""
+    assert period >= 1
+    return _atr(_to_array(high), _to_array(low), _to_array(close), period)
+
+
+def rolling_max(x, window: int) -> np.ndarray:
+    """``RollingMax``のバッチ版。"""
+    assert window >= 1
+    return _rolling_extremum(_to_array(x), window, 1.0)
+
+
+def rolling_min(x, window: int) -> np.ndarray:
+    """``RollingMin``のバッチ版。"""
+    assert window >= 1
+    return _rolling_extremum(_to_array(x), window, -1.0)
+
+
+def rolling_mean_std(x, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """``RollingMeanStd``のバッチ版。``(mean, std)``を返す。"""
+    assert window >= 2
+    return _rolling_mean_std(_to_array(x), window)
+
+
+def crossover(a, b) -> np.ndarray:
+    """``Crossover``のバッチ版。"""
+    return _crossover(_to_array(a), _to_array(b))
+
+
+def _to_array(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+@numba.jit(nopython=True)
+def _ema(x, alpha):
+    rtn = np.empty(len(x))
+    value = np.nan
+    for i in range(len(x)):
+        if np.isnan(value):
+            value = x[i]
+        else:
+            value = (1.0 - alpha) * value + alpha * x[i]
+        rtn[i] = value
+    return rtn
+
+
+@numba.jit(nopython=True)
+def _atr(high, low, close, period):
+    rtn = np.full(len(close), np.nan)
+    value, total = np.nan, 0.0
+    for i in range(1, len(close)):
+        tr = max(
+            high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1])
+        )
+        if i <= period:
+            total += tr
+            if i == period:
+                value = total / period
+        else:
+            value = (value * (period - 1) + tr) / period
+        rtn[i] = value
+    return rtn
+
+
+@numba.jit(nopython=True)
+def _rolling_extremum(x, window, sign):
+    n = len(x)
+    rtn = np.full(n, np.nan)
+    # 配列で実装したdeque（head:tailが有効な範囲）
+    idx = np.empty(n, dtype=np.int64)
+    values = np.empty(n)
+    head, tail = 0, 0
+    for i in range(n):
+        v = sign * x[i]
+        while tail > head and values[tail - 1] <= v:
+            tail -= 1
+        idx[tail], values[tail] = i, v
+        tail += 1
+        if idx[head] <= i - window:
+            head += 1
+        if i + 1 >= window:
+            rtn[i] = sign * values[head]
+    return rtn
+
+
+@numba.jit(nopython=True)
+def _rolling_mean_std(x, window):
+    n = len(x)
+    mean_rtn, std_rtn = np.full(n, np.nan), np.full(n, np.nan)
+    mean, m2 = 0.0, 0.0
+    for i in range(n):
+        if i < window:
+            d = x[i] - mean
+            mean += d / (i + 1)
+            m2 += d * (x[i] - mean)
+        else:
+            y = x[i - window]
+            prev_mean = mean
+            mean += (x[i] - y) / window
+            m2 += (x[i] - y) * (x[i] - mean + y - prev_mean)
+        if i + 1 >= window:
+            mean_rtn[i] = mean
+            std_rtn[i] = np.sqrt(max(m2, 0.0) / (window - 1))
+    return mean_rtn, std_rtn
+
+
+@numba.jit(nopython=True)
+def _crossover(a, b):
+    rtn = np.zeros(len(a), dtype=np.int8)
+    prev = np.nan
+    for i in range(len(a)):
+        d = a[i] - b[i]
+        if not np.isnan(prev) and not np.isnan(d):
+            if prev <= 0 < d:
+                rtn[i] = 1
+            elif prev >= 0 > d:
+                rtn[i] = -1
+        if not np.isnan(d):
+            prev = d
+    return rtn
@@ -0,0 +1,206 @@
+"""約定から決済までの期間による結果の検索。
+
+``get_result_df()``の各ポジションを区間``[oo_executed_at, co_executed_at)``として、
+ある時刻に保有していたポジション・ある期間に保有していたポジションをO(log n + k)で
+求める（kは該当するポジション数）。区間は開始時刻でソートし、暗黙的な平衡二分木（ソー
+ト済み配列の添字がそのまま木のノードになる）の各ノードに部分木の終了時刻の最大値を持
+たせる（cgrangesと同じ構造）。
+
+>>> intervals = TradeIntervals(tester.get_result_df())
+>>> intervals.at("2021-04-17 09:00")  # その時刻に保有していたポジション
+>>> intervals.overlap("2021-04-17 09:00", "2021-04-17 10:00")
+>>> intervals.concurrency()  # 保有数の推移
+
+約定したバーで決済したポジション（区間の長さが0）はどの時刻にも保有していない扱い。
+"""
+
+from __future__ import annotations
+
+import numba
+import numpy as np
+import pandas as pd
+
+# 決済していない（終了時刻が欠損の）区間の終了時刻
+_INF = np.iinfo(np.int64).max
+_NAT = np.iinfo(np.int64).min
+
+
+class TradeIntervals:
+    def __init__(
+        self, df, start_key: str = "oo_executed_at", end_key: str = "co_executed_at"
+    ):
+        """
+        :param df: ``get_result_df()``の結果（または``BackTester``）。
+            ``fast.limit_simulation``の結果の場合は``start_key="entry_at"``・
+            ``end_key="exit_at"``とする
+        :param start_key: 区間の開始時刻のカラム（欠損の行は除く）
+        :param end_key: 区間の終了時刻のカラム（欠損の場合は決済していないものとする）
+        """
+        if hasattr(df, "get_result_df"):
+            df = df.get_result_df()
+
+        self._df = df
+        self._tz = getattr(df[start_key].dtype, "tz", None)
+
+        starts = _to_unix_nano(df[start_key])
+        ends = _to_unix_nano(df[end_key])
+        ends = np.where(ends == _NAT, _INF, ends)
+
+        valid = np.flatnonzero(starts != _NAT)
+        order = valid[np.argsort(starts[valid], kind="stable")]
+
+        # 開始時刻でソートした区間と、それぞれの元の行番号
+        self._order = order
+        self._starts = starts[order]
+        self._ends = ends[order]
+        self._max_ends, self._max_level = _index(self._starts, self._ends)
+        # ``count_at``用
+        self._sorted_ends = np.sort(self._ends)
+
+    def at(self, t) -> pd.DataFrame:
+        """時刻``t``に保有していたポジション（``start <= t < end``）。"""
+        return self._df.iloc[self.at_indices(t)]
+
+    def overlap(self, start, end) -> pd.DataFrame:
+        """期間``[start, end)``に保有していたポジション。"""
+        return self._df.iloc[self.overlap_indices(start, end)]
+
+    def at_indices(self, t) -> np.ndarray:
+        """``at``の行番号（``df``での位置、昇順）。"""
+        t = self._to_unix_nano(t)
+        return self._query(t, t + 1)
+
+    def overlap_indices(self, start, end) -> np.ndarray:
+        """``overlap``の行番号（``df``での位置、昇順）。"""
+        return self._query(self._to_unix_nano(start), self._to_unix_nano(end))
+
+    def count_at(self, t) -> int:
+        """時刻``t``に保有していたポジション数（O(log n)）。"""
+        t = self._to_unix_nano(t)
+        return int(
+            np.searchsorted(self._starts, t, side="right")
+            - np.searchsorted(self._sorted_ends, t, side="right")
+        )
+
+    def concurrency(self) -> pd.Series:
+        """保有数の推移。indexは保有数が変化した時刻で、値はその時刻以降の保有数。"""
+        times = np.concatenate([self._starts, self._ends[self._ends != _INF]])
+        deltas = np.concatenate(
+            [
+                np.ones(len(self._starts), dtype=np.int64),
+                -np.ones((self._ends != _INF).sum(), dtype=np.int64),
+            ]
+        )
+        # 同じ時刻の増減はまとめる
+        times, inverse = np.unique(times, return_inverse=True)
+        counts = np.zeros(len(times), dtype=np.int64)
+        np.add.at(counts, inverse, deltas)
+
+        index = pd.DatetimeIndex(times.view("datetime64[ns]"), name="timestamp")
+        if self._tz is not None:
+            index = index.tz_localize("UTC").tz_convert(self._tz)
+        return pd.Series(np.cumsum(counts), index=index, name="concurrency")
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df
+
+    def _query(self, start, end):
+        idx = _overlap(
+            self._starts, self._ends, self._max_ends, self._max_level, start, end
+        )
+        return np.sort(self._order[idx])
+
+    def _to_unix_nano(self, t) -> int:
+        t = pd.Timestamp(t)
+        if t.tz is None and self._tz is not None:
+            t = t.tz_localize(self._tz)
+        return int(_to_unix_nano([t])[0])
+
+
+def _to_unix_nano(values) -> np.ndarray:
+    # tz付きの場合もUTCのunix nano秒。欠損は_NAT
+    return pd.DatetimeIndex(values).values.astype("datetime64[ns]").view(np.int64)
+
+
+@numba.jit(nopython=True)
+def _index(starts, ends):
+    # 暗黙的な平衡二分木の各ノードに部分木の終了時刻の最大値を求める。
+    # レベルkのノードは添字の下位kビットが1で(k + 1)ビット目が0のもの（葉は偶数）
+    n = len(starts)
+    max_ends = ends.copy()
+    if n == 0:
+        return max_ends, -1
+
+    last_i, last = 0, 0
+    for i in range(0, n, 2):
+        last_i, last = i, ends[i]
+
+    k = 1
+    while (1 << k) <= n:
+        x = 1 << (k - 1)
+        i0 = (x << 1) - 1
+        step = x << 2
+        for i in range(i0, n, step):
+            el = max_ends[i - x]
+            er = max_ends[i + x] if i + x < n else last
+            max_ends[i] = max(ends[i], el, er)
+        # 最も右のノードを親に更新する（レベルk - 1のノードiの親は、iの(k + 1)ビット目
+        # が1ならi - x、0ならi + x。親が範囲外の場合も木の形を保つため辿る）
+        last_i = last_i - x if (last_i >> k) & 1 else last_i + x
+        if last_i < n and max_ends[last_i] > last:
+            last = max_ends[last_i]
+        k += 1
+
+    return max_ends, k - 1
+
+
+@numba.jit(nopython=True)
+def _overlap(starts, ends, max_ends, max_level, start, end):
+    # [start, end)と重なる区間（starts < end かつ start < ends）の添字を昇順に返す
+    n = len(starts)
+    rtn = np.empty(n, dtype=np.int64)
+    m = 0
+    if n == 0 or start >= end:
+        return rtn[:0]
+
+    # (レベル, ノード, 左の子を処理済みか)のスタック
+    stack = np.empty((64, 3), dtype=np.int64)
+    t = _push(stack, 0, max_level, (1 << max_level) - 1, 0)
+
+    while t > 0:
+        t -= 1
+        k, x, w = stack[t, 0], stack[t, 1], stack[t, 2]
+
+        if k <= 3:
+            # 小さな部分木は全て走査する
+            i0 = x >> k << k
+            i1 = min(i0 + (1 << (k + 1)) - 1, n)
+            for i in range(i0, i1):
+                if starts[i] >= end:
+                    break
+                if start < ends[i]:
+                    rtn[m] = i
+                    m += 1
+        elif w == 0:
+            # 左の子（範囲外の場合もある）
+            y = x - (1 << (k - 1))
+            t = _push(stack, t, k, x, 1)
+            if y >= n or max_ends[y] > start:
+                t = _push(stack, t, k - 1, y, 0)
+        elif x < n and starts[x] < end:
+            if start < ends[x]:
+                rtn[m] = x
+                m += 1
+            # 右の子
+            t = _push(stack, t, k - 1, x + (1 << (k - 1)), 0)
+
+    return rtn[:m]
+
+
+@numba.jit(nopython=True)
+def _push(stack, t, k, x, w):
+    stack[t, 0] = k
+    stack[t, 1] = x
+    stack[t, 2] = w
+    return t + 1
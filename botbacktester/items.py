@@ -1,12 +1,12 @@
 from __future__ import annotations
-from typing import Callable, Union
+from typing import Callable, NamedTuple, Union
 
-import copy
 import itertools
 import pandas as pd
 
 from datetime import timedelta
 
+from .bars import BarRows, Bars
 from .enums import Side, ExecutionType, SettleType, OrderStatus
 from .utils import DEFAULT_EXPIRE_SECONDS, debug_log
 
@@ -19,18 +19,30 @@ def reset_id_counter():
     Order.ID_COUNTER = itertools.count()
 
 
-def check_limit(item: dict, side: Side, price: float):
+def get_id_counter():
+    """次に払い出されるPosition・OrderのIDを返す（カウンターは進めない）。"""
+    position_id, order_id = next(Position.ID_COUNTER), next(Order.ID_COUNTER)
+    set_id_counter(position_id, order_id)
+    return position_id, order_id
+
+
+def set_id_counter(position_id, order_id):
+    Position.ID_COUNTER = itertools.count(position_id)
+    Order.ID_COUNTER = itertools.count(order_id)
+
+
+def check_limit(bars: Bars, i: int, side: Side, price: float):
     if side == Side.BUY:
-        return item["low"] <= price
+        return bars.value("low", i) <= price
     else:
-        return item["high"] >= price
+        return bars.value("high", i) >= price
 
 
-def check_stop(item: dict, side: Side, price: float):
+def check_stop(bars: Bars, i: int, side: Side, price: float):
     if side == Side.BUY:
-        return item["high"] >= price
+        return bars.value("high", i) >= price
     else:
-        return item["low"] <= price
+        return bars.value("low", i) <= price
 
 
 class Position:
@@ -40,7 +52,7 @@ class Position:
         self.open_order: OpenOrder = open_order
         self.closing_order: CloseOrder = None
         self.close_order: CloseOrder = None
-        self.close_item: dict = None
+        self.close_i: int = None
         self._id = next(Position.ID_COUNTER)
 
     def __repr__(self):
@@ -60,10 +72,10 @@ class Position:
     def clear_closing_order(self):
         self.closing_order = None
 
-    def close(self, item: dict, close_order: "CloseOrder"):
+    def close(self, i: int, close_order: "CloseOrder"):
         # 約定した場合 or シミュレーションが終了した場合に呼ばれる。
-        # 後者の場合、cur・close_orderともに最後のものが入れられる。
-        self.close_item = item
+        # 後者の場合、i・close_orderともに最後のものが入れられる。
+        self.close_i = i
         self.close_order = close_order
 
         debug_log("CLOSED", self)
@@ -100,6 +112,10 @@ class Position:
     def side(self):
         return self.open_order.side
 
+    @property
+    def symbol(self):
+        return self.open_order.symbol
+
     @property
     def size(self):
         return self.open_order.size
@@ -114,7 +130,7 @@ class Position:
             return self.close_order.price
         else:
             # closeされなかった場合は最終アイテムで計算される
-            return self.close_item["close"]
+            return self.__bars.value("close", self.close_i)
 
     @property
     def is_closing(self):
@@ -124,6 +140,21 @@ class Position:
     def is_closed(self):
         return self.close_order is not None
 
+    @property
+    def close_item(self):
+        if self.close_i is not None:
+            return self.__bars[self.close_i]
+
+    @property
+    def open_i(self):
+        return self.open_order.executed_i
+
+    @property
+    def __bars(self):
+        # ``close_i``のバーは決済注文が持つ（pickleした終了済みの注文は``BarRows``）
+        order = self.open_order if self.close_order is None else self.close_order
+        return order.bars
+
     @property
     def open_item(self):
         return self.open_order.executed_item
@@ -144,10 +175,15 @@ class Order:
         expire_seconds: int = float("inf"),
         market_price_key: str = "open",
         market_slippage: int = 0,
+        bars: Bars = None,
+        symbol: str = None,
+        expire_time: pd.Timestamp = None,
     ):
         # イベント管理用の変数なのでprotectedにしておく
-        self._executed_item = None
-        self._expired_item = None
+        # 約定・失効したバーは``bars``のバー番号で保持する
+        self._bars = bars
+        self._executed_i = None
+        self._expired_i = None
         self._expire_time = None
         self._expire_seconds = expire_seconds
         self._entry_time = None
@@ -156,7 +192,7 @@ class Order:
         self._id = next(Order.ID_COUNTER)
 
         if entry_time is not None:
-            self._set_entry_and_expire_time(entry_time)
+            self._set_entry_and_expire_time(entry_time, expire_time)
         else:
             # Open時は``entry_time``必須
             assert settle_type != SettleType.OPEN
@@ -181,9 +217,22 @@ class Order:
         self._market_price_key = market_price_key
         self.market_slippage = market_slippage
 
+        # 複数銘柄（``PortfolioBackTester``）の場合のみ
+        self.symbol = symbol
+
     def __repr__(self):
         return f"{self.__class__.__name__}({self._repr()})"
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.is_done and isinstance(self._bars, Bars):
+            # 終了した注文は参照するバーのみを持つ（注文ごとにデータ全体をpickleしない）
+            state["_bars"] = BarRows(self._bars, self._bar_indices())
+        return state
+
+    def _bar_indices(self):
+        return [self._executed_i, self._expired_i]
+
     def _repr(self):
         return (
             f"{self._id}/"
@@ -196,7 +245,7 @@ class Order:
         )
 
     def as_dict(self):
-        return {
+        d = {
             "side": self.side.name,
             "exec_type": self.exec_type.name,
             "settle_type": self.settle_type.name,
@@ -209,6 +258,9 @@ class Order:
             "expired_at": self.expired_at,
             "fee": self.fee,
         }
+        if self.symbol is not None:
+            d["symbol"] = self.symbol
+        return d
 
     @property
     def id(self):
@@ -230,17 +282,31 @@ class Order:
             OrderStatus.LOSSCUT,
         ]
 
+    @property
+    def bars(self) -> Bars:
+        return self._bars
+
+    @property
+    def executed_i(self):
+        return self._executed_i
+
     @property
     def executed_item(self):
-        return self._executed_item
+        if self._executed_i is not None:
+            return self._bars[self._executed_i]
 
     @property
     def is_expired(self):
         return self._status in [OrderStatus.EXPIRED, OrderStatus.EXPIRED_EXECUTED]
 
+    @property
+    def expired_i(self):
+        return self._expired_i
+
     @property
     def expired_item(self):
-        return self._expired_item
+        if self._expired_i is not None:
+            return self._bars[self._expired_i]
 
     @property
     def expire_time(self):
@@ -256,11 +322,11 @@ class Order:
 
     @property
     def fee(self):
-        if self.executed_item is None:
+        if self._executed_i is None:
             return 0
         else:
             k = "taker_fee" if self.exec_type == ExecutionType.MARKET else "maker_fee"
-            return self.executed_item.get(k, 0)
+            return self._bars.get(k, self._executed_i, 0)
 
     @property
     def entried_at(self) -> pd.Timestamp:
@@ -268,52 +334,46 @@ class Order:
 
     @property
     def executed_at(self) -> pd.Timestamp:
-        if self._executed_item is not None:
-            return self._executed_item["timestamp"]
+        if self._executed_i is not None:
+            return self._bars.timestamp(self._executed_i)
 
     @property
     def expired_at(self) -> pd.Timestamp:
-        if self._expired_item is not None:
-            return self._expired_item["timestamp"]
+        if self._expired_i is not None:
+            return self._bars.timestamp(self._expired_i)
 
-    @classmethod
-    def _validate_item(cls, item):
-        assert isinstance(item["timestamp"], pd.Timestamp)
-
-    def _on_step(self, item: dict):
+    def _on_step(self, i: int):
         raise NotImplementedError
 
     def cancel(self):
         self._status = OrderStatus.CANCELED
 
-    def _executed(self, item, *, force_market=False, market_price_key=None):
-        self._executed_item = item
+    def _executed(self, i: int, *, force_market=False, market_price_key=None):
+        self._executed_i = i
 
         if self.exec_type == ExecutionType.MARKET or force_market:
-            self.price = self._get_market_price(item, market_price_key)
+            self.price = self._get_market_price(i, market_price_key)
             self.exec_type = ExecutionType.MARKET
 
         self._status = OrderStatus.EXECUTED
 
         debug_log("EXECUTED")
 
-    def _expired(self, item: dict):
-        self._expired_item = item
+    def _expired(self, i: int):
+        self._expired_i = i
         self._status = OrderStatus.EXPIRED
         debug_log("EXPIRED")
 
-    def _check_execution(self, item: dict):
-        self._validate_item(item)
-
+    def _check_execution(self, i: int):
         if self.exec_type == ExecutionType.MARKET:
-            assert item["timestamp"] >= self._entry_time
+            assert self._bars.timestamp(i) >= self._entry_time
             rtn = True
 
         elif self.exec_type == ExecutionType.LIMIT:
-            rtn = check_limit(item, self.side, self.price)
+            rtn = check_limit(self._bars, i, self.side, self.price)
 
         elif self.exec_type == ExecutionType.STOP:
-            rtn = check_stop(item, self.side, self.price)
+            rtn = check_stop(self._bars, i, self.side, self.price)
 
         else:
             raise RuntimeError
@@ -322,38 +382,46 @@ class Order:
 
         return rtn
 
-    def _check_expiration(self, item: dict):
-        self._validate_item(item)
-        rtn = item["timestamp"] >= self.expire_time
-        # debug_log("CHECK EXPIRE", f"{rtn} ({item['timestamp']} > {self.expire_time})")
+    def _check_expiration(self, i: int):
+        rtn = self._bars.timestamp(i) >= self.expire_time
+        # debug_log("CHECK EXPIRE", f"{rtn} ({i} > {self.expire_time})")
         return rtn
 
-    def _set_entry_and_expire_time(self, entry_time: Union[str, pd.Timestamp]):
+    def _set_entry_and_expire_time(
+        self, entry_time: Union[str, pd.Timestamp], expire_time: pd.Timestamp = None
+    ):
         """エントリー時間と失効時間をセットする。
 
         :param entry_time: str or datetime
+        :param expire_time: 計算済みの失効時間（``calc_expire_time``）
         :return:
         """
         if isinstance(entry_time, str):
             entry_time = pd.to_datetime(entry_time)
 
         self._entry_time = entry_time
-        self._expire_time = self._entry_time + timedelta(seconds=self.expire_seconds)
+        if expire_time is None:
+            expire_time = self.calc_expire_time(entry_time, self.expire_seconds)
+        self._expire_time = expire_time
+
+    @staticmethod
+    def calc_expire_time(entry_time: pd.Timestamp, expire_seconds) -> pd.Timestamp:
+        return entry_time + timedelta(seconds=expire_seconds)
 
-    def _get_market_price(self, item, market_price_key=None):
+    def _get_market_price(self, i: int, market_price_key=None):
         market_price_key = market_price_key or self._market_price_key
         if market_price_key == "best":
-            assert "bid" in item and "ask" in item
+            assert "bid" in self._bars and "ask" in self._bars
             if self.side == Side.BUY:
-                return item["ask"] + self.market_slippage
+                return self._bars.value("ask", i) + self.market_slippage
             else:
-                return item["bid"] - self.market_slippage
+                return self._bars.value("bid", i) - self.market_slippage
         else:
-            assert market_price_key in item
+            assert market_price_key in self._bars
             if self.side == Side.BUY:
-                return item[market_price_key] + self.market_slippage
+                return self._bars.value(market_price_key, i) + self.market_slippage
             else:
-                return item[market_price_key] - self.market_slippage
+                return self._bars.value(market_price_key, i) - self.market_slippage
 
 
 class OpenOrder(Order):
@@ -366,6 +434,9 @@ class OpenOrder(Order):
         expire_seconds: int = DEFAULT_EXPIRE_SECONDS,
         market_price_key: str = "open",
         market_slippage: int = 0,
+        bars: Bars = None,
+        symbol: str = None,
+        expire_time: pd.Timestamp = None,
     ):
         super().__init__(
             side,
@@ -376,21 +447,83 @@ class OpenOrder(Order):
             expire_seconds=expire_seconds,
             market_price_key=market_price_key,
             market_slippage=market_slippage,
+            bars=bars,
+            symbol=symbol,
+            expire_time=expire_time,
         )
 
-    def _on_step(self, cur: dict):
+    def _on_step(self, i: int):
         debug_log("STEP (ORDER)", self)
 
         assert not self.is_done, f"Invalid order status: {self.status}"
 
-        if self._check_execution(cur):
-            self._executed(cur)
-        elif self._check_expiration(cur):
-            self._expired(cur)
+        if self._check_execution(i):
+            self._executed(i)
+        elif self._check_expiration(i):
+            self._expired(i)
         else:
             debug_log("NEXT")
 
 
+class ExpiredQuote(NamedTuple):
+    """``CloseOrder``の指値更新時に失効した注文の記録。
+
+    ``keep_expired_orders=True``の場合に更新のたびに1つ作られる。
+    """
+
+    id: int
+    side: Side
+    exec_type: ExecutionType
+    price: float
+    entried_at: pd.Timestamp
+    expire_time: pd.Timestamp
+    expired_at: pd.Timestamp
+    status: OrderStatus = OrderStatus.EXPIRED
+
+    @property
+    def is_expired(self):
+        return True
+
+    @property
+    def is_executed(self):
+        return False
+
+    @property
+    def entry_time(self):
+        return self.entried_at
+
+    def as_dict(self):
+        return {
+            "side": self.side.name,
+            "exec_type": self.exec_type.name,
+            "price": self.price,
+            "status": self.status.name,
+            "entried_at": self.entried_at,
+            "expire_time": self.expire_time,
+            "expired_at": self.expired_at,
+        }
+
+
+class ExitSpec(NamedTuple):
+    """``CloseOrder``の宣言的な指定。全てバーのカラム名で与え、ユーザー関数を呼ばずに
+    評価する（``update_fn_or_price_key``・``market_entry_fn``の代わり）。
+
+    >>> spec = ExitSpec("close", offset=500, requote_seconds=60, losscut_key="stop")
+    >>> tester.exit(p, ExecutionType.LIMIT, spec=spec)
+    """
+
+    # 指値のカラム。失効のたびにそのバーの値 + ``offset``に更新する
+    price_key: str = None
+    offset: float = 0
+    # 指値の更新間隔（``expire_seconds``）
+    requote_seconds: float = None
+    # ロスカット価格のカラム。バー``i``では直前のバー``i - 1``の値を使う（NaN・0以下の場合
+    # はロスカットしない）
+    losscut_key: str = None
+    # 成行決済の可否（bool）のカラム。``market_entry_fn``と同じタイミングで参照する
+    market_entry_key: str = None
+
+
 class CloseOrder(Order):
     def __init__(
         self,
@@ -429,7 +562,18 @@ class CloseOrder(Order):
         market_entry_fn: Callable[[dict, "CloseOrder"], bool] = None,
         force_market_entry_seconds: int = float("inf"),
         keep_expired_orders: bool = False,
+        bars: Bars = None,
+        expire_time: pd.Timestamp = None,
+        # 宣言的な指定（``ExitSpec``）。``update_fn_or_price_key``・``market_entry_fn``
+        # とは併用できない
+        spec: ExitSpec = None,
     ):
+        if spec is not None:
+            assert update_fn_or_price_key is None and market_entry_fn is None
+            update_fn_or_price_key = spec.price_key
+            if spec.requote_seconds is not None:
+                expire_seconds = spec.requote_seconds
+
         # if (
         #         expire_seconds < DEFAULT_EXPIRE_SECONDS and
         #         exec_type != ExecutionType.MARKET and
@@ -459,6 +603,9 @@ class CloseOrder(Order):
             expire_seconds=expire_seconds,
             market_price_key=market_price_key,
             market_slippage=market_slippage,
+            bars=bars,
+            symbol=position.symbol,
+            expire_time=expire_time,
         )
         self._position: Position = position
         # このCloseOrderへのポインターをセット
@@ -473,81 +620,120 @@ class CloseOrder(Order):
         self._expired_orders = []
         self._keep_expired_orders = keep_expired_orders
 
+        self._price_offset = 0
+        self._losscut_key = None
+        self._market_entry_key = None
+        if spec is not None:
+            self._price_offset = spec.offset
+            self._losscut_key = spec.losscut_key
+            self._market_entry_key = spec.market_entry_key
+        self._bind_columns()
+        # ``__market_entry``の評価結果（同じバーで2回評価しない）
+        self._market_entry_cache = (None, None)
+
+    def __getstate__(self):
+        # カラム（list）はpickleせず、読み込み時に``bars``から参照し直す
+        state = super().__getstate__()
+        del state["_losscut_column"], state["_market_entry_column"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind_columns()
+
+    def _bar_indices(self):
+        indices = super()._bar_indices()
+        if self._position.close_order is self:
+            indices.append(self._position.close_i)
+        return indices
+
+    def _bind_columns(self):
+        self._losscut_column = None
+        self._market_entry_column = None
+        if not isinstance(self._bars, Bars):
+            # 終了した注文（``BarRows``）はカラムを参照しない
+            return
+        if self._losscut_key is not None:
+            self._losscut_column = self._bars.column(self._losscut_key)
+        if self._market_entry_key is not None:
+            self._market_entry_column = self._bars.column(self._market_entry_key)
+
     def _repr(self):
         return super()._repr() + f"/{self.position}"
 
-    def _on_step(self, item: dict):
+    def _on_step(self, i: int):
         debug_log("STEP (ORDER)", self)
 
         assert self._position is not None, "Missing ``position``"
         assert self.entry_time is not None, "Missing ``entry_time``"
 
-        if self._losscut_price > 0:
-            if check_stop(item, self.side, self._losscut_price):
-                self._losscut(item)
+        losscut_price = self.__losscut_price(i)
+        if losscut_price > 0:
+            if check_stop(
+                self._bars, i, self.side, losscut_price
+            ) and not self.__exit_before_losscut(i, losscut_price):
+                self._losscut(i)
                 return
 
-        if item["timestamp"] < self.entry_time:
+        if self._bars.timestamp(i) < self.entry_time:
             # entry wait中
             debug_log("WAITING")
             return
 
         # 約定確認
-        is_executed = self._check_execution(item)
+        is_executed = self._check_execution(i)
 
         # 成行注文時に判定用関数が与えられている場合上書きする。主に``is_executed``をFalseに書き換える。（i.e., 待機時間は終了し
         # ていても条件を"満たさなければ"執行しない）。
-        if (
-            is_executed
-            and self.exec_type == ExecutionType.MARKET
-            and self._market_entry_fn is not None
-        ):
-            is_executed = self._market_entry_fn(item, self)
+        if is_executed and self.exec_type == ExecutionType.MARKET:
+            market_entry = self.__market_entry(i)
+            if market_entry is not None:
+                is_executed = market_entry
 
         if is_executed:
-            self._executed(item)
+            self._executed(i)
 
         else:
             # (1) ``force_market_entry_seconds``が与えられた場合
             # (2) ``market_entry_fn``・LIMIT注文の場合
-            if self.__need_force_market_entry(item):
-                self._executed(item, force_market=True)
+            if self.__need_force_market_entry(i):
+                self._executed(i, force_market=True)
 
             else:
                 # 約定しなかった場合、失効の有無を確認
-                if self._check_expiration(item):
+                if self._check_expiration(i):
                     if self.exec_type == ExecutionType.MARKET:
                         # 成行注文は失効時に執行
                         # ``market_entry_fn``がNoneの場合：n秒後に必ず決済するロジック
                         # ``market_entry_fn``がNoneでない場合：決済タイミングが来ればn秒以内に成行決済するロジック
-                        self._expired_and_executed(item)
+                        self._expired_and_executed(i)
                     else:
                         # 指値注文の場合は失効時に更新
-                        self._update(item)
+                        self._update(i)
 
     def cancel(self):
         super().cancel()
         self._position.clear_closing_order()
 
-    def _executed(self, item, *, force_market=False, market_price_key=None):
+    def _executed(self, i: int, *, force_market=False, market_price_key=None):
         super()._executed(
-            item, force_market=force_market, market_price_key=market_price_key
+            i, force_market=force_market, market_price_key=market_price_key
         )
-        self._position.close(item, self)
+        self._position.close(i, self)
         self._position.clear_closing_order()
 
-    def _expired(self, item: dict):
-        super()._expired(item)
+    def _expired(self, i: int):
+        super()._expired(i)
         self._position.clear_closing_order()
 
-    def _losscut(self, item: dict):
+    def _losscut(self, i: int):
         market_price_key = "high" if self.side == Side.BUY else "low"
-        self._executed(item, force_market=True, market_price_key=market_price_key)
+        self._executed(i, force_market=True, market_price_key=market_price_key)
         self._status = OrderStatus.LOSSCUT
 
-    def _expired_and_executed(self, item: dict, market_price_key=None):
-        self._expired(item)
-        self._executed(item, force_market=True, market_price_key=market_price_key)
+    def _expired_and_executed(self, i: int, market_price_key=None):
+        self._expired(i)
+        self._executed(i, force_market=True, market_price_key=market_price_key)
         self._status = OrderStatus.EXPIRED_EXECUTED
 
     @property
@@ -555,13 +741,13 @@ class CloseOrder(Order):
         return self._position
 
     @property
-    def expired_orders(self):
+    def expired_orders(self) -> list[ExpiredQuote]:
         return self._expired_orders
 
-    def _update(self, item: dict):
+    def _update(self, i: int):
         # 失効
         if self._update_fn_or_price_key is None:
-            self._expired(item)
+            self._expired(i)
             return False
 
         assert not self.is_executed, "Already executed"
@@ -569,37 +755,80 @@ class CloseOrder(Order):
         # 指値変更
         # 失効注文を記録
         if self._keep_expired_orders:
-            expired_order = copy.deepcopy(self)
-            expired_order._expired(item)
-            self._expired_orders.append(expired_order)
+            self._expired_orders.append(
+                ExpiredQuote(
+                    self.id,
+                    self.side,
+                    self.exec_type,
+                    self.price,
+                    self.entry_time,
+                    self.expire_time,
+                    self._bars.timestamp(i),
+                )
+            )
 
         # ``price``をアップデート
         if isinstance(self._update_fn_or_price_key, str):
-            self.price = item[self._update_fn_or_price_key]
+            self.price = (
+                self._bars.value(self._update_fn_or_price_key, i) + self._price_offset
+            )
         else:
-            self.price = self._update_fn_or_price_key(item, self)
+            self.price = self._update_fn_or_price_key(self._bars[i], self)
 
         # ``entry_time``と``expire_time``の更新
-        # 失効時のitemを削除
-        self._expired_item = None
+        # 失効時のバーを削除
+        self._expired_i = None
 
         # ``entry_time``を失効タイミングで上書きして、さらに失効タイミングを延長
-        self._set_entry_and_expire_time(item["timestamp"])
+        self._set_entry_and_expire_time(self._bars.timestamp(i))
 
         self._status = OrderStatus.ORDERING
 
         debug_log("EXTEND ORDER")
 
-    def __need_force_market_entry(self, item):
+    def __losscut_price(self, i: int):
+        if self._losscut_column is None:
+            return self._losscut_price
+        if i == 0:
+            return -1
+        price = self._losscut_column[i - 1]
+        # NaNの場合も比較はFalseになる
+        return price if price > 0 else -1
+
+    def __market_entry(self, i: int):
+        # 成行決済の可否。判定器がない場合はNone
+        if self._market_entry_cache[0] == i:
+            return self._market_entry_cache[1]
+
+        if self._market_entry_column is not None:
+            rtn = bool(self._market_entry_column[i])
+        elif self._market_entry_fn is not None:
+            rtn = self._market_entry_fn(self._bars[i], self)
+        else:
+            rtn = None
+
+        self._market_entry_cache = (i, rtn)
+        return rtn
+
+    def __exit_before_losscut(self, i: int, losscut_price: float):
+        # 同じバーで指値にも触れている場合、細かい足があればどちらが先かを判定する
+        if (
+            self._bars.fine is None
+            or self.exec_type != ExecutionType.LIMIT
+            or self._bars.timestamp(i) < self.entry_time
+            or not check_limit(self._bars, i, self.side, self.price)
+        ):
+            return False
+
+        side = 1 if self._position.side == Side.BUY else -1
+        return self._bars.exit_first(i, side, self.price, losscut_price)
+
+    def __need_force_market_entry(self, i: int):
         if (
-            item["timestamp"] - self._initial_entry_time
+            self._bars.timestamp(i) - self._initial_entry_time
         ).seconds > self._force_market_entry_seconds:
             return True
-        elif (
-            self.exec_type == ExecutionType.LIMIT
-            and self._market_entry_fn is not None
-            and self._market_entry_fn(item, self)
-        ):
+        elif self.exec_type == ExecutionType.LIMIT and self.__market_entry(i):
             return True
         else:
             return False
@@ -0,0 +1,170 @@
+"""asyncioによるライブ（ペーパートレード）実行。
+
+バックテストと同じ``BackTester``の約定ロジック（``Status``・``Order._on_step``）を、非
+同期に届くバーに対してインクリメンタルに回す。バーの到着から戦略の判断（コルーチンの
+完了）までのレイテンシーをバーごとに記録する。
+
+>>> async def strategy(tester, i, item):
+...     tester.entry(Side.BUY, ExecutionType.MARKET)
+>>> runner = LiveRunner(strategy)
+>>> asyncio.run(runner.run(replay(df)))
+>>> runner.latency_report()
+
+バーの供給元として、DataFrameを再生する``replay``とCSVファイルを追跡する``tail_csv``
+を用意している。実際の取引所のフィードは``{"timestamp": ..., "open": ..., ...}``を
+yieldする非同期イテレータとして実装すればよい。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Union
+
+import numpy as np
+import pandas as pd
+
+from .bars import Bars
+from .tester import BackTester
+from .utils import set_log_level
+
+LiveStrategy = Callable[[BackTester, int, dict], Union[Awaitable[None], None]]
+
+
+class LiveRunner:
+    """非同期イテレータで届くバーごとに注文を評価し、戦略を呼ぶ。
+
+    戦略は``strategy(tester, i, item)``で、コルーチン関数・通常の関数のどちらでもよい。
+    ``tester``は通常の``BackTester``なので、``entry``・``exit``・``status``などはバック
+    テストと同じものを使う。
+    """
+
+    def __init__(self, strategy: LiveStrategy, log_level=logging.INFO):
+        self._strategy = strategy
+        self._tester = None
+        self._latencies = []
+
+        set_log_level(log_level)
+
+    async def run(self, bars: AsyncIterator[dict], finish=True):
+        """``bars``が尽きるまで実行する。
+
+        :param bars: "timestamp"（``pd.Timestamp``）を含むdictをyieldする非同期イテレー
+            タ。2本目以降のキーは1本目と同じであること
+        :param finish: 終了時に未決済のポジションを最後のバーで決済するか
+        """
+        self._tester = None
+        self._latencies = []
+
+        async for item in bars:
+            t = time.perf_counter()
+
+            if self._tester is None:
+                self._tester = BackTester.from_bars(Bars(pd.DataFrame([item])))
+                self._tester.reset()
+                i = 0
+            else:
+                i = self._tester._data.append(item)
+
+            self._tester._step(i)
+            rtn = self._strategy(self._tester, i, self._tester._data[i])
+            if inspect.isawaitable(rtn):
+                await rtn
+
+            self._latencies.append(time.perf_counter() - t)
+
+        if finish and self._tester is not None:
+            self._tester._finish()
+
+    def latency_report(self) -> pd.Series:
+        """バーの到着から戦略の完了までのレイテンシー（秒）の要約統計量。"""
+        s = pd.Series(self.latencies, name="latency_seconds", dtype=np.float64)
+        return s.describe(percentiles=[0.5, 0.9, 0.99])
+
+    @property
+    def tester(self) -> BackTester:
+        return self._tester
+
+    @property
+    def latencies(self) -> np.ndarray:
+        """バーごとのレイテンシー（秒）。"""
+        return np.array(self._latencies, dtype=np.float64)
+
+
+async def replay(df: pd.DataFrame, speed: float = None) -> AsyncIterator[dict]:
+    """DataFrameのバーを順にyieldする（取引所のフィードの代わり）。
+
+    :param df: indexが"timestamp"のohlcv
+    :param speed: Noneの場合は待たずに流す。数値の場合はバーの時刻の間隔を``speed``倍
+        速にした実時間で流す
+    """
+    assert df.index.name == "timestamp"
+    assert isinstance(df.index, pd.DatetimeIndex)
+
+    prev = None
+    for item in df.sort_index().reset_index().to_dict("records"):
+        if speed is not None and prev is not None:
+            await asyncio.sleep((item["timestamp"] - prev).total_seconds() / speed)
+        else:
+            # 他のタスクに制御を渡す
+            await asyncio.sleep(0)
+        prev = item["timestamp"]
+        yield item
+
+
+async def tail_csv(
+    path: str,
+    poll_interval: float = 1.0,
+    idle_timeout: float = None,
+    dtypes: dict = None,
+) -> AsyncIterator[dict]:
+    """CSVファイルに追記された行をバーとしてyieldする（``tail -f``相当）。
+
+    1行目はヘッダーで、"timestamp"カラムを含むこと。書きかけの行（改行で終わっていな
+    い行）は次の読み込みまで保留する。
+
+    :param poll_interval: 追記を確認する間隔（秒）
+    :param idle_timeout: 追記がない状態がこの秒数続いたら終了する。Noneの場合は終了し
+        ない
+    :param dtypes: カラムごとの型変換（デフォルトはtimestamp以外をfloat）
+    """
+    dtypes = dtypes or {}
+    header, buffer = None, ""
+    last_update = time.monotonic()
+
+    with open(path, "r") as f:
+        while True:
+            chunk = f.read()
+            if chunk:
+                last_update = time.monotonic()
+                buffer += chunk
+                *lines, buffer = buffer.split("\n")
+
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    values = line.strip().split(",")
+                    if header is None:
+                        header = values
+                        assert "timestamp" in header
+                        continue
+                    yield _parse_row(header, values, dtypes)
+            elif (
+                idle_timeout is not None
+                and time.monotonic() - last_update >= idle_timeout
+            ):
+                return
+            else:
+                await asyncio.sleep(poll_interval)
+
+
+def _parse_row(header, values, dtypes):
+    item = {}
+    for k, v in zip(header, values):
+        if k == "timestamp":
+            item[k] = pd.Timestamp(v)
+        else:
+            item[k] = dtypes.get(k, float)(v)
+    return item
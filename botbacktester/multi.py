@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import logging
+from typing import Callable, Union
+
+import pandas as pd
+
+from .bars import Bars
+from .items import reset_id_counter
+from .progress import make_progress
+from .tester import BackTester
+from .utils import set_log_level
+
+Strategy = Callable[[BackTester, int, dict], None]
+
+
+class MultiBackTester:
+    """1本のバーのデータを共有して、複数の戦略を1回のループでシミュレーションする。
+
+    戦略ごとに独立した``BackTester``（``Status``・注文/ポジション履歴）を持ち、各バーで
+    全ての戦略の注文を評価した後、``strategy(tester, i, item)``を順に呼ぶ。バーのデータ
+    （``Bars``）とバーごとのdictは全戦略で共有される。
+
+    >>> mt = MultiBackTester(df, {"a": strategy_a, "b": strategy_b})
+    >>> mt.run()
+    >>> mt.get_result_df()
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        strategies: Union[dict[str, Strategy], list[Strategy]],
+        log_level=logging.INFO,
+        profile=False,
+        fine=None,
+    ):
+        assert df.index.name == "timestamp"
+        assert isinstance(df.index, pd.DatetimeIndex)
+
+        if not isinstance(strategies, dict):
+            strategies = {i: s for (i, s) in enumerate(strategies)}
+
+        self._data = Bars(df.sort_index().reset_index(), fine=fine)
+        self._strategies = strategies
+        self._testers = {
+            name: BackTester.from_bars(self._data, profile=profile)
+            for name in strategies
+        }
+        self._cur_i = None
+
+        set_log_level(log_level)
+
+    def run(self, stop_i=None, progress="auto"):
+        """シミュレーションを実行する。
+
+        :param stop_i: ``BackTester.start``と同じ
+        :param progress: ``BackTester.start``と同じ。``ProgressInfo``のorder_num等は全戦
+            略の合計
+        """
+        for tester in self._testers.values():
+            tester.reset()
+        reset_id_counter()
+
+        items = list(zip(self._strategies.values(), self._testers.values()))
+
+        progress = make_progress(progress)
+        next_progress_i = progress.open(len(self._data))
+
+        try:
+            for i in range(len(self._data)):
+                self._cur_i = i
+                for _, tester in items:
+                    tester._step(i)
+
+                if i >= next_progress_i:
+                    next_progress_i = progress.update(self, i)
+
+                if stop_i and i == stop_i:
+                    break
+
+                item = self._data[i]
+                for strategy, tester in items:
+                    strategy(tester, i, item)
+        finally:
+            progress.close(self, self._cur_i)
+
+        if stop_i is None:
+            for tester in self._testers.values():
+                tester._finish()
+
+    def get_result_df(self) -> pd.DataFrame:
+        """全戦略の結果。indexは(strategy, timestamp)。"""
+        dfs = {
+            name: tester.get_result_df()
+            for (name, tester) in self._testers.items()
+            if len(tester.position_history)
+        }
+        assert len(dfs) > 0, "Results not found"
+        return pd.concat(dfs, names=["strategy"])
+
+    @property
+    def testers(self) -> dict[str, BackTester]:
+        return self._testers
+
+    @property
+    def status(self) -> "_MultiStatus":
+        return _MultiStatus([t.status for t in self._testers.values()])
+
+    def __getitem__(self, name) -> BackTester:
+        return self._testers[name]
+
+
+class _MultiStatus:
+    # 進捗通知用に全戦略の``Status``を合計したもの
+    def __init__(self, statuses):
+        self._statuses = statuses
+
+    @property
+    def cum_gain(self):
+        return sum([s.cum_gain for s in self._statuses])
+
+    @property
+    def order_num(self):
+        return sum([s.order_num for s in self._statuses])
+
+    @property
+    def position_num(self):
+        return sum([s.position_num for s in self._statuses])
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .bars import Bars
+from .items import Position, reset_id_counter
+from .progress import make_progress
+from .status import PortfolioStatus
+from .tester import BackTester
+from .utils import set_log_level
+
+
+class _SymbolBackTester(BackTester):
+    # 銘柄ごとのBackTester。注文のエントリー時刻はポートフォリオ全体の現在時刻とする。
+    # 他の銘柄のイベントで出した注文は、この銘柄のその時刻のバーがまだ処理されていない
+    # 場合がある。そのバーの価格は注文を決めた時点で既知なので、約定を判定しない（先読
+    # みになり、結果が銘柄の順序に依存する）。
+    def __init__(self, bars: Bars, symbol, portfolio: "PortfolioBackTester"):
+        self._init(bars, False)
+        self._symbol = symbol
+        self._portfolio = portfolio
+        # (注文, 注文を決めた時刻)。次の``_step``まで
+        self._deferred = []
+
+    def reset(self):
+        super().reset()
+        self._deferred = []
+
+    def entry(self, *args, **kwargs):
+        return self._defer([super().entry(*args, **kwargs)])[0]
+
+    def exit(self, *args, **kwargs):
+        return self._defer([super().exit(*args, **kwargs)])[0]
+
+    def entry_many(self, *args, **kwargs):
+        return self._defer(super().entry_many(*args, **kwargs))
+
+    def exit_many(self, *args, **kwargs):
+        return self._defer(super().exit_many(*args, **kwargs))
+
+    def _defer(self, orders):
+        now = self._portfolio.now
+        if self._cur_i is None or self._data.timestamp(self._cur_i) < now:
+            self._deferred += [(o, now) for o in orders]
+        return orders
+
+    def _step(self, i: int):
+        if len(self._deferred) == 0:
+            return super()._step(i)
+
+        # 決めた時刻以前のバーでは評価しない（同じ時刻のバーは高々1本）
+        ts = self._data.timestamp(i)
+        skipped = [o for (o, t) in self._deferred if t >= ts and not o.is_done]
+        self._deferred = []
+
+        self._status.remove_orders(skipped)
+        super()._step(i)
+        self._status.add_orders(skipped)
+
+    def _entry_time(self):
+        return self._portfolio.now
+
+
+class PortfolioBackTester:
+    """複数銘柄のバックテスト。
+
+    銘柄ごとのohlcvの時刻をk-wayマージした1本のイベント列（(symbol, i, item)）で進め
+    る。外部結合したDataFrameは作らない。各イベントでは、その銘柄の注文のみを評価する。
+    注文・ポジションは``symbol``を持つ。
+
+    >>> pt = PortfolioBackTester({"BTC": df_btc, "ETH": df_eth})
+    >>> for symbol, i, item in pt.start():
+    ...     pt.entry(symbol, Side.BUY, ExecutionType.MARKET)
+    """
+
+    def __init__(self, dfs: dict[str, pd.DataFrame], log_level=logging.INFO):
+        for df in dfs.values():
+            assert df.index.name == "timestamp"
+            assert isinstance(df.index, pd.DatetimeIndex)
+            assert len(df) > 0
+
+        self._testers = {
+            symbol: _SymbolBackTester(Bars(df.sort_index().reset_index()), symbol, self)
+            for (symbol, df) in dfs.items()
+        }
+        self._status = None
+        self._now = None
+        self._cur_symbol = None
+
+        set_log_level(log_level)
+
+    def start(self, progress="auto"):
+        """シミュレーションを開始する。時刻順に(symbol, i, item)をyieldする。
+
+        同時刻のバーは``dfs``に与えた銘柄の順に処理される。他の銘柄のイベントで出した注
+        文は、その銘柄の同じ時刻のバーでは約定しない（銘柄の順序によらず、注文を出した
+        時刻より後のバーで約定する）。
+
+        :param progress: ``BackTester.start``と同じ（バー数は全銘柄の合計）
+        """
+        self.reset()
+
+        events = heapq.merge(
+            *[
+                self.__iter_events(k, tester)
+                for (k, tester) in enumerate(self._testers.values())
+            ]
+        )
+        symbols = list(self._testers.keys())
+        testers = list(self._testers.values())
+
+        progress = make_progress(progress)
+        next_progress_i = progress.open(sum([len(t._data) for t in testers]))
+        n = -1
+
+        try:
+            for n, (ts, k, i) in enumerate(events):
+                tester = testers[k]
+                self._now = tester._data.timestamp(i)
+                self._cur_symbol = symbols[k]
+                tester._step(i)
+
+                if n >= next_progress_i:
+                    next_progress_i = progress.update(self, n)
+
+                yield symbols[k], i, tester._data[i]
+        finally:
+            progress.close(self, n)
+
+        for tester in testers:
+            tester._finish()
+
+    def reset(self):
+        for tester in self._testers.values():
+            tester.reset()
+        reset_id_counter()
+
+        self._status = PortfolioStatus(
+            {symbol: t.status for (symbol, t) in self._testers.items()}
+        )
+        self._now = None
+        self._cur_symbol = None
+
+    def entry(self, symbol, side, exec_type, **kwargs):
+        """``symbol``の新規注文。``kwargs``は``BackTester.entry``と同じ。"""
+        return self._testers[symbol].entry(side, exec_type, **kwargs)
+
+    def exit(self, position: Position, exec_type, **kwargs):
+        """決済注文。``kwargs``は``BackTester.exit``と同じ。"""
+        return self._testers[position.symbol].exit(position, exec_type, **kwargs)
+
+    def orders(self, symbol=None, side=None, settle_type=None, exec_type=None):
+        return self._status.orders(symbol, side, settle_type, exec_type)
+
+    def positions(self, symbol=None, side=None, non_closing=False):
+        return self._status.positions(symbol, side, non_closing)
+
+    def latest(self, symbol) -> dict:
+        """``symbol``の直近（現在時刻までに処理済み）のバー。未処理の場合はNone。"""
+        tester = self._testers[symbol]
+        if tester._cur_i is None:
+            return None
+        return tester._data[tester._cur_i]
+
+    def get_result_df(self):
+        dfs = [
+            t.get_result_df()
+            for t in self._testers.values()
+            if t.position_history is not None and len(t.position_history)
+        ]
+        assert len(dfs) > 0, "Results not found"
+
+        df = pd.concat(dfs)
+        df["symbol"] = df.oo_symbol
+        df.drop(columns=["oo_symbol", "co_symbol"], inplace=True)
+
+        return df.sort_index(kind="stable")
+
+    @property
+    def status(self) -> PortfolioStatus:
+        return self._status
+
+    @property
+    def now(self) -> pd.Timestamp:
+        return self._now
+
+    @property
+    def symbol(self):
+        """現在のイベントの銘柄。"""
+        return self._cur_symbol
+
+    @property
+    def position_history(self) -> list[Position]:
+        positions = []
+        for t in self._testers.values():
+            positions += t.position_history
+        return sorted(positions, key=lambda p: p.id)
+
+    @property
+    def testers(self) -> dict[str, BackTester]:
+        return self._testers
+
+    @staticmethod
+    def __iter_events(k, tester):
+        ts = tester._data.array("timestamp").astype("datetime64[ns]").view(np.int64)
+        return zip(ts.tolist(), itertools.repeat(k), range(len(ts)))
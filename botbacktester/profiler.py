@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+
+class StepProfiler:
+    """``BackTester``のステップループの計測器。
+
+    フェーズごとの経過時間（秒）と呼び出し回数、各バー時点の待機注文数を記録する。
+    ``BackTester(df, profile=True)``で有効化される。
+    """
+
+    def __init__(self):
+        self._seconds = defaultdict(float)
+        self._calls = defaultdict(int)
+        self._resting_orders = []
+
+    def add(self, phase: str, seconds: float, calls: int = 1):
+        self._seconds[phase] += seconds
+        self._calls[phase] += calls
+
+    def add_resting_orders(self, n: int):
+        self._resting_orders.append(n)
+
+    def report(self) -> pd.DataFrame:
+        """フェーズごとの集計結果。
+
+        :return: index: phase, columns: calls, total_seconds, mean_seconds, ratio
+        """
+        phases = list(self._seconds.keys())
+        df = pd.DataFrame(
+            {
+                "calls": [self._calls[p] for p in phases],
+                "total_seconds": [self._seconds[p] for p in phases],
+            },
+            index=pd.Index(phases, name="phase"),
+        )
+        df["mean_seconds"] = df.total_seconds / df.calls.clip(lower=1)
+        total = df.total_seconds.sum()
+        df["ratio"] = df.total_seconds / total if total > 0 else 0.0
+        return df.sort_values("total_seconds", ascending=False)
+
+    def resting_order_histogram(self) -> pd.Series:
+        """待機注文数ごとのバー数。"""
+        counts = np.bincount(np.asarray(self._resting_orders, dtype=np.int64))
+        s = pd.Series(counts, name="bars")
+        s.index.name = "resting_orders"
+        return s[s > 0]
+
+    @property
+    def resting_orders(self) -> np.ndarray:
+        return np.asarray(self._resting_orders, dtype=np.int64)
@@ -0,0 +1,159 @@
+import logging
+import time
+from collections import namedtuple
+from typing import Callable, Optional, Union
+
+import tqdm
+
+from .utils import get_log_level
+
+ProgressInfo = namedtuple(
+    "ProgressInfo",
+    (
+        "i",
+        "n",
+        "elapsed",
+        "bars_per_second",
+        "order_num",
+        "position_num",
+        "cum_gain",
+    ),
+)
+
+
+class Progress:
+    """``BackTester.start``の進捗通知の基底クラス。
+
+    ``update``は毎バーではなく、前回の``update``が返したバー番号に達した時にのみ呼ば
+    れる。ループ側のコストは整数比較のみとなる。
+    """
+
+    def open(self, n: int) -> int:
+        """ループ開始時に呼ばれる。最初に``update``を呼ぶバー番号を返す。"""
+        return n
+
+    def update(self, tester, i: int) -> int:
+        """次に``update``を呼ぶバー番号を返す。"""
+        return float("inf")
+
+    def close(self, tester, i: Optional[int]):
+        """ループ終了時に呼ばれる。``i``は最後に処理したバー番号。"""
+        pass
+
+
+class NoProgress(Progress):
+    def open(self, n):
+        return float("inf")
+
+
+class TqdmProgress(Progress):
+    def __init__(self, every_bars: int = 1, **tqdm_kwargs):
+        self._every_bars = every_bars
+        self._tqdm_kwargs = tqdm_kwargs
+        self._bar = None
+
+    def open(self, n):
+        self._bar = tqdm.tqdm(total=n, **self._tqdm_kwargs)
+        return 0
+
+    def update(self, tester, i):
+        self._bar.update(i + 1 - self._bar.n)
+        return i + self._every_bars
+
+    def close(self, tester, i):
+        if i is not None:
+            self._bar.update(i + 1 - self._bar.n)
+        self._bar.close()
+
+
+class CallbackProgress(Progress):
+    """``every_bars``バーごと、または``every_seconds``秒ごとに``fn(ProgressInfo)``を呼ぶ。
+
+    ``every_bars``と``every_seconds``はどちらか一方のみ与える。``every_seconds``の判定
+    は``check_bars``バーごとにしか時刻を取得しない。
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[ProgressInfo], None],
+        *,
+        every_bars: Optional[int] = None,
+        every_seconds: Optional[float] = None,
+        check_bars: int = 1000,
+    ):
+        assert (every_bars is None) != (
+            every_seconds is None
+        ), "Exactly one of ``every_bars`` or ``every_seconds`` is required"
+        self._fn = fn
+        self._every_bars = every_bars
+        self._every_seconds = every_seconds
+        self._check_bars = check_bars
+        self._n = None
+        self._t_start = None
+        self._t_last = None
+        self._last_info = None
+
+    def open(self, n):
+        self._n = n
+        self._t_start = self._t_last = time.perf_counter()
+        return self.__next_i(-1)
+
+    def update(self, tester, i):
+        now = time.perf_counter()
+        if self._every_bars is not None or now - self._t_last >= self._every_seconds:
+            self._notify(tester, i, now)
+        return self.__next_i(i)
+
+    def close(self, tester, i):
+        if i is not None:
+            self._notify(tester, i, time.perf_counter())
+
+    @property
+    def last_info(self) -> ProgressInfo:
+        return self._last_info
+
+    def _notify(self, tester, i, now):
+        elapsed = now - self._t_start
+        status = tester.status
+        self._last_info = ProgressInfo(
+            i,
+            self._n,
+            elapsed,
+            (i + 1) / elapsed if elapsed > 0 else float("inf"),
+            status.order_num,
+            status.position_num,
+            status.cum_gain,
+        )
+        self._t_last = now
+        self._fn(self._last_info)
+
+    def __next_i(self, i):
+        if self._every_bars is not None:
+            return i + self._every_bars
+        else:
+            return i + self._check_bars
+
+
+def make_progress(
+    progress: Union[None, str, Progress, Callable[[ProgressInfo], None]]
+) -> Progress:
+    """``BackTester.start(progress=...)``の引数から``Progress``を作る。
+
+    - None: 進捗表示なし
+    - "auto": DEBUGログ時は表示なし、それ以外はtqdm
+    - "tqdm": tqdm
+    - ``Progress``: そのまま
+    - callable: 10秒ごとに``fn(ProgressInfo)``を呼ぶ
+    """
+    if progress is None:
+        return NoProgress()
+    elif isinstance(progress, Progress):
+        return progress
+    elif progress == "auto":
+        return NoProgress() if get_log_level() == logging.DEBUG else TqdmProgress()
+    elif progress == "tqdm":
+        return TqdmProgress()
+    elif callable(progress):
+        return CallbackProgress(progress, every_seconds=10)
+    else:
+        raise RuntimeError(f"Unsupported progress: {progress}")
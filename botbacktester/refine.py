@@ -0,0 +1,98 @@
+"""細かい足による足内の約定順序の判定。
+
+粗い足（例: 1分足）で、同じ足の中でエグジット指値とロスカットの両方に触れた場合にの
+み、その足の期間の細かい足（例: 1秒足）を参照してどちらが先かを判定する。細かい足は
+``FineBars.save``で保存したnpyファイルを``FineBars.load``でメモリマップして使う。
+"""
+
+import os
+
+import numba
+import numpy as np
+import pandas as pd
+
+# ``first_touch``の戻り値
+FIRST_EXIT = 1
+FIRST_LOSSCUT = -1
+
+
+@numba.jit(nopython=True)
+def first_touch(high, low, lo, hi, side, exit_price, losscut_price, strict):
+    """細かい足``lo:hi``でエグジット指値とロスカットのどちらに先に触れたかを返す。
+
+    同じ足で両方に触れた場合、またはどちらにも触れなかった場合はロスカットとする。
+
+    :param side: ポジションの向き。1 ("BUY") or -1 ("SELL")
+    :param strict: Trueの場合は価格を超えた・割った場合、Falseの場合は価格に達した
+        場合に触れたとみなす
+    """
+    for k in range(lo, hi):
+        if side == 1:
+            if strict:
+                hit_losscut, hit_exit = low[k] < losscut_price, high[k] > exit_price
+            else:
+                hit_losscut, hit_exit = low[k] <= losscut_price, high[k] >= exit_price
+        else:
+            if strict:
+                hit_losscut, hit_exit = high[k] > losscut_price, low[k] < exit_price
+            else:
+                hit_losscut, hit_exit = high[k] >= losscut_price, low[k] <= exit_price
+
+        if hit_losscut:
+            return FIRST_LOSSCUT
+        if hit_exit:
+            return FIRST_EXIT
+
+    return FIRST_LOSSCUT
+
+
+class FineBars:
+    """細かい足のストア（timestamp・high・lowの配列）。"""
+
+    KEYS = ("timestamp", "high", "low")
+
+    def __init__(self, timestamps: np.ndarray, high: np.ndarray, low: np.ndarray):
+        """
+        :param timestamps: unix nano秒（int64、昇順）
+        """
+        assert len(timestamps) == len(high) == len(low)
+        self.timestamps = timestamps
+        self.high = high
+        self.low = low
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FineBars":
+        assert df.index.name == "timestamp"
+        assert isinstance(df.index, pd.DatetimeIndex)
+        df = df.sort_index()
+        return cls(
+            df.index.values.astype("datetime64[ns]").view(np.int64),
+            df.high.values.astype(np.float64),
+            df.low.values.astype(np.float64),
+        )
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = "r") -> "FineBars":
+        return cls(
+            *[
+                np.load(os.path.join(directory, f"{k}.npy"), mmap_mode=mmap_mode)
+                for k in cls.KEYS
+            ]
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for k, v in zip(self.KEYS, [self.timestamps, self.high, self.low]):
+            np.save(os.path.join(directory, f"{k}.npy"), v)
+
+    def bounds(self, timestamps: np.ndarray) -> np.ndarray:
+        """粗い足``j``に対応する細かい足の範囲``bounds[j]:bounds[j + 1]``。
+
+        :param timestamps: 粗い足の開始時刻（unix nano秒、昇順）
+        """
+        return np.r_[
+            np.searchsorted(self.timestamps, timestamps), len(self.timestamps)
+        ].astype(np.int64)
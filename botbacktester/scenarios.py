@@ -0,0 +1,176 @@
+"""手数料・スリッページのシナリオによる結果の再評価。
+
+手数料・スリッページは約定の判定（どのバーで約定・決済するか）に影響しないため、シミュ
+レーションをやり直さなくても、約定価格・売買方向・手数料から損益を計算し直せる。複数
+のシナリオをまとめて「トレード × シナリオ」の行列として計算する。
+
+>>> scenarios = {
+...     "base": Scenario(),
+...     "vip": Scenario(maker_fee=-0.0002, taker_fee=0.0005),
+...     "slippy": Scenario(market_slippage=1000, losscut_slippage=3000),
+... }
+>>> repriced = reprice(tester.get_result_df(), scenarios)
+>>> repriced.metrics  # シナリオごとの集計
+>>> repriced.gains  # トレードごとの損益
+
+手数料の扱いは``Position.gain``と同じ（``gain -= open_fee - close_fee``）で、シナリオ
+の手数料は全バーの"maker_fee"・"taker_fee"カラムをその値にして実行した場合と一致する。
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .fast.tester import Status
+
+
+class Scenario(NamedTuple):
+    # 指値・逆指値の約定の手数料率。Noneの場合は結果の手数料のまま
+    maker_fee: float = None
+    # 成行の約定（ロスカット・失効時の執行を含む）の手数料率。Noneの場合は結果の手数料のまま
+    taker_fee: float = None
+    # 成行の約定（ロスカット・失効時の執行を含む）に追加する不利な方向のスリッページ
+    # （価格）。全注文の``market_slippage``にこの値を加えて実行した場合と一致する。
+    # ``limit_simulation``の結果ではロスカットには加えない
+    market_slippage: float = 0
+    # ロスカットの決済に（``market_slippage``に加えて）追加する不利な方向のスリッページ
+    # （価格）
+    losscut_slippage: float = 0
+
+
+class Repriced(NamedTuple):
+    # トレード × シナリオの損益（indexは結果の約定した行）
+    gains: pd.DataFrame
+    # シナリオごとの集計（total, mean, std, sharpe, win_rate, max_drawdown, trades）
+    metrics: pd.DataFrame
+
+
+def reprice(
+    result, scenarios: Union[list[Scenario], dict[str, Scenario]], side: int = None
+) -> Repriced:
+    """結果の損益を``scenarios``ごとに計算し直す。
+
+    :param result: ``BackTester``、``get_result_df()``の結果、または
+        ``fast.limit_simulation``の結果（"frame"のみ）。``limit_simulation``の場合、決
+        済まで終わったシグナルのみを対象とし、エントリー・エグジットは指値（maker）、
+        ロスカット・時間切れの決済は成行（taker）とする
+    :param scenarios: ``Scenario``のlist（名前は番号）またはdict
+    :param side: ``limit_simulation``の結果の場合に必須。1 ("BUY") or -1 ("SELL")
+    """
+    if hasattr(result, "get_result_df"):
+        result = result.get_result_df()
+    if not isinstance(scenarios, dict):
+        scenarios = dict(enumerate(scenarios))
+    assert len(scenarios) > 0
+
+    trades = _trades(result, side)
+    sign = trades["sign"][:, None]
+
+    def _column(key):
+        return np.array(
+            [
+                np.nan if getattr(s, key) is None else getattr(s, key)
+                for s in scenarios.values()
+            ],
+            dtype=np.float64,
+        )[None, :]
+
+    maker_fee, taker_fee = _column("maker_fee"), _column("taker_fee")
+    market_slippage = _column("market_slippage")
+    losscut_slippage = _column("losscut_slippage")
+
+    def _fee(taker, original):
+        fee = np.where(taker[:, None], taker_fee, maker_fee)
+        return np.where(np.isnan(fee), original[:, None], fee)
+
+    # 不利な方向：買いは高く、売りは安く約定する
+    entry_price = trades["entry_price"][:, None] + sign * np.where(
+        trades["entry_market"][:, None], market_slippage, 0
+    )
+    exit_slippage = np.where(
+        trades["exit_market"][:, None], market_slippage, 0
+    ) + np.where(trades["exit_losscut"][:, None], losscut_slippage, 0)
+    exit_price = trades["exit_price"][:, None] - sign * exit_slippage
+
+    gains = sign * (exit_price / entry_price - 1)
+    gains = gains - (
+        _fee(trades["entry_taker"], trades["entry_fee"])
+        - _fee(trades["exit_taker"], trades["exit_fee"])
+    )
+
+    gains = pd.DataFrame(gains, index=trades["index"], columns=list(scenarios.keys()))
+    gains.columns.name = "scenario"
+    return Repriced(gains, _metrics(gains.to_numpy(), gains.columns))
+
+
+def _trades(result, side):
+    if "oo_executed_at" in result.columns:
+        sign = np.where(result.side == "BUY", 1.0, -1.0)
+        entry_market = (result.oo_exec_type == "MARKET").to_numpy()
+        # ロスカットも成行（``_get_market_price``で``market_slippage``が加わる）
+        exit_market = (result.co_exec_type == "MARKET").to_numpy()
+        exit_losscut = (result.co_status == "LOSSCUT").to_numpy()
+        return {
+            "index": result.index,
+            "sign": sign,
+            "entry_price": result.oo_price.to_numpy(dtype=np.float64),
+            "exit_price": result.co_price.to_numpy(dtype=np.float64),
+            "entry_market": entry_market,
+            "exit_market": exit_market,
+            "exit_losscut": exit_losscut,
+            # ``Order.fee``と同じ（成行で約定した注文はtaker）
+            "entry_taker": entry_market,
+            "exit_taker": exit_market,
+            "entry_fee": result.oo_fee.to_numpy(dtype=np.float64),
+            "exit_fee": result.co_fee.to_numpy(dtype=np.float64),
+        }
+
+    assert side in [1, -1], "``side`` is required for limit_simulation results"
+    assert "entry_at" in result.columns, "Unsupported result"
+    result = result[result.entry_at.notna() & result.exit_at.notna()]
+    status = result.status.to_numpy()
+    exit_losscut = status == Status.LOSSCUT
+    exit_timeout = status == Status.EXIT_TIMEOUT
+    zeros = np.zeros(len(result))
+    return {
+        "index": result.index,
+        "sign": np.full(len(result), float(side)),
+        "entry_price": result.entry_price.to_numpy(dtype=np.float64),
+        "exit_price": result.exit_price.to_numpy(dtype=np.float64),
+        "entry_market": zeros.astype(bool),
+        "exit_market": exit_timeout,
+        "exit_losscut": exit_losscut,
+        "entry_taker": zeros.astype(bool),
+        "exit_taker": exit_losscut | exit_timeout,
+        "entry_fee": zeros,
+        "exit_fee": zeros,
+    }
+
+
+def _metrics(gains: np.ndarray, columns) -> pd.DataFrame:
+    # 列（シナリオ）ごとの集計をまとめて計算する
+    n = len(gains)
+    total = gains.sum(axis=0)
+    mean = total / n if n else np.full(gains.shape[1], np.nan)
+    std = gains.std(axis=0, ddof=1) if n > 1 else np.full(gains.shape[1], np.nan)
+    cumsum = np.cumsum(gains, axis=0)
+    drawdown = cumsum - np.maximum.accumulate(cumsum, axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = mean / std
+
+    return pd.DataFrame(
+        {
+            "total": total,
+            "mean": mean,
+            "std": std,
+            "sharpe": sharpe,
+            "win_rate": (gains > 0).mean(axis=0) if n else np.nan,
+            "max_drawdown": np.minimum(drawdown.min(axis=0), 0) if n else 0.0,
+            "trades": n,
+        },
+        index=columns,
+    )
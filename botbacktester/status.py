@@ -25,12 +25,19 @@ class Status:
     def add_order(self, o):
         self._orders.append(o)
 
+    def add_orders(self, orders):
+        self._orders.extend(orders)
+
     def add_position(self, p):
         self._positions.append(p)
 
     def remove_order(self, o):
         self._orders = [o_ for o_ in self._orders if id(o) != id(o_)]
 
+    def remove_orders(self, orders):
+        ids = {id(o) for o in orders}
+        self._orders = [o_ for o_ in self._orders if id(o_) not in ids]
+
     def remove_position(self, p):
         self._positions = [p_ for p_ in self._positions if id(p) != id(p_)]
 
@@ -101,3 +108,45 @@ class Status:
     @property
     def position_num(self):
         return len(self._positions)
+
+
+class PortfolioStatus:
+    """銘柄ごとの``Status``をまとめたもの。"""
+
+    def __init__(self, statuses: dict[str, Status]):
+        self._statuses = statuses
+
+    def __getitem__(self, symbol) -> Status:
+        return self._statuses[symbol]
+
+    def orders(
+        self, symbol=None, side=None, settle_type=None, exec_type=None
+    ) -> list[Order]:
+        if symbol is not None:
+            return self._statuses[symbol].orders(side, settle_type, exec_type)
+
+        rtn_orders = []
+        for s in self._statuses.values():
+            rtn_orders += s.orders(side, settle_type, exec_type)
+        return rtn_orders
+
+    def positions(self, symbol=None, side=None, non_closing=False) -> list[Position]:
+        if symbol is not None:
+            return self._statuses[symbol].positions(side, non_closing)
+
+        rtn_positions = []
+        for s in self._statuses.values():
+            rtn_positions += s.positions(side, non_closing)
+        return rtn_positions
+
+    @property
+    def cum_gain(self):
+        return sum([s.cum_gain for s in self._statuses.values()])
+
+    @property
+    def order_num(self):
+        return sum([s.order_num for s in self._statuses.values()])
+
+    @property
+    def position_num(self):
+        return sum([s.position_num for s in self._statuses.values()])
@@ -1,63 +1,245 @@
 from typing import Callable
 
 import numpy as np
+import os
 import pandas as pd
-import tqdm
+import time
 import logging
 
-from .items import Position, Order, OpenOrder, CloseOrder, reset_id_counter
+from .bars import Bars
+from . import checkpoint
+from .items import (
+    Position,
+    Order,
+    OpenOrder,
+    CloseOrder,
+    ExitSpec,
+    get_id_counter,
+    reset_id_counter,
+    set_id_counter,
+)
 from .enums import SettleType, ExecutionType
 from .evaluate import evaluation_set1
+from .profiler import StepProfiler
+from .progress import make_progress
 from .status import Status
+from .trace import EventType, Tracer
+from .tradelog import TradeLog, read_positions
 from .utils import (
     DEFAULT_EXPIRE_SECONDS,
     debug_log,
-    get_log_level,
     set_log_level,
 )
 
 
 class BackTester:
-    def __init__(self, df, log_level=logging.INFO):
+    def __init__(
+        self,
+        df,
+        log_level=logging.INFO,
+        profile=False,
+        fine=None,
+        trade_log: str = None,
+        trade_log_batch: int = 10000,
+    ):
+        """
+        :param df: ohlcv（indexは"timestamp"）
+        :param log_level: ログレベル
+        :param profile: ステップループの計測を有効にする（``profile_report``参照）
+        :param fine: 細かい足（``botbacktester.refine.FineBars``）。同じバーで決済指値
+            とロスカットの両方に触れた場合に、どちらが先かを判定するのに使う
+        :param trade_log: 決済済みのポジション・終了した注文を書き出すディレクトリ
+            （``botbacktester.tradelog``参照）。指定した場合、``order_history``・
+            ``position_history``はメモリに持たない
+        :param trade_log_batch: ``trade_log``に1回に書き出す件数
+        """
         assert df.index.name == "timestamp"
         assert isinstance(df.index, pd.DatetimeIndex)
 
-        self._df = df.sort_index().reset_index()
-        self._data = self._df.to_dict(orient="records")
+        self._init(
+            Bars(df.sort_index().reset_index(), fine=fine),
+            profile,
+            trade_log,
+            trade_log_batch,
+        )
+
+        set_log_level(log_level)
+
+    @classmethod
+    def from_bars(
+        cls, bars: Bars, profile=False, trade_log=None, trade_log_batch=10000
+    ) -> "BackTester":
+        """既存の``Bars``を共有する``BackTester``を作る（データはコピーしない）。"""
+        tester = cls.__new__(cls)
+        tester._init(bars, profile, trade_log, trade_log_batch)
+        return tester
+
+    def _init(
+        self, bars: Bars, profile: bool, trade_log: str = None, trade_log_batch=10000
+    ):
+        self._df = bars.df
+        self._data = bars
         self._status, self._order_history, self._position_history, self._cur_i = (
             None,
             None,
             None,
             None,
         )
-
-        set_log_level(log_level)
-
-    def start(self, stop_i=None):
+        self._stopped = False
+        # ``PortfolioBackTester``の銘柄ごとのBackTesterの場合のみ
+        self._symbol = None
+        # 計測モード（``profile=True``）。無効時はNoneで、ループ内の分岐のみのコストとなる
+        self._profile = profile
+        self._profiler = None
+        # 履歴の書き出し先（``trade_log``指定時のみ）
+        self._trade_log_dir = trade_log
+        self._trade_log_batch = trade_log_batch
+        self._trade_log = None
+        # イベントの記録（``enable_trace``で有効にした場合のみ）
+        self._tracer = None
+        # 前回のチェックポイントの保存先（同じファイルへは差分を追記する）
+        self._checkpoint_writer = None
+
+    def start(self, stop_i=None, progress="auto"):
+        """シミュレーションを開始する。
+
+        :param stop_i: 途中終了するバー番号（このバーはyieldされない）
+        :param progress: 進捗通知。None, "auto", "tqdm", ``Progress``または
+            ``fn(ProgressInfo)``（``botbacktester.progress.make_progress``参照）
+        """
         self.reset()
+        yield from self.__run(0, stop_i, progress)
+
+    def resume(self, path=None, stop_i=None, progress="auto"):
+        """チェックポイントから再開する。
+
+        ``path``を与えた場合は``load_checkpoint(path)``してから再開する。チェックポイン
+        トを取ったバーの次のバーから``start``と同様にyieldする。
+
+        :param path: ``checkpoint``で保存したファイル
+        :param stop_i: ``start``と同じ
+        :param progress: ``start``と同じ
+        """
+        if path is not None:
+            self.load_checkpoint(path)
+
+        assert self._status is not None, "Checkpoint not loaded"
+
+        if self._stopped:
+            # ``stop_i``で止めたバーはまだyieldしていないので、そこから再開する
+            self._stopped = False
+            yield self._cur_i, self._data[self._cur_i]
+
+        yield from self.__run(self._cur_i + 1, stop_i, progress)
+
+    def checkpoint(self, path, extra=None):
+        """現在の状態（``Status``・注文/ポジション履歴・カーソル）を保存する。
+
+        ``start``・``resume``のループ中、またはループを``stop_i``で止めた後に呼ぶ。
+        バーのデータは保存されないため、再開時は同じデータで作った``BackTester``を使う。
+        前回と同じ``path``の場合は、前回から確定した注文・ポジションのみを追記する。
+
+        :param path: 保存先
+        :param extra: 戦略側の状態など、一緒に保存したい任意のpickle可能なオブジェクト
+        """
+        assert self._cur_i is not None, "Not started"
+        assert self._trade_log is None, "Checkpoint is not supported with trade_log"
+        path = os.path.abspath(path)
+        if self._checkpoint_writer is None or self._checkpoint_writer.path != path:
+            self._checkpoint_writer = checkpoint.Writer(path, self._data)
+        self._checkpoint_writer.dump(
+            {
+                "status": self._status,
+                "cur_i": self._cur_i,
+                "cur_timestamp": self._data.timestamp(self._cur_i),
+                "stopped": self._stopped,
+                "id_counter": get_id_counter(),
+                "extra": extra,
+            },
+            self._order_history,
+            self._position_history,
+        )
 
-        iterator = range if get_log_level() == logging.DEBUG else tqdm.trange
-        bar = iterator(0, len(self._data))
-
-        for i in bar:
-            self._cur_i = i
-            self._on_step()
+    def load_checkpoint(self, path):
+        """``checkpoint``で保存した状態を読み込み、``extra``を返す。"""
+        state, writer = checkpoint.load(os.path.abspath(path), self._data)
 
-            if stop_i and self._cur_i == stop_i:
-                break
+        assert (
+            self._data.timestamp(state["cur_i"]) == state["cur_timestamp"]
+        ), "Checkpoint does not match the data"
 
-            yield i, self._data[self._cur_i]
+        self.reset()
+        self._status = state["status"]
+        self._order_history = state["order_history"]
+        self._position_history = state["position_history"]
+        self._cur_i = state["cur_i"]
+        self._stopped = state["stopped"]
+        self._checkpoint_writer = writer
+        set_id_counter(*state["id_counter"])
+
+        return state["extra"]
+
+    def __run(self, start_i, stop_i, progress):
+        progress = make_progress(progress)
+        next_progress_i = progress.open(len(self._data))
+
+        try:
+            for i in range(start_i, len(self._data)):
+                self._step(i)
+
+                if i >= next_progress_i:
+                    next_progress_i = progress.update(self, i)
+
+                if stop_i and self._cur_i == stop_i:
+                    self._stopped = True
+                    break
+
+                if self._profiler is None:
+                    yield i, self._data[self._cur_i]
+                else:
+                    t = time.perf_counter()
+                    yield i, self._data[self._cur_i]
+                    self._profiler.add("user", time.perf_counter() - t)
+        finally:
+            progress.close(self, self._cur_i)
 
         if stop_i is None:
+            self._finish()
+
+    def _step(self, i: int):
+        self._cur_i = i
+        self._on_step()
+
+    def _finish(self):
+        if self._profiler is None:
+            self.__clean_up()
+        else:
+            t = time.perf_counter()
             self.__clean_up()
+            self._profiler.add("clean_up", time.perf_counter() - t)
 
     def reset(self):
         self._status = Status()
         self._order_history = []
         self._position_history = []
         self._cur_i = None
+        self._stopped = False
+        self._profiler = StepProfiler() if self._profile else None
+        self._checkpoint_writer = None
         reset_id_counter()
 
+        if self._tracer is not None:
+            self._tracer.clear()
+
+        if self._trade_log is not None:
+            self._trade_log.close()
+        if self._trade_log_dir is not None:
+            self._trade_log = TradeLog(
+                self._trade_log_dir,
+                self._trade_log_batch,
+                timestamp_dtype=self._df["timestamp"].dtype,
+            )
+
     def entry(
         self,
         side,
@@ -68,18 +250,21 @@ class BackTester:
         market_slippage: int = 0,
     ):
         oo = OpenOrder(
-            self.__get_entry_time(),
+            self._entry_time(),
             side,
             exec_type,
             price,
             expire_seconds,
             market_price,
             market_slippage,
+            bars=self._data,
+            symbol=self._symbol,
         )
         debug_log("ORDER ENTRY", oo)
 
         self._status.add_order(oo)
-        self._order_history.append(oo)
+        self.__add_order_history([oo])
+        self.__trace_entry([oo])
 
         return oo
 
@@ -98,9 +283,17 @@ class BackTester:
         market_entry_fn: Callable[[dict, "CloseOrder"], bool] = None,
         force_market_entry_seconds: int = float("inf"),
         keep_expired_orders: bool = False,
+        spec: ExitSpec = None,
     ):
+        """決済注文。
+
+        :param spec: 指値の更新・ロスカット・成行決済の判定をバーのカラムで宣言的に指定
+            する（``ExitSpec``）。``price``を省略した場合、指値は現在のバーの
+            ``spec.price_key``の値 + ``spec.offset``
+        """
+        price = self.__spec_price(spec, price)
         co = CloseOrder(
-            self.__get_entry_time(),
+            self._entry_time(),
             position,
             exec_type,
             price=price,
@@ -113,28 +306,192 @@ class BackTester:
             market_entry_fn=market_entry_fn,
             force_market_entry_seconds=force_market_entry_seconds,
             keep_expired_orders=keep_expired_orders,
+            bars=self._data,
+            spec=spec,
         )
         debug_log("ORDER EXIT", co)
 
         self._status.add_order(co)
-        self._order_history.append(co)
+        self.__add_order_history([co])
+        self.__trace_entry([co])
 
         return co
 
+    def entry_many(
+        self,
+        sides,
+        exec_types,
+        prices,
+        expire_seconds=DEFAULT_EXPIRE_SECONDS,
+        market_price: str = "open",
+        market_slippage=0,
+    ) -> list[OpenOrder]:
+        """複数の新規注文（グリッド・ラダーなど）をまとめて出す。
+
+        各引数はスカラー（全注文で共通）または注文数の長さの配列。結果は``entry``を順に
+        呼んだ場合と同じだが、失効時間の計算は``expire_seconds``の値ごとに1回で、
+        ``Status``への追加も1回で行う。
+        """
+        n, (sides, exec_types, prices, expire_seconds, market_slippage) = _broadcast(
+            sides, exec_types, prices, expire_seconds, market_slippage
+        )
+
+        entry_time = self._entry_time()
+        expire_times = {
+            s: Order.calc_expire_time(entry_time, s) for s in set(expire_seconds)
+        }
+
+        orders = [
+            OpenOrder(
+                entry_time,
+                sides[k],
+                exec_types[k],
+                prices[k],
+                expire_seconds[k],
+                market_price,
+                market_slippage[k],
+                bars=self._data,
+                symbol=self._symbol,
+                expire_time=expire_times[expire_seconds[k]],
+            )
+            for k in range(n)
+        ]
+        debug_log("ORDER ENTRY", f"{n} orders")
+
+        self._status.add_orders(orders)
+        self.__add_order_history(orders)
+        self.__trace_entry(orders)
+
+        return orders
+
+    def exit_many(
+        self,
+        positions: list[Position],
+        exec_types,
+        prices=-1,
+        losscut_prices=-1,
+        expire_seconds=DEFAULT_EXPIRE_SECONDS,
+        market_price: str = "open",
+        market_slippage=0,
+        spec: ExitSpec = None,
+    ) -> list[CloseOrder]:
+        """複数のポジションの決済注文をまとめて出す（``entry_many``の決済版）。
+
+        ``spec``は全注文で共通で、``spec.requote_seconds``を与えた場合は
+        ``expire_seconds``より優先する。``update_fn_or_price_key``などの関数による指定
+        が必要な場合は``exit``を使う。
+        """
+        if not _is_sequence(prices):
+            prices = self.__spec_price(spec, prices)
+        if spec is not None and spec.requote_seconds is not None:
+            # ``exit``と同じく、指値の更新間隔は``spec``のもの
+            expire_seconds = spec.requote_seconds
+
+        n, values = _broadcast(
+            positions,
+            exec_types,
+            prices,
+            losscut_prices,
+            expire_seconds,
+            market_slippage,
+        )
+        (
+            positions,
+            exec_types,
+            prices,
+            losscut_prices,
+            expire_seconds,
+            market_slippage,
+        ) = values
+
+        entry_time = self._entry_time()
+        expire_times = {
+            s: Order.calc_expire_time(entry_time, s) for s in set(expire_seconds)
+        }
+
+        orders = [
+            CloseOrder(
+                entry_time,
+                positions[k],
+                exec_types[k],
+                price=prices[k],
+                losscut_price=losscut_prices[k],
+                expire_seconds=expire_seconds[k],
+                market_price_key=market_price,
+                market_slippage=market_slippage[k],
+                bars=self._data,
+                expire_time=expire_times[expire_seconds[k]],
+                spec=spec,
+            )
+            for k in range(n)
+        ]
+        debug_log("ORDER EXIT", f"{n} orders")
+
+        self._status.add_orders(orders)
+        self.__add_order_history(orders)
+        self.__trace_entry(orders)
+
+        return orders
+
+    def cancel_many(self, orders: list[Order]):
+        """未約定の注文をまとめて取り消す（次のバーから評価されない）。"""
+        orders = [o for o in orders if not o.is_done]
+        for o in orders:
+            o.cancel()
+        self._status.remove_orders(orders)
+        if self._trade_log is not None:
+            self._trade_log.add_orders(orders)
+        if self._tracer is not None:
+            self._tracer.orders(self._cur_i, EventType.ORDER_CANCEL, orders)
+
+    def replace_many(
+        self, orders: list[Order], sides, exec_types, prices, **kwargs
+    ) -> list[OpenOrder]:
+        """ラダーの出し直し。``orders``の未約定の注文を取り消し、``entry_many``する。
+
+        ``kwargs``は``entry_many``と同じ。
+        """
+        self.cancel_many(orders)
+        return self.entry_many(sides, exec_types, prices, **kwargs)
+
+    def __spec_price(self, spec: ExitSpec, price):
+        if spec is None or spec.price_key is None or price != -1:
+            return price
+        return self._data.value(spec.price_key, self._cur_i) + spec.offset
+
     def _on_step(self):
-        item = self._data[self._cur_i]
+        i = self._cur_i
 
         debug_log("STEP", self.__step_repr())
-        debug_log("ITEM", item)
+        debug_log("ITEM", self._data[i])
+
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.add_resting_orders(self._status.order_num)
+
+        tracer = self._tracer
 
         for o in self._status.orders():
-            o._on_step(item)
+            if tracer is not None:
+                entry_time = o.entry_time
+
+            if profiler is None:
+                o._on_step(i)
+            else:
+                t = time.perf_counter()
+                o._on_step(i)
+                profiler.add(f"on_step.{o.__class__.__name__}", time.perf_counter() - t)
+
+            if tracer is not None:
+                tracer.order_step(i, o, entry_time)
 
             if isinstance(o, OpenOrder):
                 if o.is_executed:
                     p = Position(o)
                     self._status.add_position(p)
                     debug_log("POSITION", p)
+                    if tracer is not None:
+                        tracer.position(i, EventType.POSITION_OPEN, p)
 
             elif isinstance(o, CloseOrder):
                 pass
@@ -153,24 +510,63 @@ class BackTester:
         return self._status.positions(side, non_closing)
 
     def get_result_df(self):
+        if self._trade_log is not None:
+            assert self._trade_log.position_num > 0, "Results not found"
+            return self._format_result_df(self._trade_log.read_positions())
+
         assert len(self.position_history) > 0, "Results not found"
         df = pd.DataFrame([p.as_dict() for p in self.position_history])
+        return self._format_result_df(df)
 
+    @classmethod
+    def read_result(cls, directory: str, columns: list[str] = None) -> pd.DataFrame:
+        """``trade_log``に書き出した結果を``get_result_df``と同じ形式で読む。
+
+        :param directory: ``trade_log``に指定したディレクトリ
+        :param columns: 読むカラム（``position_history``の``as_dict``のキー）。Noneの場
+            合は全て。indexなどに必要なカラムは常に読む
+        """
+        if columns is not None:
+            columns = list(
+                dict.fromkeys(["oo_entried_at", "oo_side", "gain", *columns])
+            )
+        df = read_positions(directory, columns)
+        assert len(df) > 0, "Results not found"
+        return cls._format_result_df(df)
+
+    @staticmethod
+    def _format_result_df(df):
         df["timestamp"] = df.oo_entried_at
         df["side"] = df.oo_side
         df.set_index("timestamp", inplace=True)
-        df.drop(columns=["oo_settle_type", "co_settle_type"], inplace=True)
+        df.drop(
+            columns=["oo_settle_type", "co_settle_type"], inplace=True, errors="ignore"
+        )
 
         df["gain_buy"] = np.where(df.side == "BUY", df.gain, 0)
         df["gain_sell"] = np.where(df.side == "SELL", df.gain, 0)
 
         return df
 
+    def profile_report(self) -> pd.DataFrame:
+        assert self._profiler is not None, "Profiling is disabled (use profile=True)"
+        return self._profiler.report()
+
     def report(self, **kwargs):
         df_result = self.get_result_df()
         evaluation_set1(df_result, **kwargs)
         return df_result
 
+    def enable_trace(self, capacity: int = 1 << 20, path: str = None) -> Tracer:
+        """イベント（注文・約定・失効・指値の更新・ロスカット・ポジション）を固定長の
+        レコードで記録する（``botbacktester.trace``参照）。``start``の前に呼ぶ。
+
+        :param capacity: 保持するイベント数の上限（超えたら古いものから上書き）
+        :param path: 書き込むファイル（``.npy``、メモリマップ）。Noneの場合はメモリ上
+        """
+        self._tracer = Tracer(capacity, path, timestamps=self._data)
+        return self._tracer
+
     @classmethod
     def enable_debug_log(cls):
         set_log_level("DEBUG")
@@ -183,6 +579,18 @@ class BackTester:
     def status(self) -> Status:
         return self._status
 
+    @property
+    def profiler(self) -> StepProfiler:
+        return self._profiler
+
+    @property
+    def tracer(self) -> Tracer:
+        return self._tracer
+
+    @property
+    def trade_log(self) -> TradeLog:
+        return self._trade_log
+
     @property
     def order_history(self) -> list[Order]:
         return self._order_history
@@ -191,17 +599,20 @@ class BackTester:
     def position_history(self) -> list[Position]:
         return self._position_history
 
-    def __get_entry_time(self):
-        return self._data[self._cur_i]["timestamp"]
+    def _entry_time(self):
+        return self._data.timestamp(self._cur_i)
 
     def __clean_up(self):
-        last = self._data[-1]
+        last_i = len(self._data) - 1
 
         for o in self.orders():
             if o.settle_type == SettleType.OPEN:
-                o._expired(last)
+                o._expired(last_i)
             else:
-                o._expired_and_executed(last, market_price_key="close")
+                o._expired_and_executed(last_i, market_price_key="close")
+
+            if self._tracer is not None:
+                self._tracer.order_step(last_i, o, o.entry_time)
 
         for p in self.positions():
             # is_closingの場合、上でcloseされているはず
@@ -210,22 +621,95 @@ class BackTester:
             # CloseOrderが未注文のポジション
             if not p.is_closed:
                 co = CloseOrder(
-                    last["timestamp"], p, ExecutionType.MARKET, market_price_key="close"
+                    self._data.timestamp(last_i),
+                    p,
+                    ExecutionType.MARKET,
+                    market_price_key="close",
+                    bars=self._data,
                 )
-                co._executed(last)
-                p.close(self._data[-1], co)
+                if self._tracer is not None:
+                    self._tracer.order(last_i, EventType.ORDER_ENTRY, co)
+
+                co._executed(last_i)
+                p.close(last_i, co)
+
+                if self._tracer is not None:
+                    self._tracer.order_step(last_i, co, co.entry_time)
 
         self.__update_status()
 
         assert self._status.order_num == 0
         assert self._status.position_num == 0
 
+        if self._trade_log is not None:
+            self._trade_log.close()
+
     def __update_status(self):
-        self._status.clear_done_orders()
+        if self._profiler is not None:
+            return self.__update_status_with_profile()
+
+        done_orders = self._status.clear_done_orders()
         closed_positions = self._status.clear_closed_positions()
 
-        if len(closed_positions):
+        if self._trade_log is not None:
+            self.__write_trade_log(done_orders, closed_positions)
+        elif len(closed_positions):
             self._position_history += closed_positions
 
+    def __update_status_with_profile(self):
+        profiler = self._profiler
+
+        t = time.perf_counter()
+        done_orders = self._status.clear_done_orders()
+        profiler.add("clear_done_orders", time.perf_counter() - t)
+
+        t = time.perf_counter()
+        closed_positions = self._status.clear_closed_positions()
+        profiler.add("clear_closed_positions", time.perf_counter() - t)
+
+        if self._trade_log is not None:
+            t = time.perf_counter()
+            self.__write_trade_log(done_orders, closed_positions)
+            profiler.add("trade_log", time.perf_counter() - t)
+        elif len(closed_positions):
+            t = time.perf_counter()
+            self._position_history += closed_positions
+            profiler.add("history_append", time.perf_counter() - t)
+
+    def __write_trade_log(self, done_orders, closed_positions):
+        if len(done_orders):
+            self._trade_log.add_orders(done_orders)
+        if len(closed_positions):
+            self._trade_log.add_positions(closed_positions)
+
+    def __trace_entry(self, orders):
+        if self._tracer is not None:
+            self._tracer.orders(self._cur_i, EventType.ORDER_ENTRY, orders)
+
+    def __add_order_history(self, orders):
+        # ``trade_log``指定時は終了した時点で書き出す（``__update_status``）
+        if self._trade_log is None:
+            self._order_history.extend(orders)
+
     def __step_repr(self):
         return f"{self._cur_i}/{self._status.order_num}/{self._status.position_num}"
+
+
+def _broadcast(*values):
+    # スカラーと配列が混ざった引数を、同じ長さのlistに揃える
+    lengths = {len(v) for v in values if _is_sequence(v)}
+    assert len(lengths) <= 1, f"Length mismatch: {lengths}"
+    n = lengths.pop() if lengths else 1
+
+    rtn = []
+    for v in values:
+        if _is_sequence(v):
+            rtn.append(v.tolist() if hasattr(v, "tolist") else list(v))
+        else:
+            rtn.append([v] * n)
+
+    return n, rtn
+
+
+def _is_sequence(v):
+    return isinstance(v, (list, tuple, np.ndarray, pd.Series))
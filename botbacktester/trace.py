@@ -0,0 +1,235 @@
+"""注文・ポジションのイベントの軽量な記録（トレース）。
+
+``enable_debug_log``はイベントごとに文字列を作るため遅く、パラメーター探索などでは使えな
+い。``Tracer``はイベントを固定長のレコード（numpyの構造化配列）として、事前に確保した
+リングバッファ（``capacity``件を超えたら古いものから上書き）に書き込む。``path``を与え
+た場合はメモリマップしたファイル（``.npy``）に書き込むため、プロセスが異常終了しても
+``load(path)``で直前までのイベントを読める。
+
+>>> tester = BackTester(df)
+>>> tester.enable_trace(capacity=100000)
+>>> for i, item in tester.start():
+...     ...
+>>> tester.tracer.to_df()  # DataFrameで
+>>> print(tester.tracer.to_text())  # debug logと同じ書式のテキストで
+"""
+
+from __future__ import annotations
+
+from enum import IntEnum
+
+import numpy as np
+import pandas as pd
+
+from .bars import Bars
+from .enums import ExecutionType, OrderStatus, Side
+
+
+class EventType(IntEnum):
+    ORDER_ENTRY = 1
+    ORDER_FILL = 2
+    ORDER_EXPIRE = 3
+    # 成行決済注文の失効による執行
+    ORDER_EXPIRE_FILL = 4
+    ORDER_LOSSCUT = 5
+    # 決済指値の更新（``CloseOrder._update``）
+    ORDER_REQUOTE = 6
+    ORDER_CANCEL = 7
+    POSITION_OPEN = 8
+    POSITION_CLOSE = 9
+
+
+# ``to_text``のカテゴリー（``debug_log``と同じもの）
+_CATEGORIES = {
+    EventType.ORDER_ENTRY: "ORDER ENTRY",
+    EventType.ORDER_FILL: "EXECUTED",
+    EventType.ORDER_EXPIRE: "EXPIRED",
+    EventType.ORDER_EXPIRE_FILL: "EXPIRED",
+    EventType.ORDER_LOSSCUT: "LOSSCUT",
+    EventType.ORDER_REQUOTE: "EXTEND ORDER",
+    EventType.ORDER_CANCEL: "CANCELED",
+    EventType.POSITION_OPEN: "POSITION",
+    EventType.POSITION_CLOSE: "CLOSED",
+}
+
+_DONE_EVENTS = {
+    OrderStatus.EXECUTED: EventType.ORDER_FILL,
+    OrderStatus.EXPIRED: EventType.ORDER_EXPIRE,
+    OrderStatus.EXPIRED_EXECUTED: EventType.ORDER_EXPIRE_FILL,
+    OrderStatus.LOSSCUT: EventType.ORDER_LOSSCUT,
+    OrderStatus.CANCELED: EventType.ORDER_CANCEL,
+}
+
+EVENT_DTYPE = np.dtype(
+    [
+        # 通し番号（未使用のレコードは-1）
+        ("seq", np.int64),
+        # バー番号
+        ("i", np.int64),
+        ("event", np.int8),
+        ("order_id", np.int64),
+        ("position_id", np.int64),
+        ("side", np.int8),
+        ("exec_type", np.int8),
+        ("status", np.int8),
+        ("price", np.float64),
+    ]
+)
+
+
+class Tracer:
+    """イベントをリングバッファに記録する。``BackTester.enable_trace``で有効にする。"""
+
+    def __init__(self, capacity: int = 1 << 20, path: str = None, timestamps=None):
+        """
+        :param capacity: 保持するイベント数の上限
+        :param path: 書き込むファイル（``.npy``）。Noneの場合はメモリ上
+        :param timestamps: バーの時刻（または``Bars``）。``to_df``で"timestamp"カラムを
+            加えるのに使う
+        """
+        assert capacity >= 1
+        if path is None:
+            self._records = np.empty(capacity, dtype=EVENT_DTYPE)
+        else:
+            self._records = np.lib.format.open_memmap(
+                path, mode="w+", dtype=EVENT_DTYPE, shape=(capacity,)
+            )
+        self._capacity = capacity
+        self._timestamps = timestamps
+        self.clear()
+
+    def clear(self):
+        self._records["seq"] = -1
+        self._seq = 0
+
+    def order(self, i: int, event: EventType, o):
+        position = getattr(o, "position", None)
+        self._record(
+            i,
+            event,
+            o.id,
+            -1 if position is None else position.id,
+            o.side.value,
+            o.exec_type.value,
+            o.status.value,
+            o.price,
+        )
+
+    def orders(self, i: int, event: EventType, orders):
+        for o in orders:
+            self.order(i, event, o)
+
+    def order_step(self, i: int, o, entry_time):
+        """``o._on_step(i)``の後に呼び、状態の変化をイベントとして記録する。
+
+        :param entry_time: ``_on_step``の前の``o.entry_time``（指値の更新の判定に使う）
+        """
+        if o.is_done:
+            self.order(i, _DONE_EVENTS[o.status], o)
+            if o.is_executed and hasattr(o, "position"):
+                self.position(i, EventType.POSITION_CLOSE, o.position)
+        elif o.entry_time != entry_time:
+            self.order(i, EventType.ORDER_REQUOTE, o)
+
+    def position(self, i: int, event: EventType, p):
+        o = p.open_order if event == EventType.POSITION_OPEN else p.close_order
+        self._record(
+            i,
+            event,
+            o.id,
+            p.id,
+            p.side.value,
+            o.exec_type.value,
+            o.status.value,
+            o.price,
+        )
+
+    def to_df(self, timestamps=None) -> pd.DataFrame:
+        """記録されているイベントを古い順に返す。
+
+        :param timestamps: バーの時刻。Noneの場合は作成時に与えたもの
+        """
+        if timestamps is None:
+            timestamps = self._timestamps
+        return decode(self.records, timestamps)
+
+    def to_text(self, timestamps=None) -> str:
+        """``to_df``を``debug_log``と同じ書式のテキストにする。"""
+        return to_text(self.to_df(timestamps))
+
+    @property
+    def records(self) -> np.ndarray:
+        """記録されているイベント（古い順）。"""
+        return _sort(self._records)
+
+    @property
+    def num_events(self) -> int:
+        """記録したイベントの総数（上書きされたものを含む）。"""
+        return self._seq
+
+    def _record(self, i, event, order_id, position_id, side, exec_type, status, price):
+        self._records[self._seq % self._capacity] = (
+            self._seq,
+            i,
+            event,
+            order_id,
+            position_id,
+            side,
+            exec_type,
+            status,
+            price,
+        )
+        self._seq += 1
+
+
+def load(path: str) -> np.ndarray:
+    """``Tracer(path=path)``が書き込んだイベント（古い順）。"""
+    return _sort(np.load(path, mmap_mode="r"))
+
+
+def decode(records: np.ndarray, timestamps=None) -> pd.DataFrame:
+    """イベントのレコードをDataFrameにする（enumの値は名前にする）。
+
+    :param timestamps: バーの時刻（または``Bars``）。与えた場合は"timestamp"カラムを
+        加える
+    """
+    df = pd.DataFrame(
+        {
+            "seq": records["seq"],
+            "i": records["i"],
+            "event": _names(EventType, records["event"]),
+            "order_id": records["order_id"],
+            "position_id": records["position_id"],
+            "side": _names(Side, records["side"]),
+            "exec_type": _names(ExecutionType, records["exec_type"]),
+            "status": _names(OrderStatus, records["status"]),
+            "price": records["price"],
+        }
+    )
+    if isinstance(timestamps, Bars):
+        timestamps = timestamps.df["timestamp"]
+    if timestamps is not None:
+        df.insert(2, "timestamp", pd.DatetimeIndex(timestamps)[df.i.to_numpy()])
+    return df
+
+
+def to_text(df: pd.DataFrame) -> str:
+    lines = []
+    for r in df.itertuples(index=False):
+        category = _CATEGORIES[EventType[r.event]]
+        at = r.timestamp if "timestamp" in df else r.i
+        message = f"{at}/{r.order_id}/{r.status}/{r.price:.0f}/{r.side}/{r.exec_type}"
+        if r.position_id >= 0:
+            message += f"/position={r.position_id}"
+        lines.append(f"{category:15s} {message}")
+    return "\n".join(lines)
+
+
+def _sort(records):
+    records = records[records["seq"] >= 0]
+    return records[np.argsort(records["seq"], kind="stable")]
+
+
+def _names(enum, values):
+    names = {e.value: e.name for e in enum}
+    return [names[v] for v in values.tolist()]
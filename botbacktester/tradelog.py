@@ -0,0 +1,186 @@
+"""決済済みのポジション・終了した注文をParquetファイルに逐次書き出すログ。
+
+長いシミュレーションでは``BackTester``の注文・ポジションの履歴がメモリを圧迫するため、
+``BackTester(df, trade_log=directory)``とすると、履歴を``batch_size``件ずつ
+``directory``の"positions"・"orders"に書き出し、メモリには書き出し待ちの分のみを持つ。
+``pyarrow``が必要（インポートは使用時のみ）。
+
+書き出しはバッチごとに完結したParquetファイル（"part-00000.parquet", ...）とするため、
+実行中・``stop_i``で止めた後・異常終了した後でも、書き出し済みの分を読める。
+
+>>> tester = BackTester(df, trade_log="./log")
+>>> for i, item in tester.start():
+...     ...
+>>> df_result = tester.get_result_df()
+>>> df_result = BackTester.read_result("./log", columns=["gain"])  # 後から必要なカラムのみ
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+POSITIONS_DIR = "positions"
+ORDERS_DIR = "orders"
+
+_STRING_KEYS = ("side", "exec_type", "settle_type", "status", "symbol")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("``trade_log`` requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+class TradeLog:
+    """ポジション・注文の``as_dict``をバッファし、``batch_size``件ごとに書き出す。"""
+
+    def __init__(self, directory: str, batch_size: int = 10000, timestamp_dtype=None):
+        """
+        :param directory: 出力先（なければ作る。既存のファイルは上書きする）
+        :param batch_size: 1回に書き出す件数（メモリに持つ件数の上限）
+        :param timestamp_dtype: 時刻の型（バーの"timestamp"と同じにする）。Noneの場合は
+            tzなしのns
+        """
+        assert batch_size >= 1
+        _import_pyarrow()
+        os.makedirs(directory, exist_ok=True)
+
+        self._directory = directory
+        tz, unit = _timestamp_type(timestamp_dtype)
+        self._positions = _ParquetSink(
+            os.path.join(directory, POSITIONS_DIR), batch_size, tz, unit
+        )
+        self._orders = _ParquetSink(
+            os.path.join(directory, ORDERS_DIR), batch_size, tz, unit
+        )
+
+    def add_positions(self, positions):
+        self._positions.extend([p.as_dict() for p in positions])
+
+    def add_orders(self, orders):
+        self._orders.extend([o.as_dict() for o in orders])
+
+    def close(self):
+        """バッファを書き出してファイルを閉じる。"""
+        self._positions.close()
+        self._orders.close()
+
+    def read_positions(self, columns=None) -> pd.DataFrame:
+        self._positions.flush()
+        return read_positions(self._directory, columns)
+
+    def read_orders(self, columns=None) -> pd.DataFrame:
+        self._orders.flush()
+        return read_orders(self._directory, columns)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @property
+    def position_num(self) -> int:
+        """書き出し済み・バッファ中のポジションの合計。"""
+        return self._positions.num
+
+
+def read_positions(directory: str, columns=None) -> pd.DataFrame:
+    """書き出したポジションを読む。``columns``を与えた場合はそのカラムのみ読む。"""
+    return _read(os.path.join(directory, POSITIONS_DIR), columns)
+
+
+def read_orders(directory: str, columns=None) -> pd.DataFrame:
+    """書き出した注文を読む。``columns``を与えた場合はそのカラムのみ読む。"""
+    return _read(os.path.join(directory, ORDERS_DIR), columns)
+
+
+def _read(path, columns):
+    pyarrow = _import_pyarrow()
+    parts = _parts(path)
+    if len(parts) == 0:
+        return pd.DataFrame(columns=columns)
+    tables = [pyarrow.parquet.read_table(f, columns=columns) for f in parts]
+    return pyarrow.concat_tables(tables).to_pandas()
+
+
+def _parts(path):
+    # 書き出した順（ファイル名の番号順）
+    return sorted(
+        glob.glob(os.path.join(path, "part-*.parquet")),
+        key=lambda f: int(os.path.basename(f).split(".")[0].split("-")[1]),
+    )
+
+
+def _timestamp_type(dtype):
+    if dtype is None:
+        return None, "ns"
+    if isinstance(dtype, np.dtype):
+        return None, np.datetime_data(dtype)[0]
+    # pd.DatetimeTZDtype
+    return dtype.tz, getattr(dtype, "unit", "ns")
+
+
+class _ParquetSink:
+    def __init__(self, path, batch_size, tz, unit):
+        self.path = path
+        self.num = 0
+        self._batch_size = batch_size
+        self._tz = tz
+        self._unit = unit
+        self._buffer = []
+        self._schema = None
+        self._part = 0
+
+        os.makedirs(path, exist_ok=True)
+        for f in _parts(path):
+            os.remove(f)
+
+    def extend(self, rows: list[dict]):
+        self._buffer.extend(rows)
+        self.num += len(rows)
+        if len(self._buffer) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._buffer) == 0:
+            return
+
+        pyarrow = _import_pyarrow()
+        df = pd.DataFrame(self._buffer)
+        if self._schema is None:
+            self._schema = self._make_schema(pyarrow, df.columns)
+
+        df = df.reindex(columns=self._schema.names)
+        table = pyarrow.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+
+        # 書きかけのファイルを読まないよう、一時ファイルに書いてからリネームする
+        path = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+        pyarrow.parquet.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+        self._part += 1
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    def _make_schema(self, pyarrow, columns):
+        # 1バッチ目にNoneしかないカラムの型も決まるよう、カラム名から型を決める
+        fields = []
+        for c in columns:
+            if c.endswith("_at"):
+                t = pyarrow.timestamp(self._unit, tz=self._tz)
+            elif c.endswith("is_executed"):
+                t = pyarrow.bool_()
+            elif c.endswith(_STRING_KEYS):
+                t = pyarrow.string()
+            else:
+                t = pyarrow.float64()
+            fields.append(pyarrow.field(c, t))
+        return pyarrow.schema(fields)
@@ -1,3 +1,9 @@
+import asyncio
+import os
+import pickle
+
+import pytest
+import numpy as np
 import pandas as pd
 
 from io import StringIO
@@ -426,3 +432,860 @@ def test_losscut1():
             assert p.open_price == entry_price
             assert p.close_price == item["low"]
             assert p.gain == item["low"] / entry_price - 1
+
+
+def test_profile1():
+    # profile=Trueでフェーズごとの計測結果が得られる
+    tester = bbt.BackTester(_read_test_df(), profile=True)
+
+    for i, item in tester.start():
+        ts = item["timestamp"]
+        if ts.minute == 4:
+            tester.entry(E.Side.SELL, E.ExecutionType.LIMIT, price=6763000)
+        elif ts.minute == 6:
+            p = tester.positions(non_closing=True)[0]
+            tester.exit(p, E.ExecutionType.LIMIT, price=-float("inf"))
+
+    df = tester.profile_report()
+    assert {"user", "on_step.OpenOrder", "on_step.CloseOrder", "clean_up"} <= set(
+        df.index
+    )
+    assert df.loc["user", "calls"] == len(tester._data)
+    assert (df.total_seconds >= 0).all()
+
+    hist = tester.profiler.resting_order_histogram()
+    assert hist.sum() == len(tester._data)
+    assert hist.loc[1] > 0
+
+    # 無効時は計測しない
+    tester = bbt.BackTester(_read_test_df())
+    for _ in tester.start():
+        pass
+    assert tester.profiler is None
+
+
+def test_progress1():
+    # ``every_bars``ごとに進捗が通知される
+    infos = []
+    progress = bbt.progress.CallbackProgress(infos.append, every_bars=5)
+
+    tester = bbt.BackTester(_read_test_df())
+    for i, item in tester.start(progress=progress):
+        if i == 0:
+            tester.entry(E.Side.BUY, E.ExecutionType.LIMIT, price=-float("inf"))
+
+    n = len(tester._data)
+    # 4, 9と終了時
+    assert [info.i for info in infos] == [4, 9, n - 1]
+    assert infos[0].order_num == 1
+    assert infos[-1].n == n
+    assert progress.last_info is infos[-1]
+
+    # 通知なし
+    tester = bbt.BackTester(_read_test_df())
+    assert len(list(tester.start(progress=None))) == n
+
+    # ``every_bars``と``every_seconds``は排他
+    with pytest.raises(AssertionError):
+        bbt.progress.CallbackProgress(infos.append, every_bars=5, every_seconds=1)
+
+
+def test_keep_expired_orders1():
+    # 指値更新のたびに失効注文が記録される
+    tester = bbt.BackTester(_read_test_df())
+
+    co = None
+    for i, item in tester.start():
+        ts = item["timestamp"]
+        if ts.minute == 3:
+            tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+        elif ts.minute == 4:
+            p = tester.positions()[0]
+            co = tester.exit(
+                p,
+                E.ExecutionType.LIMIT,
+                price=float("inf"),
+                expire_seconds=120,
+                update_fn_or_price_key=lambda item_, o: o.price + 1,
+                keep_expired_orders=True,
+            )
+
+    # 21:06, 21:08, 21:10で失効・更新
+    assert [q.expired_at.minute for q in co.expired_orders] == [6, 8, 10]
+    assert [q.entried_at.minute for q in co.expired_orders] == [4, 6, 8]
+    assert all(q.status == E.OrderStatus.EXPIRED for q in co.expired_orders)
+    assert all(q.id == co.id for q in co.expired_orders)
+    assert co.expired_orders[0].price == float("inf")
+
+
+def test_bar_index1():
+    # 注文・ポジションはバー番号を保持し、時刻・価格はそこから参照される
+    import pickle
+
+    tester = bbt.BackTester(_read_test_df())
+    for i, item in tester.start():
+        if i == 3:
+            tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+        elif i == 5:
+            p = tester.positions()[0]
+            tester.exit(p, E.ExecutionType.MARKET)
+
+    p = tester.position_history[0]
+    assert p.open_i == 4
+    assert p.close_order.executed_i == 6
+    assert p.open_order.executed_at == tester._data[4]["timestamp"]
+    assert p.open_price == tester._data[4]["open"]
+    assert p.close_item == tester._data[6]
+
+    p_ = pickle.loads(pickle.dumps(tester.position_history))[0]
+    assert p_.gain == p.gain
+    assert p_.close_order.executed_at == p.close_order.executed_at
+    assert p_.close_item == p.close_item
+
+    # 終了した注文は参照するバーのみをpickleする。データが長くてもサイズは変わらない
+    df = _read_test_df()
+    df = pd.concat([df.shift(freq=f"{12 * k}min") for k in range(100)])
+    tester_ = bbt.BackTester(df)
+    for i, item in tester_.start():
+        if i == 3:
+            tester_.entry(E.Side.BUY, E.ExecutionType.MARKET)
+        elif i == 5:
+            tester_.exit(tester_.positions()[0], E.ExecutionType.MARKET)
+    p_ = tester_.position_history[0]
+    assert len(pickle.dumps(p_)) < len(pickle.dumps(p)) + 100
+    assert len(pickle.dumps(p_)) < len(pickle.dumps(df)) / 10
+
+
+def test_bar_index2(tmp_path):
+    # pickleした結果は元の``BackTester``がなくても、別のプロセスでも読める
+    import gc
+    import pickle
+    import subprocess
+    import sys
+
+    df = _read_test_df()
+    df["stop"] = df.close - 5000
+    tester = bbt.BackTester(df)
+    for i, item in tester.start(stop_i=10):
+        if i in [1, 5]:
+            tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+        elif i == 3:
+            tester.exit(tester.positions()[0], E.ExecutionType.MARKET)
+        elif i == 7:
+            p = tester.positions()[0]
+            spec = bbt.ExitSpec("close", 100000, losscut_key="stop")
+            co = tester.exit(p, E.ExecutionType.LIMIT, spec=spec)
+
+    # 未約定の注文は``Bars``（のデータ）ごとpickleし、ExitSpecのカラムは参照し直す
+    co_ = pickle.loads(pickle.dumps(co))
+    assert co_.bars is not tester._data
+    pd.testing.assert_frame_equal(co_.bars.df, tester._data.df)
+    assert co_._losscut_column == tester._data.column("stop")
+
+    path = tmp_path / "positions.pkl"
+    positions = tester.position_history + tester.positions()
+    expected = [(p.gain, str(p.open_order.executed_at)) for p in positions]
+    assert expected[0][0] is not None and expected[1][0] is None
+    path.write_bytes(pickle.dumps(positions))
+    del tester, co, p, positions
+    gc.collect()
+
+    positions = pickle.loads(path.read_bytes())
+    assert [(p.gain, str(p.open_order.executed_at)) for p in positions] == expected
+
+    code = (
+        "import pickle, sys;"
+        "ps = pickle.load(open(sys.argv[1], 'rb'));"
+        "print(repr([(p.gain, str(p.open_order.executed_at)) for p in ps]))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code, str(path)],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(bbt.__file__)),
+    ).stdout
+    assert out.strip() == repr(expected)
+
+
+def _checkpoint_strategy(tester, i, item):
+    if i % 3 == 0:
+        tester.entry(E.Side.BUY, E.ExecutionType.LIMIT, price=item["close"] - 1000)
+
+    for p in tester.positions(non_closing=True):
+        tester.exit(p, E.ExecutionType.LIMIT, price=item["close"] + 1000)
+
+
+def test_checkpoint1(tmp_path):
+    # チェックポイントから再開した結果は通しで実行した結果と一致する
+    path = str(tmp_path / "checkpoint.pkl")
+
+    tester = bbt.BackTester(_read_test_df())
+    for i, item in tester.start():
+        _checkpoint_strategy(tester, i, item)
+        if i == 5:
+            tester.checkpoint(path, extra={"i": i})
+    expected = tester.get_result_df()
+
+    tester = bbt.BackTester(_read_test_df())
+    assert tester.load_checkpoint(path) == {"i": 5}
+    for i, item in tester.resume():
+        assert i > 5
+        _checkpoint_strategy(tester, i, item)
+    pd.testing.assert_frame_equal(tester.get_result_df(), expected)
+
+    # ``stop_i``で止めた場合は止めたバーから再開する
+    tester = bbt.BackTester(_read_test_df())
+    for i, item in tester.start(stop_i=5):
+        _checkpoint_strategy(tester, i, item)
+    tester.checkpoint(path)
+
+    tester = bbt.BackTester(_read_test_df())
+    resumed = []
+    for i, item in tester.resume(path):
+        resumed.append(i)
+        _checkpoint_strategy(tester, i, item)
+    assert resumed[0] == 5
+    pd.testing.assert_frame_equal(tester.get_result_df(), expected)
+
+
+def test_checkpoint2(tmp_path):
+    # 同じファイルへのチェックポイントは差分の追記で、1回のサイズは履歴の長さによらない
+    path = str(tmp_path / "checkpoint.pkl")
+    df = _read_test_df()
+    df = pd.concat([df.shift(freq=f"{12 * k}min") for k in range(50)])
+
+    tester = bbt.BackTester(df)
+    for i, item in tester.start():
+        _checkpoint_strategy(tester, i, item)
+    expected = tester.get_result_df()
+
+    tester = bbt.BackTester(df)
+    sizes = []
+    for i, item in tester.start(stop_i=400):
+        _checkpoint_strategy(tester, i, item)
+        if i % 50 == 0:
+            tester.checkpoint(path, extra={"i": i})
+            sizes.append(os.path.getsize(path))
+    tester.checkpoint(path, extra={"i": 400})
+
+    growth = np.diff(sizes)
+    assert len(tester.position_history) > 100
+    assert growth.max() < 1.5 * growth.min()
+
+    # 読み込んだ後も同じファイルに追記でき、最後の状態から再開できる
+    tester = bbt.BackTester(df)
+    for i, item in tester.resume(path):
+        _checkpoint_strategy(tester, i, item)
+        if i == 500:
+            tester.checkpoint(path, extra={"i": i})
+    pd.testing.assert_frame_equal(tester.get_result_df(), expected)
+
+    tester = bbt.BackTester(df)
+    assert tester.load_checkpoint(path) == {"i": 500}
+    for i, item in tester.resume():
+        assert i > 500
+        _checkpoint_strategy(tester, i, item)
+    pd.testing.assert_frame_equal(tester.get_result_df(), expected)
+
+    # 書き込み途中で終了した末尾のレコード（ヘッダー・pickleの途中まで）は無視する
+    with open(path, "rb") as f:
+        data = f.read()
+    header = bbt.checkpoint._HEADER
+    offsets = [0]
+    while offsets[-1] < len(data):
+        (size, _) = header.unpack_from(data, offsets[-1])
+        offsets.append(offsets[-1] + header.size + size)
+    first = offsets[1]
+    for tail in [b"\x80\x05\x95", data[: first - 10]]:
+        with open(path, "wb") as f:
+            f.write(data + tail)
+        tester = bbt.BackTester(df)
+        assert tester.load_checkpoint(path) == {"i": 500}
+
+    # 途中のレコードの破損・前のレコードがない参照は例外とする
+    broken = bytearray(data)
+    broken[first - 10] ^= 0xFF
+    last = offsets[-2]
+    for corrupted in [bytes(broken), data[last:]]:
+        with open(path, "wb") as f:
+            f.write(corrupted)
+        with pytest.raises(pickle.UnpicklingError):
+            bbt.BackTester(df).load_checkpoint(path)
+
+
+def _read_ambiguous_df():
+    # 21:02の足で決済指値（105）とロスカット（95）の両方に触れる
+    s = """timestamp,open,high,low,close
+    2021-04-16 21:00:00,100,101,99.8,100
+    2021-04-16 21:01:00,100,100,99,100
+    2021-04-16 21:02:00,100,106,94,100
+    2021-04-16 21:03:00,100,100,99,100
+    """
+    df = pd.read_csv(StringIO(s), dtype={"open": float, "high": float})
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df.set_index("timestamp", inplace=True)
+    return df
+
+
+def _read_fine_df(exit_first):
+    # 21:02の足の中身（30秒足）
+    if exit_first:
+        highs, lows = [106.0, 100.0], [100.0, 94.0]
+    else:
+        highs, lows = [100.0, 106.0], [94.0, 100.0]
+    df = pd.DataFrame(
+        {"high": highs, "low": lows},
+        index=pd.date_range("2021-04-16 21:02:00", periods=2, freq="30s"),
+    )
+    df.index.name = "timestamp"
+    return df
+
+
+def test_fine1():
+    # 細かい足がある場合、決済指値とロスカットのどちらに先に触れたかで判定する
+    for fine_df, status, price in [
+        (None, E.OrderStatus.LOSSCUT, 94),
+        (_read_fine_df(True), E.OrderStatus.EXECUTED, 105),
+        (_read_fine_df(False), E.OrderStatus.LOSSCUT, 94),
+    ]:
+        fine = None if fine_df is None else bbt.refine.FineBars.from_frame(fine_df)
+
+        tester = bbt.BackTester(_read_ambiguous_df(), fine=fine)
+        for i, item in tester.start():
+            if i == 0:
+                tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+            elif i == 1:
+                p = tester.positions()[0]
+                tester.exit(p, E.ExecutionType.LIMIT, price=105, losscur_price=95)
+
+        co = tester.position_history[0].close_order
+        assert co.status == status
+        assert co.price == price
+        assert co.executed_at.minute == 2
+
+
+def _make_limit_strategy(width):
+    def strategy(tester, i, item):
+        if tester.status.order_num == 0 and tester.status.position_num == 0:
+            tester.entry(E.Side.BUY, E.ExecutionType.LIMIT, price=item["close"] - width)
+
+        for p in tester.positions(non_closing=True):
+            tester.exit(p, E.ExecutionType.LIMIT, price=item["close"] + width)
+
+    return strategy
+
+
+def test_multi1():
+    # 戦略ごとにBackTesterを実行した結果と一致する
+    strategies = {w: _make_limit_strategy(w) for w in [500, 1000, 2000]}
+
+    mt = bbt.MultiBackTester(_read_test_df(), strategies)
+    mt.run()
+    df_result = mt.get_result_df()
+
+    for w, strategy in strategies.items():
+        tester = bbt.BackTester(_read_test_df())
+        for i, item in tester.start():
+            strategy(tester, i, item)
+
+        # データは共有される
+        assert mt[w]._data is mt[500]._data
+        pd.testing.assert_frame_equal(
+            df_result.loc[w], tester.get_result_df(), check_dtype=False
+        )
+
+
+def test_portfolio1():
+    # 銘柄ごとのイベントは時刻順にマージされ、各銘柄の結果は単独で実行した場合と一致する
+    df_a = _read_test_df()
+    df_b = _read_test_df()
+    df_b.index = df_b.index + pd.Timedelta(seconds=30)
+    df_b[["open", "high", "low", "close"]] += 500
+
+    strategy = _make_limit_strategy(1000)
+
+    pt = bbt.PortfolioBackTester({"a": df_a, "b": df_b})
+    events = []
+    for symbol, i, item in pt.start():
+        events.append((item["timestamp"], symbol))
+        assert pt.latest(symbol) is item
+
+        if pt.status.order_num == 0 and pt.status.position_num == 0:
+            o = pt.entry(
+                symbol, E.Side.BUY, E.ExecutionType.LIMIT, price=item["close"] - 1000
+            )
+            assert o.symbol == symbol
+
+        for p in pt.positions(symbol, non_closing=True):
+            assert p.symbol == symbol
+            co = pt.exit(p, E.ExecutionType.LIMIT, price=item["close"] + 1000)
+            assert co.symbol == symbol
+
+    assert len(events) == len(df_a) + len(df_b)
+    assert events == sorted(events)
+
+    df_result = pt.get_result_df()
+    assert set(df_result.symbol) <= {"a", "b"}
+    assert (df_result.index == df_result.index.sort_values()).all()
+
+    # 銘柄ごとに独立の戦略の場合
+    pt = bbt.PortfolioBackTester({"a": df_a, "b": df_b})
+    for symbol, i, item in pt.start():
+        strategy(pt.testers[symbol], i, item)
+
+    df_result = pt.get_result_df()
+    for symbol, df in [("a", df_a), ("b", df_b)]:
+        tester = bbt.BackTester(df)
+        for i, item in tester.start():
+            strategy(tester, i, item)
+
+        expected = tester.get_result_df()
+        actual = df_result[df_result.symbol == symbol].drop(columns="symbol")
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_portfolio2():
+    # 他の銘柄のイベントで出した注文は、その銘柄の同じ時刻のバーでは約定しない（銘柄の
+    # 順序によらない）
+    df_a = _read_test_df()
+    df_b = _read_test_df()
+    df_b[["open", "high", "low", "close"]] += 500
+
+    def run(dfs):
+        pt = bbt.PortfolioBackTester(dfs)
+        for symbol, i, item in pt.start():
+            # 他の銘柄の新規注文と、自分の銘柄の決済注文
+            if i % 2 == 0:
+                pt.entry(
+                    "b" if symbol == "a" else "a", E.Side.BUY, E.ExecutionType.MARKET
+                )
+            for p in pt.positions(symbol, non_closing=True):
+                pt.exit(p, E.ExecutionType.MARKET)
+        df_result = pt.get_result_df()
+        return df_result.sort_values(["symbol", "oo_executed_at"])
+
+    df_ab = run({"a": df_a, "b": df_b})
+    df_ba = run({"b": df_b, "a": df_a})
+    assert len(df_ab) > 1
+    assert (df_ab.oo_executed_at > df_ab.index).all()
+    pd.testing.assert_frame_equal(df_ab.reset_index(), df_ba.reset_index())
+
+
+def test_live1(tmp_path):
+    # 非同期に届くバーで実行した結果はBackTesterと一致する
+    strategy = _make_limit_strategy(1000)
+
+    async def async_strategy(tester, i, item):
+        strategy(tester, i, item)
+
+    tester = bbt.BackTester(_read_test_df())
+    for i, item in tester.start():
+        strategy(tester, i, item)
+    df_expected = tester.get_result_df()
+
+    runner = bbt.live.LiveRunner(async_strategy)
+    asyncio.run(runner.run(bbt.live.replay(_read_test_df())))
+
+    pd.testing.assert_frame_equal(
+        runner.tester.get_result_df(), df_expected, check_dtype=False
+    )
+    assert len(runner.latencies) == len(_read_test_df())
+    assert runner.latency_report()["count"] == len(_read_test_df())
+
+    # CSVファイルの追記を追跡する
+    path = tmp_path / "bars.csv"
+    _read_test_df().to_csv(path)
+    runner = bbt.live.LiveRunner(strategy)
+    asyncio.run(
+        runner.run(bbt.live.tail_csv(path, poll_interval=0.01, idle_timeout=0.05))
+    )
+
+    pd.testing.assert_frame_equal(
+        runner.tester.get_result_df(), df_expected, check_dtype=False
+    )
+
+
+def test_cache1(tmp_path):
+    # BackTesterの結果（DataFrame）をキャッシュする。サイズの上限を超えたら古いものから消す
+    def run(width):
+        tester = bbt.BackTester(_read_test_df())
+        strategy = _make_limit_strategy(width)
+        for i, item in tester.start():
+            strategy(tester, i, item)
+        return tester.get_result_df()
+
+    cache = bbt.cache.ResultCache(tmp_path)
+    key = cache.key("limit_strategy", _read_test_df(), {"width": 1000})
+    df_result = cache.get_or_run(key, lambda: run(1000))
+
+    pd.testing.assert_frame_equal(cache.get_or_run(key, lambda: None), df_result)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    size = cache.stats()["bytes"]
+    cache = bbt.cache.ResultCache(tmp_path, max_bytes=int(size * 2.5))
+    for width in [500, 2000]:
+        key_ = cache.key("limit_strategy", _read_test_df(), {"width": width})
+        cache.get_or_run(key_, lambda: run(width))
+    assert cache.stats()["entries"] == 2
+    assert cache.get(key) is None
+
+
+def test_entry_many1():
+    # まとめて出した注文の結果は、1つずつ出した場合と一致する
+    def run(bulk):
+        tester = bbt.BackTester(_read_test_df())
+        ladder = []
+        for i, item in tester.start():
+            prices = [item["close"] - 500 * (k + 1) for k in range(5)]
+            if bulk:
+                ladder = tester.replace_many(
+                    ladder,
+                    E.Side.BUY,
+                    E.ExecutionType.LIMIT,
+                    prices,
+                    expire_seconds=120,
+                )
+                tester.exit_many(
+                    tester.positions(non_closing=True),
+                    E.ExecutionType.LIMIT,
+                    item["close"] + 1000,
+                )
+            else:
+                tester.cancel_many(ladder)
+                ladder = [
+                    tester.entry(
+                        E.Side.BUY, E.ExecutionType.LIMIT, price=p, expire_seconds=120
+                    )
+                    for p in prices
+                ]
+                for p in tester.positions(non_closing=True):
+                    tester.exit(p, E.ExecutionType.LIMIT, price=item["close"] + 1000)
+
+        return tester.get_result_df()
+
+    df_result = run(bulk=True)
+    assert len(df_result) > 0
+    pd.testing.assert_frame_equal(df_result, run(bulk=False))
+
+
+def _read_random_walk_df(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 6750000 + np.cumsum(rng.normal(0, 2000, n))
+    open_ = np.r_[close[0], close[:-1]]
+    df = pd.DataFrame(
+        {
+            "open": open_,
+            "high": np.maximum(open_, close) + rng.uniform(0, 3000, n),
+            "low": np.minimum(open_, close) - rng.uniform(0, 3000, n),
+            "close": close,
+        },
+        index=pd.date_range("2021-04-16 21:00:00", periods=n, freq="1min"),
+    )
+    df.index.name = "timestamp"
+    return df
+
+
+def test_exit_spec1():
+    # ExitSpecはupdate_fn_or_price_key・market_entry_fnで同じ指定をした場合と一致する
+    df = _read_random_walk_df()
+    df["flag"] = np.arange(len(df)) % 11 == 0
+    df["stop"] = df.close.median() - 10000
+
+    def run(use_spec, exec_type):
+        tester = bbt.BackTester(df)
+        spec = bbt.ExitSpec("close", 3000, 120, "stop", "flag")
+        for i, item in tester.start():
+            if tester.status.order_num == 0 and tester.status.position_num == 0:
+                tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+
+            if use_spec == "many":
+                # exit_manyでもspecの指値の更新間隔を使う
+                tester.exit_many(
+                    tester.positions(non_closing=True), exec_type, spec=spec
+                )
+                continue
+
+            for p in tester.positions(non_closing=True):
+                if use_spec:
+                    tester.exit(p, exec_type, spec=spec)
+                else:
+                    tester.exit(
+                        p,
+                        exec_type,
+                        price=item["close"] + 3000,
+                        losscur_price=item["stop"],
+                        expire_seconds=120,
+                        update_fn_or_price_key=lambda item_, o: item_["close"] + 3000,
+                        market_entry_fn=lambda item_, o: item_["flag"],
+                    )
+        return tester.get_result_df()
+
+    for exec_type in [E.ExecutionType.LIMIT, E.ExecutionType.MARKET]:
+        df_result = run(True, exec_type)
+        assert len(df_result) > 1
+        pd.testing.assert_frame_equal(df_result, run(False, exec_type))
+        pd.testing.assert_frame_equal(df_result, run("many", exec_type))
+
+    assert (df_result.co_status == "LOSSCUT").any()
+
+
+def test_trade_log1(tmp_path):
+    # trade_logに書き出した結果はメモリ上の結果と一致する
+    pytest.importorskip("pyarrow")
+    df = _read_random_walk_df()
+
+    def run(stop_i=None, **kwargs):
+        tester = bbt.BackTester(df, **kwargs)
+        for i, item in tester.start(stop_i=stop_i):
+            if tester.status.order_num == 0 and tester.status.position_num == 0:
+                tester.entry(E.Side.BUY, E.ExecutionType.LIMIT, item["close"] - 1000)
+            for p in tester.positions(non_closing=True):
+                tester.exit(p, E.ExecutionType.LIMIT, price=item["close"] + 1000)
+        return tester
+
+    expected = run()
+    tester = run(trade_log=str(tmp_path), trade_log_batch=7)
+    assert len(tester.position_history) == 0
+    assert len(tester.order_history) == 0
+
+    df_expected = expected.get_result_df()
+    assert len(df_expected) > 7
+    # Noneのみのカラムも型が決まる（時刻はNaT）
+    df_result = tester.get_result_df()
+    pd.testing.assert_frame_equal(
+        df_result, df_expected.astype(df_result.dtypes.to_dict())
+    )
+
+    df_orders = tester.trade_log.read_orders()
+    assert len(df_orders) == len(expected.order_history)
+    assert set(df_orders.status) == {o.status.name for o in expected.order_history}
+
+    # 後から必要なカラムのみ読む
+    df_result = bbt.BackTester.read_result(str(tmp_path), columns=["co_price"])
+    assert "co_price" in df_result and "oo_price" not in df_result
+    np.testing.assert_array_equal(df_result.gain, df_expected.gain)
+
+
+def test_trade_log2(tmp_path):
+    # 終了前（``stop_i``で止めた後・異常終了した後）でも書き出し済みの分を読める
+    pytest.importorskip("pyarrow")
+    df = _read_random_walk_df()
+
+    def run(stop_i, **kwargs):
+        tester = bbt.BackTester(df, **kwargs)
+        for i, item in tester.start(stop_i=stop_i):
+            if tester.status.order_num == 0 and tester.status.position_num == 0:
+                tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+            for p in tester.positions(non_closing=True):
+                tester.exit(p, E.ExecutionType.LIMIT, price=item["close"] + 1000)
+            if stop_i is None and i == len(df) // 2:
+                # ループの途中
+                assert len(tester.get_result_df()) == tester.trade_log.position_num
+        return tester
+
+    stop_i = len(df) // 2
+    df_expected = run(stop_i).get_result_df()
+    assert len(df_expected) > 5
+
+    tester = run(stop_i, trade_log=str(tmp_path), trade_log_batch=5)
+    # ``close``していない状態で、書き出し済みのバッチのみをディスクから読む
+    df_disk = bbt.BackTester.read_result(str(tmp_path))
+    assert len(df_disk) == len(df_expected) // 5 * 5
+    np.testing.assert_array_equal(df_disk.gain, df_expected.gain[: len(df_disk)])
+
+    # バッファ中の分も含めて読む
+    df_result = tester.get_result_df()
+    np.testing.assert_array_equal(df_result.gain, df_expected.gain)
+
+    run(None, trade_log=str(tmp_path / "full"), trade_log_batch=5)
+
+
+def test_trace1(tmp_path):
+    # トレースのイベントは注文・ポジションの履歴と一致する
+    df = _read_random_walk_df()
+    df["stop"] = df.close.median() - 10000
+
+    def run(**kwargs):
+        tester = bbt.BackTester(df)
+        tracer = tester.enable_trace(**kwargs)
+        for i, item in tester.start():
+            if tester.status.order_num == 0 and tester.status.position_num == 0:
+                tester.entry(E.Side.BUY, E.ExecutionType.LIMIT, item["close"] - 1000)
+            for p in tester.positions(non_closing=True):
+                spec = bbt.ExitSpec("close", 3000, 120, "stop")
+                tester.exit(p, E.ExecutionType.LIMIT, spec=spec)
+        return tester, tracer
+
+    tester, tracer = run()
+    df_trace = tracer.to_df()
+    counts = df_trace.event.value_counts()
+    df_result = tester.get_result_df()
+
+    assert counts["ORDER_ENTRY"] == len(tester.order_history)
+    assert counts["POSITION_OPEN"] == counts["POSITION_CLOSE"] == len(df_result)
+    assert counts["ORDER_LOSSCUT"] == (df_result.co_status == "LOSSCUT").sum()
+    assert counts["ORDER_REQUOTE"] > 0
+
+    df_close = df_trace[df_trace.event == "POSITION_CLOSE"]
+    np.testing.assert_array_equal(df_close.price, df_result.co_price)
+    np.testing.assert_array_equal(
+        df_close.timestamp, df_result.co_executed_at.to_numpy()
+    )
+
+    text = tracer.to_text().split("\n")
+    assert len(text) == len(df_trace)
+    assert text[0].startswith("ORDER ENTRY")
+
+    # リングバッファは直近のイベントのみを保持する。ファイルに書いた場合はloadで読める
+    path = str(tmp_path / "trace.npy")
+    _, tracer = run(capacity=50, path=path)
+    assert tracer.num_events == len(df_trace)
+    records = bbt.trace.load(path)
+    np.testing.assert_array_equal(records, tracer.records)
+    pd.testing.assert_frame_equal(
+        bbt.trace.decode(records).drop(columns="seq"),
+        df_trace.drop(columns=["seq", "timestamp"]).tail(50).reset_index(drop=True),
+    )
+
+
+def test_intervals2():
+    # 最下段が埋まっていない木（任意の件数）でも全行を比較した結果と一致する
+    rng = np.random.default_rng(1)
+    base = pd.Timestamp("2021-04-16 21:00:00")
+    for n in list(range(1, 70)) + rng.integers(70, 2000, 30).tolist():
+        starts = np.sort(rng.integers(0, 100, n))
+        ends = starts + rng.integers(0, int(rng.integers(1, 60)), n)
+        df = pd.DataFrame(
+            {
+                "oo_executed_at": base + pd.to_timedelta(starts, "s"),
+                "co_executed_at": base + pd.to_timedelta(ends, "s"),
+            }
+        )
+        intervals = bbt.intervals.TradeIntervals(df)
+        for t in range(0, 170, 7):
+            t0, t1 = t, t + int(rng.integers(1, 20))
+            np.testing.assert_array_equal(
+                intervals.at_indices(base + pd.Timedelta(seconds=t0)),
+                np.flatnonzero((starts <= t0) & (ends > t0)),
+            )
+            np.testing.assert_array_equal(
+                intervals.overlap_indices(
+                    base + pd.Timedelta(seconds=t0), base + pd.Timedelta(seconds=t1)
+                ),
+                np.flatnonzero((starts < t1) & (ends > t0)),
+            )
+
+
+def test_intervals1():
+    # 区間木による検索は、全行を比較した結果と一致する
+    rng = np.random.default_rng(0)
+    n = 1000
+    base = pd.Timestamp("2021-04-16 21:00:00")
+    starts = rng.integers(0, 10000, n)
+    df = pd.DataFrame(
+        {
+            "oo_executed_at": base + pd.to_timedelta(starts, "s"),
+            "co_executed_at": base
+            + pd.to_timedelta(starts + rng.integers(0, 500, n), "s"),
+        }
+    )
+    # 未決済
+    df.loc[df.index[::50], "co_executed_at"] = pd.NaT
+    end_at = df.co_executed_at.fillna(pd.Timestamp.max)
+
+    intervals = bbt.intervals.TradeIntervals(df)
+    for _ in range(100):
+        t0 = base + pd.Timedelta(seconds=int(rng.integers(-100, 11000)))
+        t1 = t0 + pd.Timedelta(seconds=int(rng.integers(1, 800)))
+
+        expected = df[(df.oo_executed_at <= t0) & (end_at > t0)]
+        pd.testing.assert_frame_equal(intervals.at(t0), expected)
+        assert intervals.count_at(t0) == len(expected)
+
+        expected = df[(df.oo_executed_at < t1) & (end_at > t0)]
+        pd.testing.assert_frame_equal(intervals.overlap(t0, t1), expected)
+
+    s = intervals.concurrency()
+    assert s.index.is_monotonic_increasing
+    for t in s.index[::10]:
+        assert s[t] == intervals.count_at(t)
+
+    # BackTesterの結果
+    df = _read_random_walk_df()
+    tester = bbt.BackTester(df)
+    for i, item in tester.start():
+        if i % 3 == 0:
+            tester.entry(E.Side.BUY, E.ExecutionType.MARKET)
+        for p in tester.positions(non_closing=True):
+            tester.exit(p, E.ExecutionType.LIMIT, price=item["close"] + 1000)
+    df_result = tester.get_result_df()
+
+    intervals = bbt.intervals.TradeIntervals(tester)
+    assert intervals.concurrency().max() > 1
+    t = df.index[len(df) // 2]
+    expected = df_result[
+        (df_result.oo_executed_at <= t) & (df_result.co_executed_at > t)
+    ]
+    pd.testing.assert_frame_equal(intervals.at(t), expected)
+
+
+def test_reprice1():
+    # 手数料・スリッページのシナリオは、それらを与えて実行し直した結果と一致する
+    df = _read_random_walk_df()
+
+    def run(df_, slippage):
+        tester = bbt.BackTester(df_)
+        for i, item in tester.start():
+            if tester.status.order_num == 0 and tester.status.position_num == 0:
+                tester.entry(
+                    E.Side.SELL, E.ExecutionType.MARKET, market_slippage=slippage
+                )
+            for p in tester.positions(non_closing=True):
+                if p.id % 2:
+                    tester.exit(
+                        p,
+                        E.ExecutionType.LIMIT,
+                        price=item["close"] - 1000,
+                        losscur_price=item["close"] + 1500,
+                        market_slippage=slippage,
+                    )
+                else:
+                    tester.exit(p, E.ExecutionType.MARKET, market_slippage=slippage)
+        return tester.get_result_df()
+
+    df_base = run(df, 0)
+    assert (df_base.co_status == "LOSSCUT").any()
+    scenarios = {
+        "base": bbt.scenarios.Scenario(),
+        "fee": bbt.scenarios.Scenario(maker_fee=-0.0002, taker_fee=0.0007),
+        "slippage": bbt.scenarios.Scenario(
+            maker_fee=0.0001, taker_fee=0.0005, market_slippage=500
+        ),
+    }
+    repriced = bbt.scenarios.reprice(df_base, scenarios)
+    assert repriced.gains.shape == (len(df_base), 3)
+    np.testing.assert_allclose(repriced.gains["base"], df_base.gain)
+
+    for name, slippage in [("fee", 0), ("slippage", 500)]:
+        s = scenarios[name]
+        df_fee = df.assign(maker_fee=s.maker_fee, taker_fee=s.taker_fee)
+        expected = run(df_fee, slippage).gain
+        np.testing.assert_allclose(repriced.gains[name], expected, atol=1e-12)
+        assert repriced.metrics.loc[name, "total"] == pytest.approx(expected.sum())
+        assert repriced.metrics.loc[name, "win_rate"] == (expected > 0).mean()
+
+    # limit_simulationの結果（ロスカットのスリッページ）
+    df["buy_price"] = df.close - 1000
+    df["sell_price"] = df.close + 1000
+    kw = dict(timelimit=(300, 600), losscut_prices=df.close - 1500)
+    df_result = bbt.fast.limit_simulation(df, 1, losscut_slippage=0, **kw)
+    repriced = bbt.scenarios.reprice(
+        df_result, [bbt.scenarios.Scenario(losscut_slippage=700)], side=1
+    )
+    expected = bbt.fast.limit_simulation(df, 1, losscut_slippage=700, **kw)
+    expected = expected.profit.dropna()
+    assert (
+        df_result.loc[expected.index].status == bbt.fast.tester.Status.LOSSCUT
+    ).any()
+    np.testing.assert_allclose(repriced.gains[0], expected)
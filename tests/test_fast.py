@@ -0,0 +1,402 @@
+import pytest
+import numba
+import numpy as np
+import pandas as pd
+
+import botbacktester as bbt
+import botbacktester.enums as E
+from botbacktester.fast import engine
+from botbacktester.fast.tester import NAT, Status
+
+
+def _read_test_df(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 6750000 + np.cumsum(rng.normal(0, 2000, n))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.uniform(0, 3000, n)
+    low = np.minimum(open_, close) - rng.uniform(0, 3000, n)
+
+    df = pd.DataFrame(
+        {"open": open_, "high": high, "low": low, "close": close},
+        index=pd.date_range("2021-04-16 21:00:00", periods=n, freq="1min", tz="UTC"),
+    )
+    df.index.name = "timestamp"
+    df["buy_price"] = df.close - 2000
+    df["sell_price"] = df.close + 2000
+    return df
+
+
+def test_return_type1():
+    # "arrays"は型付きのカラムを返し、"frame"と同じ値になる
+    df = _read_test_df()
+    kw = dict(timelimit=(600, 1200), losscut_prices=df.close - 5000)
+
+    df_result = bbt.fast.limit_simulation(df, 1, **kw)
+    arrays = bbt.fast.limit_simulation(df, 1, return_type="arrays", **kw)
+
+    assert arrays["timestamp"].dtype == np.int64
+    assert arrays["entry_at"].dtype == np.int64
+    assert arrays["status"].dtype == np.int8
+    assert arrays["profit"].dtype == np.float64
+
+    assert (arrays["entry_at"] == NAT).sum() == df_result.entry_at.isna().sum()
+    assert set(np.unique(arrays["status"])) <= set(Status)
+    np.testing.assert_array_equal(arrays["status"], df_result.status.values)
+    np.testing.assert_array_equal(arrays["profit"], df_result.profit.values)
+    np.testing.assert_array_equal(
+        arrays["exit_at"][arrays["exit_at"] != NAT],
+        df_result.exit_at.dropna().values.astype("datetime64[ns]").view(np.int64),
+    )
+
+
+def test_limit_simulation_multi1():
+    # 銘柄ごとにlimit_simulationを呼んだ結果と一致する
+    data = {s: _read_test_df(n=100 + 50 * k, seed=k) for k, s in enumerate("abc")}
+    kw = dict(timelimit=(600, 1200))
+
+    df_result = bbt.fast.limit_simulation_multi(data, -1, **kw)
+    assert df_result.index.names == ["symbol", "timestamp"]
+
+    for s, df in data.items():
+        expected = bbt.fast.limit_simulation(df, -1, **kw)
+        pd.testing.assert_frame_equal(df_result.loc[s], expected, check_freq=False)
+
+    # long形式
+    df_long = pd.concat([df.assign(symbol=s) for s, df in data.items()])
+    df_long = df_long.sample(frac=1, random_state=0)
+    pd.testing.assert_frame_equal(
+        bbt.fast.limit_simulation_multi(df_long, -1, **kw), df_result
+    )
+
+
+def test_max_concurrent1():
+    # 同時に1つまで。前の取引が終わるまでのシグナルはSKIPPEDになる
+    df = _read_test_df()
+    kw = dict(timelimit=(5, 20), timelimit_type="bar")
+
+    df_all = bbt.fast.limit_simulation(df, 1, **kw)
+    df_one = bbt.fast.limit_simulation(df, 1, max_concurrent=1, **kw)
+
+    taken = df_one.status != Status.SKIPPED
+    assert (~taken).sum() > 0
+
+    # 評価されたシグナルの結果は独立に評価した場合と同じ
+    pd.testing.assert_frame_equal(df_one[taken], df_all[taken])
+
+    ts = df.index
+    release = -1
+    for i, row in enumerate(df_one.itertuples()):
+        if row.status == Status.SKIPPED:
+            assert i < release
+            continue
+
+        assert i >= release
+        if not pd.isna(row.exit_at):
+            release = ts.get_loc(row.exit_at)
+        elif pd.isna(row.entry_at):
+            # エントリーのタイムアウト
+            release = i + 5 + 1
+        else:
+            release = len(df)
+
+
+def test_parallel1():
+    # 並列版は逐次版と完全に一致する
+    df = _read_test_df(n=500)
+    entry_filter = (np.arange(len(df)) % 7 != 0).astype(int)
+
+    for side, losscut_prices in [(1, df.close - 5000), (-1, df.close + 5000)]:
+        kw = dict(
+            timelimit=(600, 1800),
+            losscut_prices=losscut_prices,
+            entry_filter=entry_filter,
+        )
+        pd.testing.assert_frame_equal(
+            bbt.fast.limit_simulation(df, side, parallel=True, **kw),
+            bbt.fast.limit_simulation(df, side, **kw),
+            check_exact=True,
+        )
+
+
+def _ambiguous_df():
+    # 21:02の足でエグジット指値（105）とロスカット（95）の両方に触れる
+    df = pd.DataFrame(
+        {
+            "open": [100, 100, 100, 100],
+            "high": [101, 100, 106, 100],
+            "low": [99.8, 99, 94, 99],
+            "close": [100, 100, 100, 100],
+        },
+        index=pd.date_range("2021-04-16 21:00:00", periods=4, freq="1min", tz="UTC"),
+    ).astype(float)
+    df.index.name = "timestamp"
+    return df
+
+
+def _fine_df(exit_first):
+    # 21:02の足の中身（30秒足）
+    highs, lows = ([106, 100], [100, 94]) if exit_first else ([100, 106], [94, 100])
+    df = pd.DataFrame(
+        {"high": highs, "low": lows},
+        index=pd.date_range("2021-04-16 21:02:00", periods=2, freq="30s", tz="UTC"),
+    ).astype(float)
+    df.index.name = "timestamp"
+    return df
+
+
+def test_fine1(tmp_path):
+    # 細かい足がある場合、曖昧な足ではどちらが先に触れたかで判定する
+    df = _ambiguous_df()
+    kw = dict(
+        entry_prices=np.full(len(df), 99.5),
+        exit_prices=np.full(len(df), 105.0),
+        losscut_prices=np.full(len(df), 95.0),
+        losscut_slippage=0,
+    )
+
+    df_result = bbt.fast.limit_simulation(df, 1, **kw)
+    assert df_result.status.iloc[0] == Status.LOSSCUT
+
+    for exit_first, status, price in [
+        (True, Status.SUCCESS, 105),
+        (False, Status.LOSSCUT, 95),
+    ]:
+        path = str(tmp_path / str(exit_first))
+        bbt.refine.FineBars.from_frame(_fine_df(exit_first)).save(path)
+        fine = bbt.refine.FineBars.load(path)
+
+        df_result = bbt.fast.limit_simulation(df, 1, fine=fine, **kw)
+        assert df_result.status.iloc[0] == status
+        assert df_result.exit_price.iloc[0] == price
+
+
+def test_cache1(tmp_path):
+    # 2回目はキャッシュから同じ結果を返す。入力が変わればキャッシュされない
+    df = _read_test_df()
+    cache = bbt.cache.ResultCache(tmp_path)
+
+    df_result1 = bbt.fast.limit_simulation(df, 1, timelimit=600, cache=cache)
+    df_result2 = bbt.fast.limit_simulation(df, 1, timelimit=600, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    pd.testing.assert_frame_equal(df_result1, df_result2, check_exact=True)
+    pd.testing.assert_frame_equal(
+        df_result1, bbt.fast.limit_simulation(df, 1, timelimit=600)
+    )
+
+    bbt.fast.limit_simulation(df, 1, timelimit=300, cache=cache)
+    df.iloc[10, df.columns.get_loc("buy_price")] += 1
+    bbt.fast.limit_simulation(df, 1, timelimit=600, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.stats()["entries"] == 3
+
+
+def test_cache2(tmp_path, monkeypatch):
+    # ソースコード（カーネルの実装）が変わった場合はキャッシュを使わない
+    df = _read_test_df(n=500)
+    cache = bbt.cache.ResultCache(tmp_path)
+
+    bbt.fast.limit_simulation(df, 1, timelimit=600, cache=cache)
+    monkeypatch.setattr(bbt.cache, "_SOURCE_HASH", "changed")
+    bbt.fast.limit_simulation(df, 1, timelimit=600, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    monkeypatch.undo()
+    bbt.fast.limit_simulation(df, 1, timelimit=600, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_previous1():
+    # バーを追加したデータに対して前回の結果を与えた場合は、全体を評価した場合と一致する
+    df = _read_test_df(n=500)
+
+    for side in [1, -1]:
+        for kw in [
+            dict(timelimit=(600, 1800), losscut_prices=df.close - side * 5000),
+            dict(timelimit=(5, 20), timelimit_type="bar", max_concurrent=2),
+            dict(timelimit=np.inf, entry_filter=(np.arange(len(df)) % 3 != 0)),
+        ]:
+            df_expected = bbt.fast.limit_simulation(df, side, **kw)
+
+            n = 300
+            kw_head = {
+                k: (v[:n] if isinstance(v, (pd.Series, np.ndarray)) else v)
+                for (k, v) in kw.items()
+            }
+            for return_type in ["frame", "arrays"]:
+                previous = bbt.fast.limit_simulation(
+                    df.iloc[:n], side, return_type=return_type, **kw_head
+                )
+                pd.testing.assert_frame_equal(
+                    bbt.fast.limit_simulation(df, side, previous=previous, **kw),
+                    df_expected,
+                    check_exact=True,
+                )
+
+
+@numba.njit
+def _engine_strategy(i, timestamps, data, orders, positions, state):
+    out = engine.instructions(len(positions) + 1)
+    n = 0
+    close, signal = data[i, 0], data[i, 1]
+
+    if len(orders) == 0 and len(positions) == 0:
+        exec_type = engine.MARKET if i % 3 == 0 else engine.LIMIT
+        n = engine.set_entry(out, n, int(signal), exec_type, close - signal * 1000, 120)
+
+    for p in range(len(positions)):
+        if positions[p].closing == -1:
+            side = positions[p].side
+            n = engine.set_exit(
+                out, n, p, engine.LIMIT, close + side * 1500, 300, close - side * 4000
+            )
+
+    return out[:n]
+
+
+def test_engine1():
+    # コンパイルした戦略の結果は、同じ戦略をBackTesterで実行した場合と一致する
+    df = _read_test_df(n=500)
+    df["signal"] = np.where(np.arange(len(df)) // 50 % 2 == 0, 1, -1)
+
+    tester = bbt.BackTester(df)
+    for i, item in tester.start():
+        side = E.Side.BUY if item["signal"] == 1 else E.Side.SELL
+        if tester.status.order_num == 0 and tester.status.position_num == 0:
+            exec_type = E.ExecutionType.MARKET if i % 3 == 0 else E.ExecutionType.LIMIT
+            tester.entry(
+                side,
+                exec_type,
+                price=item["close"] - item["signal"] * 1000,
+                expire_seconds=120,
+            )
+
+        for p in tester.positions(non_closing=True):
+            s = 1 if p.side == E.Side.BUY else -1
+            tester.exit(
+                p,
+                E.ExecutionType.LIMIT,
+                price=item["close"] + s * 1500,
+                losscur_price=item["close"] - s * 4000,
+                expire_seconds=300,
+            )
+
+    df_result = bbt.fast.run_strategy(df, _engine_strategy, columns=["close", "signal"])
+    df_expected = tester.get_result_df()[df_result.columns]
+
+    assert set(df_result.co_status) >= {"EXECUTED", "LOSSCUT"}
+    assert set(df_result.oo_side) == {"BUY", "SELL"}
+    pd.testing.assert_frame_equal(
+        df_result, df_expected, check_dtype=False, check_index_type=False
+    )
+
+
+def _naive_equity(df, entry_i, exit_i, entry_price, sign, gain):
+    # バーごとに全トレードを見て時価評価する
+    close = df.close.values
+    equity = np.zeros(len(df))
+    for t in range(len(df)):
+        for a, b, p, s, g in zip(entry_i, exit_i, entry_price, sign, gain):
+            if b <= t:
+                equity[t] += g
+            elif a <= t:
+                equity[t] += s * (close[t] / p - 1)
+    return equity
+
+
+def test_equity_curve1():
+    # 差分配列による損益曲線は、バーごとに時価評価したものと一致する
+    df = _read_test_df()
+    index = df.index
+
+    # limit_simulation（未決済のシグナルを含む）
+    kw = dict(timelimit=(600, 6000), losscut_prices=df.close + 8000)
+    df_result = bbt.fast.limit_simulation(df, -1, **kw)
+    arrays = bbt.fast.limit_simulation(df, -1, return_type="arrays", **kw)
+    df_curve = bbt.evaluate.equity_curve(df_result, df, side=-1)
+    pd.testing.assert_frame_equal(
+        bbt.evaluate.equity_curve(arrays, df, side=-1), df_curve
+    )
+
+    r = df_result.dropna(subset=["entry_at"])
+    assert r.exit_at.isna().any()
+    closed = r.exit_at.notna()
+    expected = _naive_equity(
+        df,
+        index.get_indexer(r.entry_at),
+        np.where(closed, index.get_indexer(r.exit_at.fillna(index[0])), len(df)),
+        r.entry_price.values,
+        np.full(len(r), -1.0),
+        r.profit.values,
+    )
+    np.testing.assert_allclose(df_curve.equity, expected, atol=1e-12)
+    assert df_curve.exposure.max() > 1
+    assert (df_curve.net_exposure == -df_curve.exposure).all()
+    assert (df_curve.drawdown <= 0).all()
+
+    # BackTester
+    tester = bbt.BackTester(df)
+    for i, item in tester.start():
+        if tester.status.order_num == 0 and tester.status.position_num == 0:
+            side = [E.Side.BUY, E.Side.SELL][len(tester.position_history) % 2]
+            tester.entry(side, E.ExecutionType.MARKET)
+        for p in tester.positions(non_closing=True):
+            tester.exit(p, E.ExecutionType.LIMIT, price=item["close"])
+    r = tester.get_result_df()
+    df_curve = bbt.evaluate.equity_curve(tester, df)
+
+    expected = _naive_equity(
+        df,
+        index.get_indexer(r.oo_executed_at),
+        index.get_indexer(r.co_executed_at),
+        r.oo_price.values,
+        np.where(r.side == "BUY", 1.0, -1.0),
+        r.gain.values,
+    )
+    np.testing.assert_allclose(df_curve.equity, expected, atol=1e-12)
+    assert df_curve.realized.iloc[-1] == pytest.approx(r.gain.sum())
+    assert set(df_curve.net_exposure) == {-1, 0, 1}
+
+
+def test_window_stats1():
+    # 累積和による区間集計は、区間ごとに絞り込んで集計した結果と一致する
+    df = _read_test_df(n=1000)
+    df_result = bbt.fast.limit_simulation(
+        df, 1, timelimit=(600, 1800), losscut_prices=df.close - 5000
+    )
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, 900, 50)
+    windows = np.c_[starts, starts + rng.integers(0, 100, 50)]
+    masks = {"all": np.ones(len(df), dtype=bool), "up": (df.close.diff() > 0).values}
+
+    df_stats = bbt.fast.window_stats(df_result, windows, masks)
+    assert df_stats.index.names == ["mask", "window"]
+    for name, mask in masks.items():
+        for k, (s, e) in enumerate(windows):
+            profit = df_result.profit.iloc[s:e][mask[s:e]].dropna()
+            r = df_stats.loc[(name, k)]
+            assert r["count"] == len(profit)
+            if len(profit) == 0:
+                assert np.isnan(r["mean"])
+                continue
+            assert r["mean"] == pytest.approx(profit.mean())
+            assert r["win_rate"] == pytest.approx((profit > 0).mean())
+            if len(profit) > 1:
+                assert r["std"] == pytest.approx(profit.std())
+                assert r["sharpe"] == pytest.approx(profit.mean() / profit.std())
+
+    # 時刻による区間・"arrays"の結果・マスクなし
+    arrays = bbt.fast.limit_simulation(
+        df,
+        1,
+        timelimit=(600, 1800),
+        losscut_prices=df.close - 5000,
+        return_type="arrays",
+    )
+    windows_ts = np.c_[df.index[windows[:, 0]], df.index[windows[:, 1]]]
+    pd.testing.assert_frame_equal(
+        bbt.fast.window_stats(arrays, windows_ts),
+        bbt.fast.window_stats(df_result, windows),
+    )
+    pd.testing.assert_frame_equal(
+        bbt.fast.window_stats(df_result, windows, masks["up"]),
+        df_stats.loc["up"].rename_axis("window"),
+    )
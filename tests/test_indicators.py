@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+import botbacktester.indicators as ind
+
+
+def _read_test_df(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1e6 + np.cumsum(rng.normal(0, 1000, n))
+    high = close + rng.uniform(0, 1000, n)
+    low = close - rng.uniform(0, 1000, n)
+    return pd.DataFrame({"high": high, "low": low, "close": close})
+
+
+def test_incremental1():
+    # インクリメンタル版とバッチ版の値は完全に一致する
+    df = _read_test_df()
+
+    ema, atr = ind.EMA(20), ind.ATR(14)
+    rmax, rmin, rstat = ind.RollingMax(30), ind.RollingMin(30), ind.RollingMeanStd(30)
+    cross, fast_ema = ind.Crossover(), ind.EMA(5)
+
+    rows = []
+    for item in df.to_dict("records"):
+        e = ema.update(item["close"])
+        rows.append(
+            [
+                e,
+                atr.update(item["high"], item["low"], item["close"]),
+                rmax.update(item["high"]),
+                rmin.update(item["low"]),
+                *rstat.update(item["close"]),
+                cross.update(fast_ema.update(item["close"]), e),
+            ]
+        )
+    actual = np.array(rows)
+
+    expected = np.column_stack(
+        [
+            ind.ema(df.close, 20),
+            ind.atr(df.high, df.low, df.close, 14),
+            ind.rolling_max(df.high, 30),
+            ind.rolling_min(df.low, 30),
+            *ind.rolling_mean_std(df.close, 30),
+            ind.crossover(ind.ema(df.close, 5), ind.ema(df.close, 20)),
+        ]
+    )
+
+    np.testing.assert_array_equal(actual, expected)
+    assert (np.abs(expected[:, -1]) == 1).sum() > 0
+
+
+def test_batch1():
+    # pandasの計算と（誤差の範囲で）一致する
+    df = _read_test_df()
+
+    np.testing.assert_allclose(
+        ind.ema(df.close, 20), df.close.ewm(span=20, adjust=False).mean()
+    )
+    np.testing.assert_array_equal(
+        ind.rolling_max(df.high, 30), df.high.rolling(30).max()
+    )
+    np.testing.assert_array_equal(ind.rolling_min(df.low, 30), df.low.rolling(30).min())
+
+    mean, std = ind.rolling_mean_std(df.close, 30)
+    np.testing.assert_allclose(mean, df.close.rolling(30).mean(), rtol=1e-10)
+    np.testing.assert_allclose(std, df.close.rolling(30).std(), rtol=1e-6)
+
+    # ATRはWilderの平滑化（初期値はTRの単純平均）
+    tr = pd.concat(
+        [
+            df.high - df.low,
+            (df.high - df.close.shift()).abs(),
+            (df.low - df.close.shift()).abs(),
+        ],
+        axis=1,
+    ).max(axis=1, skipna=False)
+    expected = np.full(len(df), np.nan)
+    expected[14] = tr.iloc[1:15].mean()
+    for i in range(15, len(df)):
+        expected[i] = (expected[i - 1] * 13 + tr.iloc[i]) / 14
+    np.testing.assert_allclose(ind.atr(df.high, df.low, df.close, 14), expected)